@@ -3,13 +3,21 @@ import numpy as np
 from IPython.display import Image, display
 from dateutil.parser import parse
 import matplotlib.animation as animation
-from .workflow import Jet
-from .workflow import get_subject_image, get_box_edges
-from shapely.geometry import Polygon
+from .workflow import JetTable
+from .workflow import get_subject_image, get_point_distance, get_point_distance_matrix, get_worker_pool
+from .geometry import get_box_edges_batch, get_box_iou, get_overlapping_pairs
 import json
+import gzip
+import time
 import tqdm
+from scipy.sparse import csr_matrix
+from astropy.table import Table
 from .meta_file_handler import MetaFile
 
+# attributes of a JetCluster which are calculated from its jets (see Find_export_jetclusters.ipynb)
+CLUSTER_STATS = ['Bx', 'std_Bx', 'By', 'std_By', 'Lat', 'Lon', 'Max_Height', 'std_maxH', 'Height', 'std_H',
+                 'Width', 'std_W', 'Duration', 'Velocity', 'sigma', 'solar_cluster_values']
+
 
 class NpEncoder(json.JSONEncoder):
     def default(self, obj):
@@ -22,94 +30,184 @@ class NpEncoder(json.JSONEncoder):
         return super(NpEncoder, self).default(obj)
 
 
-def json_export_list(clusters, output):
+def get_cluster_json(cluster, compact=False):
     '''
-        export the list of JetCluster objects to the output.json file.
+        Get the dictionary with the data of a JetCluster object that is saved in the json file.
         Inputs
             ------
-            clusters : list
-                list with JetCluster objects to be exported
-            output : str
-                name of the exported json file
+            cluster : `JetCluster`
+                the cluster to be exported
+            compact : bool
+                If True, the jets are stored as columns (see `get_jet_columns`)
+        Outputs
+            ------
+            ci : dict
+                the cluster data
     '''
+    ci = {}
+
+    ci['id'] = cluster.ID
+    ci['SOL'] = cluster.SOL
+    ci['obs_time'] = str(cluster.obs_time)
+    ci['duration'] = cluster.Duration
+
+    ci['lat'] = cluster.Lat
+    ci['lon'] = cluster.Lon
+
+    ci['Bx'] = {'mean': cluster.Bx, 'std': cluster.std_Bx}
+    ci['By'] = {'mean': cluster.By, 'std': cluster.std_By}
+
+    ci['max_height'] = {'mean': cluster.Max_Height,
+                        'std_upper': cluster.std_maxH[0],
+                        'std_lower': cluster.std_maxH[1]}
+
+    ci['width'] = {'mean': cluster.Width, 'std': cluster.std_W}
+    ci['height'] = {'mean': cluster.Height, 'std': cluster.std_H}
+
+    ci['velocity'] = cluster.Velocity
+
+    ci['sigma'] = cluster.sigma
+
+    if hasattr(cluster, 'flag'):
+        ci['flag'] = cluster.flag
+
+    ci['jets'] = []
+    for jet in cluster.jets:
+        ji = {}
+
+        ji['subject'] = jet.subject
+        ji['sigma'] = jet.sigma
+        ji['time'] = str(jet.time)
+
+        # these are in solar coordinates
+        ji['solar_H'] = jet.solar_H
+        ji['solar_H_sig'] = {
+            'upper': jet.solar_H_sig[0], 'lower': jet.solar_H_sig[1]}
+        ji['solar_W'] = jet.solar_W
+        ji['solar_start'] = {
+            'x': jet.solar_start[0], 'y': jet.solar_start[1]}
+        ji['solar_end'] = {'x': jet.solar_end[0], 'y': jet.solar_end[1]}
+
+        if hasattr(jet, 'solar_cluster_values'):
+            ji['solar_cluster_values'] = {'x': jet.solar_cluster_values[0],
+                                          'y': jet.solar_cluster_values[1],
+                                          'w': jet.solar_cluster_values[2],
+                                          'h': jet.solar_cluster_values[3],
+                                          'a': jet.solar_cluster_values[4]}
+
+        # these are in the frame of the image not in solar coords
+        ji['start'] = {'x': jet.start[0], 'y': jet.start[1]}
+        ji['end'] = {'x': jet.end[0], 'y': jet.end[1]}
+
+        ji['cluster_values'] = {'x': jet.cluster_values[0],
+                                'y': jet.cluster_values[1],
+                                'w': jet.cluster_values[2],
+                                'h': jet.cluster_values[3],
+                                'a': jet.cluster_values[4]}
 
-    outdata = []
-    for cluster in clusters:
-        ci = {}
+        ci['jets'].append(ji)
 
-        ci['id'] = cluster.ID
-        ci['SOL'] = cluster.SOL
-        ci['obs_time'] = str(cluster.obs_time)
-        ci['duration'] = cluster.Duration
+    if compact:
+        ci['jet_keys'], ci['jet_columns'] = get_jet_columns(ci.pop('jets'))
 
-        ci['lat'] = cluster.Lat
-        ci['lon'] = cluster.Lon
+    return ci
 
-        ci['Bx'] = {'mean': cluster.Bx, 'std': cluster.std_Bx}
-        ci['By'] = {'mean': cluster.By, 'std': cluster.std_By}
 
-        ci['max_height'] = {'mean': cluster.Max_Height,
-                            'std_upper': cluster.std_maxH[0],
-                            'std_lower': cluster.std_maxH[1]}
+def get_jet_columns(jets):
+    '''
+        Store the jet dictionaries of a cluster as columns, so that the keys are
+        not repeated for each jet. Nested dictionaries (e.g., start) are stored as lists
+        Inputs
+            ------
+            jets : list
+                list of jet dictionaries (see `get_cluster_json`)
+        Outputs
+            ------
+            jet_keys : dict
+                the keys of the nested dictionaries for each column
+            jet_columns : dict
+                list of values for each column (None for jets that do not have this value)
+    '''
+    names = []
+    for ji in jets:
+        names.extend([name for name in ji if name not in names])
 
-        ci['width'] = {'mean': cluster.Width, 'std': cluster.std_W}
-        ci['height'] = {'mean': cluster.Height, 'std': cluster.std_H}
+    jet_keys = {}
+    jet_columns = {}
+    for name in names:
+        values = [ji.get(name) for ji in jets]
 
-        ci['velocity'] = cluster.Velocity
+        nested = [value for value in values if isinstance(value, dict)]
+        if len(nested) > 0:
+            jet_keys[name] = list(nested[0].keys())
+            values = [[value[key] for key in jet_keys[name]] if value is not None else None
+                      for value in values]
 
-        ci['sigma'] = cluster.sigma
+        jet_columns[name] = values
 
-        if hasattr(cluster, 'flag'):
-            ci['flag'] = cluster.flag
+    return jet_keys, jet_columns
 
-        ci['jets'] = []
-        for jet in cluster.jets:
-            ji = {}
 
-            ji['subject'] = jet.subject
-            ji['sigma'] = jet.sigma
-            ji['time'] = str(jet.time)
+def get_jet_rows(jet_keys, jet_columns):
+    '''
+        Convert the jet columns of a compact cluster back to a list of jet dictionaries
+        (inverse of `get_jet_columns`)
+    '''
+    njets = len(next(iter(jet_columns.values()), []))
 
-            # these are in solar coordinates
-            ji['solar_H'] = jet.solar_H
-            ji['solar_H_sig'] = {
-                'upper': jet.solar_H_sig[0], 'lower': jet.solar_H_sig[1]}
-            ji['solar_W'] = jet.solar_W
-            ji['solar_start'] = {
-                'x': jet.solar_start[0], 'y': jet.solar_start[1]}
-            ji['solar_end'] = {'x': jet.solar_end[0], 'y': jet.solar_end[1]}
+    jets = [{} for _ in range(njets)]
+    for name, values in jet_columns.items():
+        for ji, value in zip(jets, values):
+            if value is None:
+                continue
 
-            if hasattr(jet, 'solar_cluster_values'):
-                ji['solar_cluster_values'] = {'x': jet.solar_cluster_values[0],
-                                              'y': jet.solar_cluster_values[1],
-                                              'w': jet.solar_cluster_values[2],
-                                              'h': jet.solar_cluster_values[3],
-                                              'a': jet.solar_cluster_values[4]}
+            if name in jet_keys:
+                value = dict(zip(jet_keys[name], value))
 
-            # these are in the frame of the image not in solar coords
-            ji['start'] = {'x': jet.start[0], 'y': jet.start[1]}
-            ji['end'] = {'x': jet.end[0], 'y': jet.end[1]}
+            ji[name] = value
 
-            ji['cluster_values'] = {'x': jet.cluster_values[0],
-                                    'y': jet.cluster_values[1],
-                                    'w': jet.cluster_values[2],
-                                    'h': jet.cluster_values[3],
-                                    'a': jet.cluster_values[4]}
+    return jets
 
-            ci['jets'].append(ji)
-        outdata.append(ci)
 
-    with open(f"{str(output)}.json", "w") as outfile:
-        json.dump(outdata, outfile, cls=NpEncoder)
+def json_export_list(clusters, output, compact=False, compress=False):
+    '''
+        export the list of JetCluster objects to the output.json file. The clusters are
+        written one at a time, so `clusters` can also be a generator (e.g., yielding the
+        clusters of each SOL event as they are found).
+        Inputs
+            ------
+            clusters : list
+                list with JetCluster objects to be exported
+            output : str
+                name of the exported json file
+            compact : bool
+                If True, the jets of each cluster are stored as columns instead of
+                one dictionary per jet (see `get_jet_columns`)
+            compress : bool
+                If True, the file is compressed with gzip and saved to output.json.gz
+    '''
+    filename = f"{str(output)}.json.gz" if compress else f"{str(output)}.json"
+    separators = (',', ':') if compact else (', ', ': ')
+
+    nclusters = 0
+    with (gzip.open(filename, "wt") if compress else open(filename, "w")) as outfile:
+        outfile.write("[")
+        for cluster in clusters:
+            if nclusters > 0:
+                outfile.write(separators[0])
+            json.dump(get_cluster_json(cluster, compact=compact), outfile, cls=NpEncoder, separators=separators)
+            nclusters += 1
+        outfile.write("]")
 
-    print(f'The {len(clusters)} JetCluster objects are exported to {output}.json.')
+    print(f'The {nclusters} JetCluster objects are exported to {filename}.')
 
     return
 
 
 def json_import_list(input_file):
     '''
-        import a list of JetCluster objects from the input_file file.
+        import a list of JetCluster objects from the input_file file. The file
+        can be compressed with gzip and/or in the compact format (see `json_export_list`).
         Inputs
             ------
             input_file : string
@@ -119,48 +217,60 @@ def json_import_list(input_file):
             clusters : list
                 list of JetCluster objects
     '''
-    with open(input_file, 'r') as file:
+    # check for the gzip header
+    with open(input_file, 'rb') as file:
+        compressed = file.read(2) == b'\x1f\x8b'
+
+    with (gzip.open(input_file, 'rt') if compressed else open(input_file, 'r')) as file:
         lists = json.load(file)
 
     clusters = []
 
     for k in range(len(lists)):
         json_obj = lists[k]
-        jets_subjson = json_obj['jets']
-
-        jets_list = []
-
-        for J in jets_subjson:
-            subject = J['subject']
-            best_start = np.array([J['start'][i] for i in ['x', 'y']])
-            best_end = np.array([J['end'][i] for i in ['x', 'y']])
-            jet_params = np.array([J['cluster_values'][i]
-                                  for i in ['x', 'y', 'w', 'h', 'a']])
-            jeti = Polygon(get_box_edges(*jet_params))
-            jet_obj = Jet(subject, best_start, best_end, jeti, jet_params)
-            jet_obj.time = np.datetime64(J['time'])
-            jet_obj.sigma = J['sigma']
-
-            if 'solar_cluster_values' in J:
-                jet_obj.solar_cluster_values = np.array([J['solar_cluster_values'][i]
-                                  for i in ['x', 'y', 'w', 'h', 'a']])
-
-            jet_obj.solar_H = J['solar_H']
-            jet_obj.solar_H_sig = np.array(
-                [J['solar_H_sig'][i] for i in ['upper', 'lower']])
-            jet_obj.solar_W = J['solar_W']
-            jet_obj.solar_start = np.array(
-                [J['solar_start'][i] for i in ['x', 'y']])
-            jet_obj.solar_end = np.array(
-                [J['solar_end'][i] for i in ['x', 'y']])
-            jet_obj.solar_cluster_values_x_y = np.array(
-                [J['solar_cluster_values_x_y'][i] for i in ['x', 'y']])
-            
-            jets_list.append(jet_obj)
-
-        jets_list = np.asarray(jets_list)
-
-        cluster_obj = JetCluster(jets_list)
+
+        # the jets in compact files are stored as columns
+        if 'jet_columns' in json_obj:
+            jets_subjson = get_jet_rows(json_obj['jet_keys'], json_obj['jet_columns'])
+        else:
+            jets_subjson = json_obj['jets']
+
+        # get the box corners for all the jets in this cluster
+        cluster_params = np.array([[J['cluster_values'][i] for i in ['x', 'y', 'w', 'h', 'a']]
+                                   for J in jets_subjson]).reshape((-1, 5))
+        cluster_edges = get_box_edges_batch(*cluster_params.T)
+
+        cluster_starts = np.array([[J['start'][i] for i in ['x', 'y']]
+                                   for J in jets_subjson]).reshape((-1, 2))
+        cluster_ends = np.array([[J['end'][i] for i in ['x', 'y']]
+                                 for J in jets_subjson]).reshape((-1, 2))
+
+        # store the jets in this cluster in a table
+        # (the rotation of each jet is calculated at once)
+        table = JetTable([J['subject'] for J in jets_subjson], cluster_starts, cluster_ends,
+                         cluster_edges, cluster_params)
+        table.set_column('time', [np.datetime64(J['time']) for J in jets_subjson])
+        table.set_column('sigma', [J['sigma'] for J in jets_subjson])
+
+        # the solar cluster values are not available for all the jets
+        has_solar_cluster_values = np.asarray(['solar_cluster_values' in J for J in jets_subjson], dtype=bool)
+        table.set_column('solar_cluster_values',
+                         [np.array([J['solar_cluster_values'][i] for i in ['x', 'y', 'w', 'h', 'a']])
+                          if 'solar_cluster_values' in J else None for J in jets_subjson],
+                         mask=has_solar_cluster_values)
+
+        table.set_column('solar_H', [J['solar_H'] for J in jets_subjson])
+        table.set_column('solar_H_sig', [np.array([J['solar_H_sig'][i] for i in ['upper', 'lower']])
+                                         for J in jets_subjson])
+        table.set_column('solar_W', [J['solar_W'] for J in jets_subjson])
+        table.set_column('solar_start', [np.array([J['solar_start'][i] for i in ['x', 'y']])
+                                         for J in jets_subjson])
+        table.set_column('solar_end', [np.array([J['solar_end'][i] for i in ['x', 'y']])
+                                       for J in jets_subjson])
+        table.set_column('solar_cluster_values_x_y', [np.array([J['solar_cluster_values_x_y'][i] for i in ['x', 'y']])
+                                                      for J in jets_subjson])
+
+        cluster_obj = JetCluster(table)
         cluster_obj.ID = json_obj['id']
         cluster_obj.SOL = json_obj['SOL']
         cluster_obj.Duration = json_obj['duration']
@@ -207,6 +317,668 @@ def json_import_list(input_file):
     return clusters
 
 
+def get_start_confidences(jets):
+    '''
+        Get the spread of the start point extracts for a list of jets, which is used
+        to normalize the point metric (see `get_jet_metrics`)
+
+        Inputs
+        ------
+            jets : list
+                List of `Jet` objects
+
+        Outputs
+        -------
+            start_confidences : list
+                distance between the start point extracts and the start of each jet
+    '''
+    start_confidences = []
+    for jet in jets:
+        start_confidences.extend(np.linalg.norm(
+            jet.get_extract_starts() - jet.start, axis=0))
+
+    return start_confidences
+
+
+def get_jet_metrics(starts, corners, times, subjects, start_confidences, backend='numpy'):
+    '''
+        Calculate the distance metrics between all pairs of jets in an event.
+        For each metric, element [k, j] is the distance between jet j and jet k.
+        The diagonal is zero, and pairs of jets from the same subject are NaN
+
+        Inputs
+        ------
+            starts : numpy.ndarray
+                (N, 2) base start points of the jets
+            corners : numpy.ndarray
+                (N, 4, 2) corners of the jet boxes
+            times : numpy.ndarray
+                observation time (datetime64) of each jet
+            subjects : numpy.ndarray
+                subject ID of each jet
+            start_confidences : list
+                spread of the start point extracts. The metric for jets j and k is normalized
+                by the mean of start_confidences[j] and start_confidences[k]
+            backend : str
+                geometry backend used to calculate the box IoUs (see `geometry.GEOMETRY_BACKENDS`)
+
+        Outputs
+        -------
+            point_metric : numpy.ndarray
+                distance between the start points, normalized by the start confidence
+            box_metric : numpy.ndarray
+                1 - IoU of the jet boxes
+            time_metric : numpy.ndarray
+                time difference between the jets in units of frames (each frame is 5 min 12 s)
+    '''
+    starts = np.asarray(starts, dtype=float).reshape((-1, 2))
+    subjects = np.asarray(subjects)
+    njets = len(starts)
+    start_confidences = np.asarray(start_confidences, dtype=float)[:njets]
+
+    if njets == 0:
+        return np.zeros((0, 0)), np.zeros((0, 0)), np.zeros((0, 0))
+
+    # distance between the start points, normalized by the mean confidence
+    point_metric = get_point_distance_matrix(starts[:, 0], starts[:, 1], starts[:, 0], starts[:, 1]) / \
+        ((start_confidences[np.newaxis, :] + start_confidences[:, np.newaxis]) / 2.)
+
+    # IoU between all the jet boxes. only boxes whose envelopes overlap
+    # can have a non-zero IoU, so use a spatial index to find the candidate pairs
+    corners = np.asarray(corners, dtype=float).reshape((-1, 4, 2))
+    rows, cols = get_overlapping_pairs(corners, corners)
+    box_ious = np.zeros((njets, njets))
+    box_ious[rows, cols] = get_box_iou(corners[rows], corners[cols], backend=backend)
+
+    # the matrix is transposed so that [k, j] is 1 - IoU(j, k)
+    box_metric = 1. - box_ious.T
+
+    # we will limit to 2 frames (each frame is 5 min)
+    dt = (times[np.newaxis, :] - times[:, np.newaxis]).astype('timedelta64[s]').astype(float)
+    time_metric = np.abs(dt) / (5 * 60 + 12)
+
+    # jets in the same subject cannot be part of the same cluster
+    same_subject = subjects[np.newaxis, :] == subjects[:, np.newaxis]
+    for metric in [point_metric, box_metric, time_metric]:
+        metric[same_subject] = np.nan
+        np.fill_diagonal(metric, 0)
+
+    return point_metric, box_metric, time_metric
+
+
+def get_point_scale(starts, subjects, start_confidences, blocksize=1024):
+    '''
+        Get the normalization of the point metric: the 90th percentile of the (finite and non-zero)
+        point metric between the jets from different subjects. This is the same value as the percentile
+        of the full `point_metric` from `get_jet_metrics`, but the pairs are evaluated in blocks of rows,
+        so that the (N, N) matrix is never stored. The values are counted in fine bins (using the bits
+        of the floating point values, which are ordered for positive numbers), and the values in the
+        bins around the percentile (estimated from a sample of the rows) are kept to find the exact value
+
+        Inputs
+        ------
+            starts : numpy.ndarray
+                (N, 2) base start points of the jets
+            subjects : numpy.ndarray
+                subject ID of each jet
+            start_confidences : list
+                spread of the start point extracts (see `get_jet_metrics`)
+            blocksize : int
+                number of rows of the metric evaluated at once
+
+        Outputs
+        -------
+            point_scale : float
+                the 90th percentile of the point metric (1 if there are no pairs)
+    '''
+    starts = np.asarray(starts, dtype=float).reshape((-1, 2))
+    subjects = np.asarray(subjects)
+    njets = len(starts)
+    start_confidences = np.asarray(start_confidences, dtype=float)[:njets]
+
+    def get_values(rows, cols, upper):
+        point_metric = get_point_distance_matrix(starts[rows, 0], starts[rows, 1], starts[cols, 0], starts[cols, 1]) / \
+            ((start_confidences[cols][np.newaxis, :] + start_confidences[rows][:, np.newaxis]) / 2.)
+
+        valid = (subjects[cols][np.newaxis, :] != subjects[rows][:, np.newaxis]) & \
+            np.isfinite(point_metric) & (point_metric > 0)
+
+        if upper:
+            valid &= cols[np.newaxis, :] > rows[:, np.newaxis]
+
+        return point_metric[valid]
+
+    # the bins are given by the highest bits (exponent and the first bits of the mantissa)
+    shift = 44
+
+    def get_bins(values):
+        return values.view(np.int64) >> shift
+
+    # estimate the bins around the percentile from a sample of the rows
+    sample = np.sort(get_bins(get_values(np.unique(np.linspace(0, njets - 1, min(blocksize, njets)).astype(int)),
+                                         np.arange(njets), False)))
+    if len(sample) == 0:
+        return 1.
+    band = sample[[int(0.88 * (len(sample) - 1)), int(np.ceil(0.92 * (len(sample) - 1)))]]
+
+    # the metric is symmetric, so only use the pairs (k, j) with j > k. count the
+    # values in each bin and keep the values in the band
+    counts = np.zeros(1 << (64 - shift - 1), dtype=np.int64)
+    band_values = []
+    for start in range(0, njets, blocksize):
+        values = get_values(np.arange(start, min(start + blocksize, njets)), np.arange(start, njets), True)
+        bins = get_bins(values)
+        counts += np.bincount(bins, minlength=len(counts))
+        band_values.append(values[(bins >= band[0]) & (bins <= band[1])])
+    band_values = np.concatenate(band_values)
+
+    # position of the percentile in the sorted values of the full matrix, which has each
+    # value twice (this follows the linear interpolation of `numpy.percentile`)
+    npairs = counts.sum()
+    virtual_index = (2 * npairs - 1) * np.true_divide(90, 100)
+    lower = np.floor(virtual_index)
+    gamma = virtual_index - lower
+    ranks = np.asarray([lower, min(lower + 1, 2 * npairs - 1)], dtype=int) // 2
+
+    # find the bins with these ranks
+    cumulative = np.cumsum(counts)
+    target = np.searchsorted(cumulative, ranks, side='right')
+
+    if (target[0] < band[0]) or (target[1] > band[1]):
+        # the estimate was wrong, so go through the pairs again
+        band_values = []
+        for start in range(0, njets, blocksize):
+            values = get_values(np.arange(start, min(start + blocksize, njets)), np.arange(start, njets), True)
+            bins = get_bins(values)
+            band_values.append(values[(bins >= target[0]) & (bins <= target[1])])
+        band_values = np.concatenate(band_values)
+
+    bins = get_bins(band_values)
+    values = np.sort(band_values[(bins >= target[0]) & (bins <= target[1])])
+    below, above = values[ranks - (cumulative[target[0]] - counts[target[0]])]
+
+    difference = above - below
+    if gamma >= 0.5:
+        return above - difference * (1 - gamma)
+
+    return below + difference * gamma
+
+
+def get_time_interval(times, j, k):
+    '''
+        Time difference between jets j and k in units of frames (same as the `time_metric`
+        from `get_jet_metrics`)
+    '''
+    return np.abs((times[j] - times[k]).astype('timedelta64[s]').astype(float)) / (5 * 60 + 12)
+
+
+def select_cluster_jets(members, dists, subjects, get_interval, time_eps):
+    '''
+        Choose the jets that form a cluster from the unassigned jets within `eps` of the
+        first jet of the cluster: only the closest jet from each subject is kept, and jets
+        that are more than `time_eps` frames away from the earlier jets in the cluster are removed
+
+        Inputs
+        ------
+            members : numpy.ndarray
+                index of the candidate jets (in time order). The first one is the first jet of the cluster
+            dists : numpy.ndarray
+                distance between the first jet of the cluster and each candidate
+            subjects : numpy.ndarray
+                subject ID of each jet
+            get_interval : callable
+                function giving the time difference (in frames) between the jets j and k,
+                i.e., `get_interval(j, k)`
+            time_eps : float
+                time parameter in which the jets should lie
+
+        Outputs
+        -------
+            members : numpy.ndarray
+                index of the jets in the cluster
+    '''
+    # make sure that all the jets belong to different subjects
+    # two jets in the same subject should be treated differently
+    member_subs = subjects[members]
+    if len(np.unique(member_subs)) != len(members):
+        # in this case, there are duplicates. we will choose the
+        # best (lowest distance, then earliest) jet from each subject
+        order = np.lexsort((members, dists, member_subs))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = member_subs[order[1:]] != member_subs[order[:-1]]
+        members = np.sort(members[order[first]])
+
+    # next make sure that there is a reachability in time
+    # jets should be connected to each other to within 1-2 frames.
+    # the jets are in time order, so the smallest interval between a jet and the
+    # earlier jets in the cluster is the one to the latest jet kept before it
+    # (`latest` is the last kept jet and `previous` the last kept jet before the
+    # observation time of `latest`)
+    keep = np.ones(len(members), dtype=bool)
+    latest = members[0]
+    previous = None
+    for j in range(1, len(members)):
+        indi = members[j]
+
+        if get_interval(indi, latest) > 0.:
+            interval = get_interval(indi, latest)
+        elif previous is not None:
+            interval = get_interval(indi, previous)
+        else:
+            # no earlier jet in the cluster, so
+            # assign this to a different cluster
+            keep[j] = False
+            continue
+
+        # remove this if it more than eps frames away
+        if interval > time_eps:
+            keep[j] = False
+            continue
+
+        if get_interval(indi, latest) > 0.:
+            previous = latest
+        latest = indi
+
+    return members[keep]
+
+
+def assign_jet_labels(distance_metric, time_metric, subjects, eps, time_eps):
+    '''
+        Assign the jets to clusters. Starting from the earliest jet that is not in a cluster,
+        all the unassigned jets within a distance `eps` form a cluster, keeping the closest jet
+        from each subject and removing jets that are more than `time_eps` frames away from the
+        earlier jets in the cluster (see `select_cluster_jets`)
+
+        Inputs
+        ------
+            distance_metric : numpy.ndarray
+                (N, N) distance between the jets
+            time_metric : numpy.ndarray
+                (N, N) time difference between the jets (in frames)
+            subjects : numpy.ndarray
+                subject ID of each jet
+            eps : float
+                space parameter in which the jets should lie
+            time_eps : float
+                time parameter in which the jets should lie
+
+        Outputs
+        -------
+            labels : numpy.ndarray
+                cluster label of each jet (-1 for jets that are not in a cluster)
+    '''
+    njets = len(distance_metric)
+    labels = -1. * np.ones(njets)
+    subjects = np.asarray(subjects)
+
+    # jets that are not yet in a cluster
+    unassigned = np.ones(njets, dtype=bool)
+
+    # list of the jets within a distance eps of each jet
+    # (neighbors[offsets[i]:offsets[i + 1]] for jet i, in increasing order)
+    rows, neighbors = np.nonzero(distance_metric < eps)
+    offsets = np.searchsorted(rows, np.arange(njets + 1))
+
+    nlabels = 0
+    for ind in range(njets):
+        if not unassigned[ind]:
+            continue
+
+        # find all the jets that fall within a distance
+        # eps for this jet and those that are not
+        # already clustered into a jet
+        members = neighbors[offsets[ind]:offsets[ind + 1]]
+        members = members[unassigned[members]]
+
+        # this can only happen if the jet is not within eps of itself (eps <= 0)
+        if len(members) == 0:
+            continue
+
+        members = select_cluster_jets(members, distance_metric[ind, members], subjects,
+                                      lambda j, k: time_metric[j, k], time_eps)
+
+        # assign a new value to these
+        labels[members] = nlabels
+        unassigned[members] = False
+        nlabels += 1
+
+    return labels
+
+
+def get_jet_metrics_sparse(starts, corners, times, subjects, start_confidences, time_window, backend='numpy'):
+    '''
+        Sparse version of `get_jet_metrics`. Only the pairs of jets that are within `time_window`
+        frames of each other (and from different subjects) are evaluated, so that the memory and
+        time scale with the number of jets in each time window rather than the square of
+        the total number of jets. The jets must be sorted by time
+
+        Inputs
+        ------
+            starts : numpy.ndarray
+                (N, 2) base start points of the jets
+            corners : numpy.ndarray
+                (N, 4, 2) corners of the jet boxes
+            times : numpy.ndarray
+                observation time (datetime64) of each jet, in increasing order
+            subjects : numpy.ndarray
+                subject ID of each jet
+            start_confidences : list
+                spread of the start point extracts (see `get_jet_metrics`)
+            time_window : float
+                maximum time difference (in frames) between the pairs of jets to evaluate
+            backend : str
+                geometry backend used to calculate the box IoUs (see `geometry.GEOMETRY_BACKENDS`)
+
+        Outputs
+        -------
+            point_metric, box_metric, time_metric : `scipy.sparse.csr_matrix`
+                the metrics for the evaluated pairs (see `get_jet_metrics`). All three matrices
+                have the same sparsity pattern, including explicit zeros on the diagonal. Pairs
+                that are not stored were not evaluated (i.e., they are not neighbors)
+    '''
+    starts = np.asarray(starts, dtype=float).reshape((-1, 2))
+    corners = np.asarray(corners, dtype=float).reshape((-1, 4, 2))
+    subjects = np.asarray(subjects)
+    njets = len(starts)
+    start_confidences = np.asarray(start_confidences, dtype=float)[:njets]
+
+    # find the range of jets within the time window of each jet
+    frames = (times - times[0]).astype('timedelta64[s]').astype(float) / (5 * 60 + 12) if njets > 0 else np.zeros(0)
+    lower = np.searchsorted(frames, frames - time_window, side='left')
+    upper = np.searchsorted(frames, frames + time_window, side='right')
+
+    # and create the list of pairs (row k, column j)
+    counts = upper - lower
+    rows = np.repeat(np.arange(njets), counts)
+    cols = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts - lower, counts)
+
+    # jets in the same subject cannot be part of the same cluster
+    keep = (subjects[rows] != subjects[cols]) | (rows == cols)
+    rows = rows[keep]
+    cols = cols[keep]
+
+    point_metric = get_point_distance(starts[cols, 0], starts[cols, 1], starts[rows, 0], starts[rows, 1]) / \
+        ((start_confidences[cols] + start_confidences[rows]) / 2.)
+    box_metric = 1. - get_box_iou(corners[cols], corners[rows], backend=backend)
+    time_metric = np.abs((times[cols] - times[rows]).astype('timedelta64[s]').astype(float)) / (5 * 60 + 12)
+
+    diagonal = rows == cols
+    point_metric[diagonal] = 0
+    box_metric[diagonal] = 0
+    time_metric[diagonal] = 0
+
+    indptr = np.zeros(njets + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=njets), out=indptr[1:])
+
+    return [csr_matrix((metric, cols, indptr), shape=(njets, njets))
+            for metric in [point_metric, box_metric, time_metric]]
+
+
+def get_jet_distances(ind, cols, starts, corners, subjects, start_confidences, point_scale, backend='numpy'):
+    '''
+        Get the distance between a jet and a set of other jets, in the same way as the
+        `distance_metric` of `SOL.get_event_metrics`. This is used by `assign_jet_labels_sparse`
+        for the pairs that are not in the sparse matrix
+
+        Inputs
+        ------
+            ind : int
+                index of the jet
+            cols : numpy.ndarray
+                index of the other jets
+            starts : numpy.ndarray
+                (N, 2) base start points of the jets
+            corners : numpy.ndarray
+                (N, 4, 2) corners of the jet boxes
+            subjects : numpy.ndarray
+                subject ID of each jet
+            start_confidences : numpy.ndarray
+                spread of the start point extracts (see `get_jet_metrics`)
+            point_scale : float
+                normalization of the point metric (see `get_point_scale`)
+            backend : str
+                geometry backend used to calculate the box IoUs (see `geometry.GEOMETRY_BACKENDS`)
+
+        Outputs
+        -------
+            dists : numpy.ndarray
+                distance between jet `ind` and each jet in `cols` (NaN for jets in the same subject)
+    '''
+    rows = np.full(len(cols), ind)
+
+    point_metric = get_point_distance(starts[cols, 0], starts[cols, 1], starts[rows, 0], starts[rows, 1]) / \
+        ((start_confidences[cols] + start_confidences[rows]) / 2.)
+    box_metric = 1. - get_box_iou(corners[cols], corners[rows], backend=backend)
+
+    same_subject = subjects[cols] == subjects[ind]
+    point_metric[same_subject] = np.nan
+    box_metric[same_subject] = np.nan
+    point_metric[cols == ind] = 0
+    box_metric[cols == ind] = 0
+
+    dists = point_metric / point_scale + 2. * box_metric
+    dists[~np.isfinite(dists)] = np.nan
+
+    return dists
+
+
+def assign_jet_labels_sparse(distance_metric, times, subjects, eps, time_eps, starts, corners, start_confidences,
+                             point_scale, backend='numpy'):
+    '''
+        Assign the jets to clusters using a sparse distance matrix (see `get_jet_metrics_sparse`).
+        This gives the same clusters as `assign_jet_labels`: a cluster can link jets across more than the
+        time window of the sparse matrix (through the earlier jets in the cluster), so the candidates
+        for each cluster are extended in time from its latest jet, and the distances to the first jet
+        that are not in the sparse matrix are calculated when needed (see `get_jet_distances`)
+
+        Inputs
+        ------
+            distance_metric : `scipy.sparse.csr_matrix`
+                distance between the neighboring jets
+            times : numpy.ndarray
+                observation time (datetime64) of each jet, in increasing order
+            subjects : numpy.ndarray
+                subject ID of each jet
+            eps : float
+                space parameter in which the jets should lie
+            time_eps : float
+                time parameter in which the jets should lie
+            starts : numpy.ndarray
+                (N, 2) base start points of the jets
+            corners : numpy.ndarray
+                (N, 4, 2) corners of the jet boxes
+            start_confidences : numpy.ndarray
+                spread of the start point extracts (see `get_jet_metrics`)
+            point_scale : float
+                normalization of the point metric (see `get_point_scale`)
+            backend : str
+                geometry backend used to calculate the box IoUs (see `geometry.GEOMETRY_BACKENDS`)
+
+        Outputs
+        -------
+            labels : numpy.ndarray
+                cluster label of each jet (-1 for jets that are not in a cluster)
+    '''
+    njets = distance_metric.shape[0]
+    labels = -1. * np.ones(njets)
+    subjects = np.asarray(subjects)
+    starts = np.asarray(starts, dtype=float).reshape((-1, 2))
+    corners = np.asarray(corners, dtype=float).reshape((-1, 4, 2))
+    start_confidences = np.asarray(start_confidences, dtype=float)[:njets]
+
+    # jets that are not yet in a cluster
+    unassigned = np.ones(njets, dtype=bool)
+
+    frames = (times - times[0]).astype('timedelta64[s]').astype(float) / (5 * 60 + 12) if njets > 0 else np.zeros(0)
+
+    def get_interval(j, k):
+        return get_time_interval(times, j, k)
+
+    nlabels = 0
+    for ind in range(njets):
+        if not unassigned[ind]:
+            continue
+
+        # the neighbors of this jet in the sparse matrix. all the jets
+        # before the end of the row (other than those in the same subject) are neighbors
+        cols = distance_metric.indices[distance_metric.indptr[ind]:distance_metric.indptr[ind + 1]]
+        dists = distance_metric.data[distance_metric.indptr[ind]:distance_metric.indptr[ind + 1]]
+        end = cols.max() + 1
+
+        while True:
+            # find all the jets that fall within a distance
+            # eps for this jet and those that are not
+            # already clustered into a jet
+            within = (dists < eps) & unassigned[cols]
+
+            # this can only happen if the jet is not within eps of itself (eps <= 0)
+            if not np.any(within):
+                members = cols[within]
+                break
+
+            members = select_cluster_jets(cols[within], dists[within], subjects, get_interval, time_eps)
+
+            # the jets up to time_eps frames after the latest jet in the cluster can still
+            # be added to it. if these are not all neighbors, add them and try again
+            # (the small margin makes sure that no jet at exactly time_eps is missed)
+            new_end = np.searchsorted(frames, frames[members[-1]] + time_eps + 1.e-6, side='right')
+            if new_end <= end:
+                break
+
+            new_cols = np.arange(end, new_end)
+            new_cols = new_cols[unassigned[new_cols]]
+
+            cols = np.concatenate([cols, new_cols])
+            dists = np.concatenate([dists, get_jet_distances(ind, new_cols, starts, corners, subjects,
+                                                             start_confidences, point_scale, backend=backend)])
+            end = new_end
+
+        if len(members) == 0:
+            continue
+
+        # assign a new value to these
+        labels[members] = nlabels
+        unassigned[members] = False
+        nlabels += 1
+
+    return labels
+
+
+def get_event_labels(metrics, eps, time_eps):
+    '''
+        Cluster the jets of a SOL event using the pre-computed metrics
+
+        Inputs
+        ------
+            metrics : dict
+                the pair metrics of the jets in the event (see `SOL.get_event_metrics`)
+            eps : float
+                space parameter in which the jets should lie
+            time_eps : float
+                time parameter in which the jets should lie
+
+        Outputs
+        -------
+            labels : numpy.ndarray
+                cluster label of each jet (-1 for jets that are not in a cluster)
+    '''
+    subjects = metrics['table'].subject
+
+    if metrics['sparse']:
+        return assign_jet_labels_sparse(metrics['distance_metric'], metrics['times'], subjects, eps, time_eps,
+                                        metrics['table'].start, metrics['table'].corners,
+                                        metrics['start_confidences'], metrics['point_scale'],
+                                        backend=metrics['backend'])
+
+    return assign_jet_labels(metrics['distance_metric'], metrics['time_metric'], subjects, eps, time_eps)
+
+
+def get_adjusted_rand_index(labels1, labels2):
+    '''
+        Adjusted Rand index between two clusterings of the same jets. This is 1 when
+        the two clusterings are identical and close to 0 for unrelated clusterings.
+        Jets that are not in a cluster (label -1) are treated as a cluster on their own
+
+        Inputs
+        ------
+            labels1 : numpy.ndarray
+                cluster label of each jet for the first clustering
+            labels2 : numpy.ndarray
+                cluster label of each jet for the second clustering
+
+        Outputs
+        -------
+            ari : float
+                the adjusted Rand index
+    '''
+    labels1 = np.asarray(labels1)
+    labels2 = np.asarray(labels2)
+    n = len(labels1)
+
+    # give each unclustered jet its own label
+    unassigned = np.arange(n) + max(labels1.max(initial=0), labels2.max(initial=0)) + 1
+    labels1 = np.where(labels1 < 0, unassigned, labels1)
+    labels2 = np.where(labels2 < 0, unassigned, labels2)
+
+    def npairs(counts):
+        return np.sum(counts * (counts - 1) / 2.)
+
+    # contingency table between the two clusterings
+    _, counts = np.unique(np.stack([labels1, labels2]), axis=1, return_counts=True)
+    _, counts1 = np.unique(labels1, return_counts=True)
+    _, counts2 = np.unique(labels2, return_counts=True)
+
+    index = npairs(counts)
+    pairs1 = npairs(counts1)
+    pairs2 = npairs(counts2)
+
+    expected = pairs1 * pairs2 / max(n * (n - 1) / 2., 1.)
+    maximum = (pairs1 + pairs2) / 2.
+
+    if maximum == expected:
+        # both clusterings are trivial (all singletons or one cluster)
+        return 1.
+
+    return (index - expected) / (maximum - expected)
+
+
+# the metrics used by each process in the pool in `SOL.sweep_parameters`
+_worker_metrics = None
+
+
+def _init_sweep_worker(metrics):
+    global _worker_metrics
+    _worker_metrics = metrics
+
+
+def _sweep_worker(params):
+    eps, time_eps = params
+    return get_event_labels(_worker_metrics, eps, time_eps)
+
+
+# the SOL object used by each process in the pool in `SOL.cluster_all_events`
+_worker_sol = None
+
+
+def _init_sol_worker(sol):
+    global _worker_sol
+    _worker_sol = sol
+
+
+def _cluster_event_worker(args):
+    SOL_event, kwargs = args
+
+    start = time.perf_counter()
+    try:
+        clusters, _, _, _ = _worker_sol.filter_jet_clusters(SOL_event, **kwargs)
+        error = None
+    except Exception as e:
+        clusters = []
+        error = f'{type(e).__name__}: {e}'
+
+    return SOL_event, clusters, error, time.perf_counter() - start
+
+
 class SOL:
     '''
         Single data class to handle all function related to a HEK/SOL_event
@@ -305,10 +1077,7 @@ class SOL:
 
         for subject in subjects:
             # check to make sure that these subjects had classification
-            subject_rows = self.aggregator.points_data[:
-                                                       ][self.aggregator.points_data['subject_id'] == subject]
-            nsubjects = len(subject_rows['data.frame0.T1_tool0_points_x'])
-            if nsubjects > 0:
+            if self.aggregator.has_subject(subject):
                 self.aggregator.plot_frame_info(subject, task='T1')
 
     def get_start_end_time(self, SOL_event):
@@ -360,18 +1129,32 @@ class SOL:
 
         display(fig)
 
-    def filter_jet_clusters(self, SOL_event, eps=1., time_eps=2.):
+    def get_event_metrics(self, SOL_event, workers=1, sparse=False, time_window=2.):
         '''
-        For the inputted SOL event search for jet objects that are within the eps in space and the time_eps in time from eachother.
-        Cluster those together and make JetCluster objects.
+        Find the jets in all the subjects of a SOL event and calculate the pair metrics
+        between them. These do not depend on `eps` and `time_eps`, so they can be reused
+        to cluster the jets with different parameters (see `get_event_labels`)
         Inputs
         ------
             SOL_event : str
                 name of the SOL event used in Zooniverse
-            eps : float
-                space parameter in which the jets should lie
-            time_eps : float
-                time parameter in which the jets should lie
+            workers : int
+                number of processes used to find the jets in each subject
+                (default 1, see `Aggregator.filter_all`)
+            sparse : bool
+                If True, only the pairs of jets within `time_window` frames of each other are
+                compared (see `filter_jet_clusters`)
+            time_window : float
+                time window (in frames) for the sparse mode
+
+        Outputs
+        -------
+            metrics : dict
+                Dictionary with the `JetTable` of all the jets sorted by time (`table`),
+                the observation time of each jet (`times`), the `point_metric`, `box_metric`,
+                `time_metric`, the combined `distance_metric`, whether the metrics are `sparse`,
+                and the data needed to calculate the distances outside of the time window in
+                the sparse mode (`start_confidences`, `point_scale` and the geometry `backend`)
         '''
 
         # first, get a list of subjects for
@@ -379,144 +1162,105 @@ class SOL:
         subjects = self.get_subjects(SOL_event)
         times_all = self.get_obs_time(SOL_event)
 
-        event_jets = []
-        jet_starts = []
+        # find all the jets in each subject
+        subject_tables, failures = self.aggregator.filter_all(subjects, workers=workers, return_table=True)
+
+        if len(failures) > 0:
+            print(f"Could not find jets for {len(failures)} subjects: " +
+                  ", ".join([f"{subject} ({error})" for subject, error in failures.items()]))
+
+        event_tables = []
         times = []
         start_confidences = []
-        # go through the subjects, and find
+        # go through the subjects, and collect
         # the jets in each subject
         for j, subject in enumerate(subjects):
-            try:
-                # find all the jets in this subject
-                jets = self.aggregator.filter_classifications(subject)
-
-                # add it to the list
-                event_jets.extend(jets)
-
-                # and also keep track of the base positions
-                jet_starts.extend([jet.start for jet in jets])
+            if int(subject) not in subject_tables:
+                continue
 
-                start_dist = []
-                for jet in jets:
-                    start_dist.extend(np.linalg.norm(
-                        jet.get_extract_starts() - jet.start, axis=0))
+            table = subject_tables[int(subject)]
+            jets = table.jets
 
-                start_confidences.extend(start_dist)
-                times.extend([times_all[j] for n in range(len(jets))])
+            # add it to the list
+            event_tables.append(table)
 
-            except (ValueError, IndexError):
-                continue
+            start_confidences.extend(get_start_confidences(jets))
+            times.extend([times_all[j] for n in range(len(jets))])
 
         times = np.asarray(times)
         times_sort = np.argsort(times)
         times = times[times_sort]
-        jets = np.asarray(event_jets)[times_sort]
-        jet_starts = np.asarray(jet_starts)[times_sort]
-
-        box_metric = np.zeros((len(jets), len(jets)))
-        time_metric = np.zeros((len(jets), len(jets)))
-        point_metric = np.zeros((len(jets), len(jets)))
-
-        for j, jetj in enumerate(jets):
-            for k, jetk in enumerate(jets):
-                if j == k:
-                    point_metric[k, j] = 0
-                    box_metric[k, j] = 0
-                    time_metric[k, j] = 0
-                elif jetj.subject == jetk.subject:
-                    point_metric[k, j] = np.nan
-                    box_metric[k, j] = np.nan
-                    time_metric[k, j] = np.nan
-                else:
-                    point_dist = np.linalg.norm((jetj.start - jetk.start))
-                    box_ious = jetj.box.intersection(
-                        jetk.box).area / jetj.box.union(jetk.box).area
-                    point_metric[k, j] = point_dist / \
-                        np.mean([start_confidences[j], start_confidences[k]])
-                    box_metric[k, j] = 1. - box_ious
-
-                    # we will limit to 2 frames (each frame is 5 min)
-                    time_metric[k, j] = np.abs((times[j] - times[k]).astype('timedelta64[s]')
-                                               .astype(float)) / (5 * 60 + 12)
-
-        distance_metric = point_metric / np.percentile(point_metric[np.isfinite(point_metric) & (point_metric > 0)], 90) + \
-            2. * box_metric
 
-        distance_metric[~np.isfinite(distance_metric)] = np.nan
+        # combine the jets from all the subjects into one table
+        # and append the time information for each jet
+        event_table = JetTable.concatenate(event_tables).take(times_sort)
+        event_table.set_column('time', times)
 
-        indices = np.arange(len(jets))
-        labels = -1. * np.ones(len(jets))
-        subjects = np.asarray([jet.subject for jet in jets])
+        start_confidences = np.asarray(start_confidences, dtype=float)[:len(times)]
 
-        # print(f"Using eps={eps} and time_eps={time_eps*30} min")
+        if sparse:
+            # only evaluate the pairs of jets that are within the time window
+            point_metric, box_metric, time_metric = get_jet_metrics_sparse(
+                event_table.start, event_table.corners, times, event_table.subject, start_confidences,
+                time_window, backend=self.aggregator.geometry_backend)
 
-        while len(indices) > 0:
-            ind = indices[0]
+            # normalize the point distance by the percentile over all the pairs,
+            # which is calculated without storing the full matrix
+            point_scale = get_point_scale(event_table.start, event_table.subject, start_confidences)
 
-            # find all the jets that fall within a distance
-            # eps for this jet and those that are not
-            # already clustered into a jet
-            mask = (distance_metric[ind, :] < eps) & (labels == -1)
-
-            unique_subs = np.unique(subjects[mask])
-
-            # make sure that all the jets belong to different subjects
-            # two jets in the same subject should be treated differently
-            if len(unique_subs) != sum(mask):
-                # in this case, there are duplicates
-                # we will choose the best subject from each duplicate
-
-                # loop through the unique subs
-                for sub in unique_subs:
-                    # find the indices that correspond to this
-                    # jet in the mask
-                    inds_sub = np.where((subjects == sub) & mask)[0]
-                    # and the corresponding distances
-                    dists = distance_metric[ind, inds_sub]
-
-                    # remove all the other subjects
-                    mask[inds_sub] = False
-
-                    # set the lowest distance index to True
-                    mask[inds_sub[np.argmin(dists)]] = True
-
-            # next make sure that there is a reachability in time
-            # jets should be connected to each other to within 1-2 frames
-            if sum(mask) > 1:  # only do this when there are more than 1 jet
-                rem_inds = np.where(mask)[0]
-                for j, indi in enumerate(rem_inds):
-                    # if this is the first index we don't
-                    # have an idea of past reachability
-                    if j == 0:
-                        continue
-
-                    # get the reachability in time
-                    time_disti = time_metric[indi, mask]
-                    # subset it up to the current jet
-                    # so we get only past reachability
-                    t0 = np.argmin(time_disti)
-                    time_disti = time_disti[:t0]
-
-                    # if the previous index was deleted
-                    # we can end up with empty lists
-                    # ignore these and assign them
-                    # to a different cluster
-                    if len(time_disti) == 0:
-                        mask[indi] = False
-                        continue
-
-                    # find the smallest interval between this jet and any other
-                    # jet. then remove this if it more than eps frames away
-                    if time_disti[time_disti > 0.].min() > time_eps:
-                        mask[indi] = False
-
-            # assign a new value to these
-            labels[mask] = labels.max() + 1
-
-            rem_inds = [np.where(indices == maski)[0][0]
-                        for maski in np.where(mask)[0]]
-
-            indices = np.delete(indices, rem_inds)
+            distance_metric = point_metric.copy()
+            distance_metric.data = point_metric.data / point_scale + 2. * box_metric.data
+
+            distance_metric.data[~np.isfinite(distance_metric.data)] = np.nan
+        else:
+            # calculate the distances between all the jets
+            point_metric, box_metric, time_metric = get_jet_metrics(
+                event_table.start, event_table.corners, times, event_table.subject,
+                start_confidences, backend=self.aggregator.geometry_backend)
+
+            point_scale = np.percentile(point_metric[np.isfinite(point_metric) & (point_metric > 0)], 90)
+
+            distance_metric = point_metric / point_scale + 2. * box_metric
+
+            distance_metric[~np.isfinite(distance_metric)] = np.nan
+
+        return {'table': event_table, 'times': times, 'point_metric': point_metric,
+                'box_metric': box_metric, 'time_metric': time_metric,
+                'distance_metric': distance_metric, 'sparse': sparse,
+                'start_confidences': start_confidences, 'point_scale': point_scale,
+                'backend': self.aggregator.geometry_backend}
+
+    def filter_jet_clusters(self, SOL_event, eps=1., time_eps=2., workers=1, sparse=False, time_window=None):
+        '''
+        For the inputted SOL event search for jet objects that are within the eps in space and the time_eps in time from eachother.
+        Cluster those together and make JetCluster objects.
+        Inputs
+        ------
+            SOL_event : str
+                name of the SOL event used in Zooniverse
+            eps : float
+                space parameter in which the jets should lie
+            time_eps : float
+                time parameter in which the jets should lie
+            workers : int
+                number of processes used to find the jets in each subject
+                (default 1, see `Aggregator.filter_all`)
+            sparse : bool
+                If True, only the pairs of jets within `time_window` frames of each other are
+                stored, and the metrics are returned as `scipy.sparse.csr_matrix` objects (see
+                `get_jet_metrics_sparse`). The clusters are the same as in the dense calculation:
+                the distances for the pairs outside the window are calculated when a cluster
+                extends beyond it (see `assign_jet_labels_sparse`)
+            time_window : float
+                time window (in frames) for the sparse mode (default: `time_eps`). This only
+                changes the number of pairs that are stored, not the clusters
+        '''
+
+        metrics = self.get_event_metrics(SOL_event, workers=workers, sparse=sparse,
+                                         time_window=time_eps if time_window is None else time_window)
+
+        labels = get_event_labels(metrics, eps, time_eps)
+        event_table = metrics['table']
 
         # get the list of jets found
         njets = len(np.unique(labels[labels > -1]))
@@ -527,27 +1271,339 @@ class SOL:
 
         for j in range(njets):
             mask_j = labels == j
-            # subset the list of jets that correspond to this label
-            jets_j = jets[mask_j]
-            times_j = times[mask_j]
+            # subset the table of jets that correspond to this label
+            clusteri = JetCluster(event_table.take(np.where(mask_j)[0]))
+            # keep the normalization of the point metric, so that new jets can be compared to the same scale
+            clusteri.adding_new_attr('point_scale', metrics['point_scale'])
 
-            # for each jet, append the time information
-            for k, jet in enumerate(jets_j):
-                jet.time = times_j[k]
+            jet_clusters.append(clusteri)
 
-            clusteri = JetCluster(jets_j)
+        return jet_clusters, metrics['distance_metric'], metrics['point_metric'], metrics['box_metric']
 
-            jet_clusters.append(clusteri)
+    def update_jet_clusters(self, SOL_event, jet_clusters, subjects=None, eps=1., time_eps=2., workers=1,
+                            time_window=None, point_scale=None):
+        '''
+        Add the jets from newly retired subjects of a SOL event to the clusters found by `filter_jet_clusters`,
+        without clustering the whole event again. Each new jet is attached to the closest existing cluster
+        whose first jet is within `eps` of it, which does not already contain a jet from the same subject
+        and whose latest earlier jet is within `time_eps` frames. The remaining new jets are clustered
+        together as in `filter_jet_clusters`. Only the existing jets within `time_window` of the new jets
+        (and the first jet of their clusters) are compared, and the point metric is normalized with the
+        scale of the whole event, so the result can still differ slightly from clustering the whole event.
+
+        The clusters that got new jets keep the attributes which identify them (e.g. `SOL`, `ID`,
+        `obs_time` and `flag`), but not the statistics calculated from their jets (see `CLUSTER_STATS`),
+        and the new jets do not have the solar coordinates. These need to be calculated again for every
+        cluster flagged in `changed` (including the new clusters), before exporting the clusters.
+        Inputs
+        ------
+            SOL_event : str
+                name of the SOL event used in Zooniverse
+            jet_clusters : list
+                List of `JetCluster` objects already found for this event
+            subjects : list
+                the new subjects (default: all the subjects in the event which are not in `jet_clusters`).
+                Subjects which already have jets in `jet_clusters` are skipped
+            eps : float
+                space parameter in which the jets should lie
+            time_eps : float
+                time parameter in which the jets should lie
+            workers : int
+                number of processes used to find the jets in each subject
+                (default 1, see `Aggregator.filter_all`)
+            time_window : float
+                time window (in frames) around the new jets in which the existing jets are compared
+                (default: `time_eps`)
+            point_scale : float
+                normalization of the point metric for the event (default: the `point_scale` stored on
+                the clusters by `filter_jet_clusters`). This needs to be passed for clusters without it
+                (e.g. from `json_import_list`)
+
+        Outputs
+        -------
+            jet_clusters : list
+                List of `JetCluster` objects, sorted by the time of their first jet. The clusters
+                that did not change are the same objects as in the input
+            changed : numpy.ndarray
+                boolean mask of the clusters in `jet_clusters` that are new or got new jets
+        '''
+        if time_window is None:
+            time_window = time_eps
+
+        event_subjects = np.asarray(self.get_subjects(SOL_event)).astype(int)
+        obs_times = dict(zip(event_subjects, self.get_obs_time(SOL_event)))
+
+        clustered = set([int(subject) for cluster in jet_clusters for subject in cluster.table.subject])
+
+        if subjects is None:
+            subjects = event_subjects
+        subjects = [int(subject) for subject in subjects if int(subject) not in clustered]
+
+        # find the jets in the new subjects
+        subject_tables, failures = self.aggregator.filter_all(subjects, workers=workers, return_table=True)
+
+        if len(failures) > 0:
+            print(f"Could not find jets for {len(failures)} subjects: " +
+                  ", ".join([f"{subject} ({error})" for subject, error in failures.items()]))
+
+        new_tables = [subject_tables[subject] for subject in subjects if subject in subject_tables]
+
+        if len(new_tables) == 0:
+            return list(jet_clusters), np.zeros(len(jet_clusters), dtype=bool)
+
+        new_table = JetTable.concatenate(new_tables)
+        new_times = np.asarray([obs_times[subject] for subject in new_table.subject])
+        times_sort = np.argsort(new_times)
+        new_times = new_times[times_sort]
+        new_table = new_table.take(times_sort)
+        new_table.set_column('time', new_times)
+        nnew = len(new_times)
+
+        # find the existing clusters with jets within the time window of the new jets
+        # and keep those jets and the first jet of the cluster (which the new jets are compared to)
+        candidates = []
+        nearby_tables = []
+        nnearby = 0
+        for c, cluster in enumerate(jet_clusters):
+            cluster_times = cluster.table.get_column('time')
+            gaps = np.abs((cluster_times[:, np.newaxis] - new_times[np.newaxis, :]).astype('timedelta64[s]')
+                          .astype(float)) / (5 * 60 + 12)
+            nearby = np.where(gaps.min(axis=1) <= time_window)[0]
+
+            if len(nearby) == 0:
+                continue
+
+            # the first jet is at index nnew + nnearby in the combined table
+            candidates.append((c, nnew + nnearby))
+            nearby_tables.append(cluster.table.take(np.union1d([0], nearby)))
+            nnearby += len(nearby_tables[-1].subject)
+
+        # calculate the distances between the new jets and the nearby jets.
+        # the new jets come first, so that their extracts are used for the start confidences
+        local_table = JetTable.concatenate([new_table] + nearby_tables)
+        point_metric, box_metric, time_metric = get_jet_metrics(
+            local_table.start, local_table.corners, local_table.get_column('time'), local_table.subject,
+            get_start_confidences(local_table.jets), backend=self.aggregator.geometry_backend)
+
+        if point_scale is None:
+            if len(jet_clusters) == 0:
+                # there are no other jets in the event, so the scale only comes from the new jets
+                point_scale = get_point_scale(new_table.start, new_table.subject,
+                                              np.asarray(get_start_confidences(new_table.jets))[:nnew])
+            else:
+                scales = [cluster.point_scale for cluster in jet_clusters if hasattr(cluster, 'point_scale')]
+                assert len(scales) > 0, "The clusters do not have the point_scale of the event. Pass it in!"
+                point_scale = scales[0]
+
+        distance_metric = point_metric / point_scale + 2. * box_metric
+        distance_metric[~np.isfinite(distance_metric)] = np.nan
+
+        cluster_subjects = [set(jet_clusters[c].table.subject.astype(int)) for c, _ in candidates]
+        cluster_times = [jet_clusters[c].table.get_column('time') for c, _ in candidates]
+        attached = [[] for _ in candidates]
+        assigned = np.zeros(nnew, dtype=bool)
+
+        # go through the new subjects in time order. the jets in each subject are attached
+        # in order of distance, so that each cluster gets the closest jet from the subject
+        for subject in dict.fromkeys(new_table.subject):
+            inds = np.where(new_table.subject == subject)[0]
+
+            pairs = []
+            for k, (c, seed) in enumerate(candidates):
+                if int(subject) in cluster_subjects[k]:
+                    continue
+
+                for ind in inds:
+                    if distance_metric[seed, ind] < eps:
+                        pairs.append((distance_metric[seed, ind], ind, k))
+
+            for dist, ind, k in sorted(pairs):
+                if assigned[ind] or int(subject) in cluster_subjects[k]:
+                    continue
+
+                # there needs to be an earlier jet in the cluster within time_eps frames
+                earlier = cluster_times[k][cluster_times[k] < new_times[ind]]
+                if len(earlier) == 0:
+                    continue
+
+                interval = (new_times[ind] - earlier.max()).astype('timedelta64[s]').astype(float) / (5 * 60 + 12)
+                if interval > time_eps:
+                    continue
+
+                attached[k].append(ind)
+                assigned[ind] = True
+                cluster_subjects[k].add(int(subject))
+                cluster_times[k] = np.append(cluster_times[k], new_times[ind])
+
+        updated = list(jet_clusters)
+        changed = [False] * len(updated)
+        for k, (c, _) in enumerate(candidates):
+            if len(attached[k]) == 0:
+                continue
+
+            table = JetTable.concatenate([jet_clusters[c].table, new_table.take(attached[k])])
+            updated[c] = JetCluster(table.take(np.argsort(table.get_column('time'), kind='stable')))
+            changed[c] = True
+
+            # carry over the attributes of the cluster, except the statistics of its jets
+            for name, value in vars(jet_clusters[c]).items():
+                if name not in ['table', 'jets'] + CLUSTER_STATS:
+                    updated[c].adding_new_attr(name, value)
+
+        # cluster the rest of the new jets between themselves
+        rest = np.where(~assigned)[0]
+        labels = assign_jet_labels(distance_metric[np.ix_(rest, rest)], time_metric[np.ix_(rest, rest)],
+                                   new_table.subject[rest], eps, time_eps)
+
+        for j in range(len(np.unique(labels[labels > -1]))):
+            updated.append(JetCluster(new_table.take(rest[labels == j])))
+            updated[-1].adding_new_attr('point_scale', point_scale)
+            changed.append(True)
+
+        # sort the clusters by the time of the first jet
+        first_times = np.asarray([cluster.table.get_column('time')[0] for cluster in updated])
+        order = np.argsort(first_times, kind='stable')
+
+        return [updated[i] for i in order], np.asarray(changed, dtype=bool)[order]
+
+    def cluster_all_events(self, eps=1., time_eps=2., workers=1, SOL_events=None, **kwargs):
+        '''
+        Run `filter_jet_clusters` for all the SOL events, optionally distributing
+        the events over a pool of processes. The events with the most subjects are
+        started first, so that a long event does not hold up the end of the run
+        Inputs
+        ------
+            eps : float
+                space parameter in which the jets should lie
+            time_eps : float
+                time parameter in which the jets should lie
+            workers : int
+                number of processes (default 1, i.e., no pool)
+            SOL_events : list
+                names of the SOL events (default: all the events in the meta file)
+            kwargs : dict
+                other arguments for `filter_jet_clusters` (e.g., sparse, time_window)
+
+        Outputs
+        -------
+            clusters : dict
+                Dictionary with the SOL event as key and the list of `JetCluster`
+                objects as value, in the order of `SOL_events`
+            report : dict
+                Dictionary with the SOL event as key and a dictionary with the number of
+                subjects (`nsubjects`), number of clusters (`nclusters`), run time in seconds
+                (`time`) and the error message if the clustering failed (`error`, None otherwise)
+        '''
+        if SOL_events is None:
+            SOL_events = self.metafile.SOL_unique
+
+        SOL_events = [str(SOL_event) for SOL_event in SOL_events]
+        nsubjects = {SOL_event: len(self.get_subjects(SOL_event)) for SOL_event in SOL_events}
+
+        # largest events first
+        order = sorted(SOL_events, key=lambda SOL_event: nsubjects[SOL_event], reverse=True)
+        tasks = [(SOL_event, dict(eps=eps, time_eps=time_eps, **kwargs)) for SOL_event in order]
+
+        if workers > 1:
+            with get_worker_pool(workers, _init_sol_worker, (self,)) as pool:
+                results = list(pool.imap_unordered(_cluster_event_worker, tasks))
+        else:
+            _init_sol_worker(self)
+            results = [_cluster_event_worker(task) for task in tasks]
+
+        results = {result[0]: result[1:] for result in results}
+
+        clusters = {}
+        report = {}
+        for SOL_event in SOL_events:
+            clustersi, error, run_time = results[SOL_event]
+            clusters[SOL_event] = clustersi
+            report[SOL_event] = {'nsubjects': nsubjects[SOL_event], 'nclusters': len(clustersi),
+                                 'time': run_time, 'error': error}
+
+        return clusters, report
+
+    def sweep_parameters(self, SOL_event, eps_values, time_eps_values, workers=1, sparse=False, time_window=None):
+        '''
+        Cluster the jets of a SOL event for a grid of `eps` and `time_eps` values. The jets and
+        the pair metrics are only calculated once (see `get_event_metrics`), and the grid is
+        evaluated against them, optionally over a pool of processes. The stability of each
+        setting is the mean adjusted Rand index between its clustering and those of its
+        neighbours in the grid
+        Inputs
+        ------
+            SOL_event : str
+                name of the SOL event used in Zooniverse
+            eps_values : list
+                values of the space parameter
+            time_eps_values : list
+                values of the time parameter
+            workers : int
+                number of processes (default 1, i.e., no pool)
+            sparse : bool
+                If True, use the sparse metrics (see `filter_jet_clusters`)
+            time_window : float
+                time window (in frames) for the sparse mode (default: the largest `time_eps`)
+
+        Outputs
+        -------
+            results : `astropy.table.Table`
+                Table with one row for each (`eps`, `time_eps`) setting, with the number of
+                clusters (`nclusters`), number of jets in a cluster with more than one jet
+                (`nclustered`), mean and maximum cluster size (`mean_size`, `max_size`) and
+                the `stability`
+            labels : numpy.ndarray
+                (neps, ntime_eps, njets) array of the cluster label of each jet for each setting
+        '''
+        eps_values = np.asarray(eps_values, dtype=float)
+        time_eps_values = np.asarray(time_eps_values, dtype=float)
+
+        if time_window is None:
+            time_window = time_eps_values.max()
+
+        metrics = self.get_event_metrics(SOL_event, workers=workers, sparse=sparse, time_window=time_window)
+
+        grid = [(eps, time_eps) for eps in eps_values for time_eps in time_eps_values]
+
+        if workers > 1:
+            with get_worker_pool(workers, _init_sweep_worker, (metrics,)) as pool:
+                labels = pool.map(_sweep_worker, grid)
+        else:
+            labels = [get_event_labels(metrics, eps, time_eps) for eps, time_eps in grid]
+
+        labels = np.asarray(labels, dtype=int).reshape((len(eps_values), len(time_eps_values), -1))
+
+        rows = []
+        for i, eps in enumerate(eps_values):
+            for j, time_eps in enumerate(time_eps_values):
+                labelsij = labels[i, j]
+                _, sizes = np.unique(labelsij[labelsij > -1], return_counts=True)
+
+                # compare with the neighbouring settings in the grid
+                aris = [get_adjusted_rand_index(labelsij, labels[i + di, j + dj])
+                        for di, dj in [(-1, 0), (1, 0), (0, -1), (0, 1)]
+                        if (0 <= i + di < len(eps_values)) and (0 <= j + dj < len(time_eps_values))]
+
+                rows.append([eps, time_eps, len(sizes), np.sum(sizes[sizes > 1]),
+                             np.mean(sizes) if len(sizes) > 0 else 0.,
+                             np.max(sizes, initial=0),
+                             np.mean(aris) if len(aris) > 0 else 1.])
+
+        results = Table(rows=rows, names=['eps', 'time_eps', 'nclusters', 'nclustered',
+                                          'mean_size', 'max_size', 'stability'])
 
-        return jet_clusters, distance_metric, point_metric, box_metric
+        return results, labels
 
 
 class JetCluster:
     def __init__(self, jets):
         '''
             Initiate the JetCluster with a list of jet objects that are contained by that cluster.
+            The jets can also be passed as a `JetTable`. The data for the jets is stored in
+            `self.table`, and `self.jets` holds the `Jet` views into each row of it.
         '''
-        self.jets = jets
+        self.table = jets if isinstance(jets, JetTable) else JetTable.from_jets(jets)
+        self.jets = self.table.jets
 
     def adding_new_attr(self, name_attr, value_attr):
         '''
@@ -3,3 +3,8 @@ from .workflow import *
 from .SOL_class import *
 from .image_handler import *
 from .meta_file_handler import *
+from .ragged import *
+from .csv_loader import *
+from .geometry import *
+from .frame_time import *
+from .jet_cache import *
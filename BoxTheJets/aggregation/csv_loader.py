@@ -0,0 +1,49 @@
+import csv
+from astropy.io import ascii
+
+
+def get_csv_columns(filename):
+    '''
+        Read the column names from the header of a CSV file
+
+        Inputs
+        ------
+        filename : str
+            path to the CSV file
+
+        Outputs
+        -------
+        columns : list
+            List of column names in the file
+    '''
+    with open(filename, 'r', newline='') as infile:
+        return next(csv.reader(infile))
+
+
+def read_csv_columns(filename, columns=None):
+    '''
+        Read a subset of the columns from a reduction/extract CSV file.
+        Columns that are not requested are skipped by the reader, so they
+        are never parsed or held in memory.
+
+        Inputs
+        ------
+        filename : str
+            path to the CSV file
+        columns : list
+            List of column names to read. Columns which do not exist in the file
+            are ignored. If None (default), all the columns are read
+
+        Outputs
+        -------
+        table : astropy.table.Table
+            Table containing the requested columns (in the order of the file)
+    '''
+    if columns is None:
+        return ascii.read(filename, format='csv', fast_reader=True)
+
+    columns = set(columns)
+    include_names = [col for col in get_csv_columns(filename) if col in columns]
+
+    return ascii.read(filename, format='csv', fast_reader=True,
+                      include_names=include_names)
@@ -0,0 +1,178 @@
+import numpy as np
+
+# number of frames in each subject
+NFRAMES = 15
+
+# columns of the frame time table (other than subject_id and task)
+FRAME_TIME_COLUMNS = [f'{name}_{key}' for name in ['start', 'end', 'box']
+                      for key in ['score', 'best', 'count']]
+
+
+class FrameData:
+    '''
+        Frame-by-frame extract data for one tool of one task. For each row of the
+        extract table and each frame, holds whether the volunteer drew the tool in that
+        frame, and the values (e.g., x, y) of the annotation. This allows the
+        frame data for a subject to be read by slicing the rows of that subject
+    '''
+
+    def __init__(self, has_data, values):
+        '''
+            Inputs
+            ------
+            has_data : numpy.ndarray
+                (nrows, nframes) boolean array of which frames have an annotation for each row
+            values : dict
+                Dictionary with the key (e.g., x, y) and a (nrows, nframes) float array
+                of the annotation values (undefined where `has_data` is False)
+        '''
+        self.has_data = has_data
+        self.values = values
+
+    @classmethod
+    def from_lists(cls, lists, columns):
+        '''
+            Create the frame data from the parsed list columns of the extract table
+
+            Inputs
+            ------
+            lists : dict
+                Dictionary of `RaggedArray` objects for each column (see `ragged.load_list_columns`)
+            columns : dict
+                Dictionary with the key (e.g., x, y) and the list of column names for
+                each frame. A row only has data in a frame if all the keys have a value
+
+            Outputs
+            -------
+            frame_data : `FrameData`
+                the frame data for all the rows in the table
+        '''
+        keys = list(columns.keys())
+
+        # check every key, so that a row with e.g. an x value but no y value is skipped
+        has_data = np.logical_and.reduce([np.stack([lists[col].lengths() > 0 for col in columns[key]], axis=1)
+                                          for key in keys])
+
+        values = {}
+        for key in keys:
+            values[key] = np.full(has_data.shape, np.nan)
+            for frame, col in enumerate(columns[key]):
+                ragged = lists[col]
+                rows = np.where(has_data[:, frame])[0]
+
+                # each extract only has one value per frame
+                values[key][rows, frame] = ragged.values[ragged.offsets[rows]]
+
+        return cls(has_data, values)
+
+    def get_frames(self, rows):
+        '''
+            Get the annotations in each frame for a set of rows
+
+            Inputs
+            ------
+            rows : numpy.ndarray
+                rows of the extract table (e.g., for a given subject/task)
+
+            Outputs
+            -------
+            frames : list
+                List of (n, nkeys) arrays of the annotation values for each frame
+        '''
+        has_data = self.has_data[rows]
+        values = np.stack([value[rows] for value in self.values.values()], axis=-1)
+
+        frames = []
+        for frame in range(has_data.shape[1]):
+            framei = values[has_data[:, frame], frame]
+            frames.append(framei if len(framei) > 0 else np.asarray([]))
+
+        return frames
+
+
+def get_frame_scores(frames, data, probs):
+    '''
+        Get the score for each frame, given by the sum of the cluster probability of the
+        annotations in that frame. The cluster probability of each annotation is found by
+        matching its values to the classification data from the reducer
+
+        Inputs
+        ------
+        frames : list
+            List of (n, nkeys) annotation values for each frame (see `FrameData.get_frames`)
+        data : list
+            List of the classification data for each key from the reducer (in the same order as
+            the frame values)
+        probs : numpy.ndarray
+            cluster probability for each point in the classification data
+
+        Outputs
+        -------
+        scores : list
+            Score for each frame
+    '''
+    data = np.asarray(data, dtype=float).reshape((len(data), -1)).T
+    probs = np.asarray(probs)
+
+    scores = []
+    for framei in frames:
+        if len(framei) == 0:
+            scores.append(np.sum([]))
+            continue
+
+        # find the classification data that exactly match each annotation
+        matches = np.all(framei[:, np.newaxis, :] == data[np.newaxis, :, :], axis=2)
+        _, index = np.nonzero(matches)
+
+        scores.append(np.sum(probs[index]))
+
+    return scores
+
+
+def get_frame_time_row(aggregator, subject, task):
+    '''
+        Get the frame scores, best frame and number of annotations in each
+        frame for the start, end and box of a subject
+
+        Inputs
+        ------
+        aggregator : `workflow.Aggregator`
+            Aggregator with the extract data loaded
+        subject : int
+            Zooniverse subject ID
+        task : string
+            task for the Zooniverse workflow
+
+        Outputs
+        -------
+        row : list
+            Values for the row of the frame time table (see `FRAME_TIME_COLUMNS`)
+    '''
+    base_points = aggregator.get_frame_time_base(subject, task)
+    box = aggregator.get_frame_time_box(subject, task)
+
+    row = [subject, task]
+    for frames, score in [(base_points['start'], base_points['start_score']),
+                          (base_points['end'], base_points['end_score']),
+                          (box['box_frames'], box['box_score'])]:
+        row.extend([np.asarray(score, dtype=float), np.argmax(score),
+                    np.asarray([len(framei) for framei in frames], dtype=int)])
+
+    return row
+
+
+# the aggregator used by each process in the pool
+_worker_aggregator = None
+
+
+def _init_frame_time_worker(aggregator):
+    global _worker_aggregator
+    _worker_aggregator = aggregator
+
+
+def _get_frame_time_worker(key):
+    subject, task = key
+    try:
+        return key, get_frame_time_row(_worker_aggregator, subject, task), None
+    except (ValueError, IndexError) as e:
+        return key, None, f'{type(e).__name__}: {e}'
@@ -0,0 +1,386 @@
+import numpy as np
+import shapely
+
+# available methods to calculate the box IoU
+# numpy: vectorized convex clipping (see `get_box_intersection_area`)
+# shapely: shapely's (>=2.0) vectorized polygon intersection/union
+GEOMETRY_BACKENDS = ['numpy', 'shapely']
+
+
+def get_box_edges_batch(x, y, w, h, a):
+    '''
+        Return the corners of a set of boxes given one corner, width, height
+        and angle of each box. Vectorized version of `workflow.get_box_edges`
+
+        Inputs
+        ------
+        x : numpy.ndarray
+            Box left bottom edge x-coordinates
+        y : numpy.ndarray
+            Box left bottom edge y-coordinates
+        w : numpy.ndarray
+            Box widths
+        h : numpy.ndarray
+            Box heights
+        a : numpy.ndarray
+            Rotation angles (radians)
+
+        Outputs
+        --------
+        corners : numpy.ndarray
+            (N, 5, 2) array with coordinates of the box edges. The first corner
+            is repeated at the end to close the loop
+    '''
+    x, y, w, h, a = np.broadcast_arrays(*[np.atleast_1d(np.asarray(v, dtype=float))
+                                          for v in [x, y, w, h, a]])
+
+    cx = (2*x+w)/2
+    cy = (2*y+h)/2
+
+    # corners of the box if theta = 0 (going anti-clockwise from the bottom left,
+    # and repeating the first corner)
+    px = np.stack([cx - 0.5 * w, cx + 0.5 * w, cx + 0.5 * w, cx - 0.5 * w, cx - 0.5 * w], axis=-1)
+    py = np.stack([cy - 0.5 * h, cy - 0.5 * h, cy + 0.5 * h, cy + 0.5 * h, cy - 0.5 * h], axis=-1)
+
+    # rotate about the centre
+    dx = px - cx[..., np.newaxis]
+    dy = py - cy[..., np.newaxis]
+    cosa = np.cos(a)[..., np.newaxis]
+    sina = np.sin(a)[..., np.newaxis]
+
+    corners = np.empty((*dx.shape, 2))
+    corners[..., 0] = dx * cosa - dy * sina + cx[..., np.newaxis]
+    corners[..., 1] = dx * sina + dy * cosa + cy[..., np.newaxis]
+
+    return corners
+
+
+def get_polygon_area(corners):
+    '''
+        Area of a set of polygons using the shoelace formula
+
+        Inputs
+        ------
+        corners : numpy.ndarray
+            (..., K, 2) array with the vertices of each polygon (in order)
+
+        Outputs
+        -------
+        area : numpy.ndarray
+            Area of each polygon
+    '''
+    x = corners[..., 0]
+    y = corners[..., 1]
+    return 0.5 * np.abs(np.sum(x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y, axis=-1))
+
+
+def _cross(u, v):
+    '''
+        z-component of the cross product of two (..., 2) arrays of vectors
+    '''
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+def _points_in_polygon(points, corners, tol):
+    '''
+        Find which points lie inside (or on the edge of) a convex polygon
+
+        Inputs
+        ------
+        points : numpy.ndarray
+            (P, K, 2) array of points to test against each polygon
+        corners : numpy.ndarray
+            (P, 4, 2) array of polygon vertices (either orientation)
+        tol : numpy.ndarray
+            (P,) tolerance in distance to count points on the edge as inside
+
+        Outputs
+        -------
+        inside : numpy.ndarray
+            (P, K) boolean array which is True for points inside the polygon
+    '''
+    edges = np.roll(corners, -1, axis=-2) - corners
+    lengths = np.linalg.norm(edges, axis=-1)
+
+    # signed distance of each point from each edge, which is positive
+    # on the inside of the polygon for an anti-clockwise polygon
+    dist = _cross(edges[:, np.newaxis], points[:, :, np.newaxis] - corners[:, np.newaxis])
+    dist = dist / np.where(lengths > 0, lengths, 1.)[:, np.newaxis]
+
+    # flip the sign for clockwise polygons
+    orientation = np.where(np.sum(_cross(corners, np.roll(corners, -1, axis=-2)), axis=-1) < 0, -1., 1.)
+
+    return np.all(dist * orientation[:, np.newaxis, np.newaxis] >= -tol[:, np.newaxis, np.newaxis], axis=-1)
+
+
+def get_box_intersection_area(corners1, corners2):
+    '''
+        Area of the intersection of pairs of boxes (or any convex quadrilaterals).
+        The intersection polygon is built from the corners of each box that are inside
+        the other box and from the crossing points of the edges of the two boxes.
+
+        Inputs
+        ------
+        corners1 : numpy.ndarray
+            (P, 4, 2) array with the corners of the first box in each pair
+            (see `get_box_edges_batch`, the repeated fifth corner is ignored)
+        corners2 : numpy.ndarray
+            (P, 4, 2) array with the corners of the second box in each pair
+
+        Outputs
+        -------
+        area : numpy.ndarray
+            (P,) area of the intersection for each pair
+    '''
+    corners1 = np.asarray(corners1, dtype=float)[:, :4]
+    corners2 = np.asarray(corners2, dtype=float)[:, :4]
+    npairs = len(corners1)
+
+    # tolerance for points on the edges, scaled to the size of the coordinates
+    scale = np.maximum(np.abs(corners1).max(axis=(1, 2), initial=0),
+                       np.abs(corners2).max(axis=(1, 2), initial=0))
+    tol = 1.e-9 * (1. + scale)
+
+    # corners of each box that fall inside the other box
+    inside1 = _points_in_polygon(corners1, corners2, tol)
+    inside2 = _points_in_polygon(corners2, corners1, tol)
+
+    # crossing points of each edge of box 1 with each edge of box 2
+    p = corners1[:, :, np.newaxis]
+    r = (np.roll(corners1, -1, axis=1) - corners1)[:, :, np.newaxis]
+    q = corners2[:, np.newaxis]
+    s = (np.roll(corners2, -1, axis=1) - corners2)[:, np.newaxis]
+
+    denom = _cross(r, s)
+    parallel = np.abs(denom) < 1.e-12 * (1. + scale[:, np.newaxis, np.newaxis]) ** 2
+    denom = np.where(parallel, 1., denom)
+    t = _cross(q - p, s) / denom
+    u = _cross(q - p, r) / denom
+    frac_tol = 1.e-12
+    crossing = ~parallel & (t >= -frac_tol) & (t <= 1 + frac_tol) & (u >= -frac_tol) & (u <= 1 + frac_tol)
+    crossing_points = p + t[..., np.newaxis] * r
+
+    points = np.concatenate([corners1, corners2, crossing_points.reshape((npairs, 16, 2))], axis=1)
+    valid = np.concatenate([inside1, inside2, crossing.reshape((npairs, 16))], axis=1)
+    npoints = valid.sum(axis=1)
+
+    # the intersection is convex, so the points can be ordered by
+    # their angle around the center of the intersection
+    center = np.sum(points * valid[..., np.newaxis], axis=1) / np.maximum(npoints, 1)[:, np.newaxis]
+    angles = np.arctan2(points[..., 1] - center[:, 1, np.newaxis], points[..., 0] - center[:, 0, np.newaxis])
+    angles[~valid] = np.inf
+    order = np.argsort(angles, axis=1)
+    points = np.take_along_axis(points, order[..., np.newaxis], axis=1)
+
+    # shoelace formula over the valid points (which are now at the start)
+    # closing the loop back to the first point
+    index = np.arange(points.shape[1])
+    next_index = np.where(index[np.newaxis] + 1 < npoints[:, np.newaxis], index[np.newaxis] + 1, 0)
+    next_points = np.take_along_axis(points, next_index[..., np.newaxis], axis=1)
+    terms = np.where(index[np.newaxis] < npoints[:, np.newaxis], _cross(points, next_points), 0.)
+
+    area = 0.5 * np.abs(np.sum(terms, axis=1))
+    area[npoints < 3] = 0.
+
+    return area
+
+
+def check_geometry_backend(backend):
+    '''
+        Raise a `ValueError` if `backend` is not one of `GEOMETRY_BACKENDS`
+    '''
+    if backend not in GEOMETRY_BACKENDS:
+        raise ValueError(f"Unknown geometry backend {backend}. Must be one of {GEOMETRY_BACKENDS}")
+
+
+def get_box_iou_shapely(corners1, corners2):
+    '''
+        Intersection over union for pairs of boxes using shapely's vectorized
+        functions. The two inputs are broadcast against each other, so that
+        passing (N, 1, 4, 2) and (1, M, 4, 2) arrays gives the (N, M) IoU matrix
+
+        Inputs
+        ------
+        corners1 : numpy.ndarray
+            (..., 4, 2) array with the corners of the first box in each pair
+        corners2 : numpy.ndarray
+            (..., 4, 2) array with the corners of the second box in each pair
+
+        Outputs
+        -------
+        iou : numpy.ndarray
+            IoU for each pair
+    '''
+    boxes1 = shapely.polygons(np.asarray(corners1, dtype=float)[..., :4, :])
+    boxes2 = shapely.polygons(np.asarray(corners2, dtype=float)[..., :4, :])
+
+    # the union area follows from the intersection, which saves a second overlay per pair
+    intersection = shapely.area(shapely.intersection(boxes1, boxes2))
+
+    return intersection / (shapely.area(boxes1) + shapely.area(boxes2) - intersection)
+
+
+def get_box_iou(corners1, corners2, backend='numpy'):
+    '''
+        Intersection over union for pairs of boxes
+
+        Inputs
+        ------
+        corners1 : numpy.ndarray
+            (P, 4, 2) array with the corners of the first box in each pair
+        corners2 : numpy.ndarray
+            (P, 4, 2) array with the corners of the second box in each pair
+        backend : str
+            Method used to calculate the intersection (see `GEOMETRY_BACKENDS`)
+
+        Outputs
+        -------
+        iou : numpy.ndarray
+            (P,) IoU for each pair
+    '''
+    check_geometry_backend(backend)
+
+    corners1 = np.asarray(corners1, dtype=float).reshape((-1, *np.shape(corners1)[-2:]))[:, :4]
+    corners2 = np.asarray(corners2, dtype=float).reshape((-1, *np.shape(corners2)[-2:]))[:, :4]
+
+    if backend == 'shapely':
+        return get_box_iou_shapely(corners1, corners2)
+
+    intersection = get_box_intersection_area(corners1, corners2)
+    union = get_polygon_area(corners1) + get_polygon_area(corners2) - intersection
+
+    return intersection / union
+
+
+def get_overlapping_pairs(corners1, corners2):
+    '''
+        Find the pairs of boxes whose bounding boxes (envelopes) overlap, using a
+        spatial index (`shapely.STRtree`) on the second set. Boxes in pairs that are
+        not returned do not intersect, so their IoU is 0
+
+        Inputs
+        ------
+        corners1 : numpy.ndarray
+            (N, 4, 2) array with the corners of the first set of boxes
+        corners2 : numpy.ndarray
+            (M, 4, 2) array with the corners of the second set of boxes
+
+        Outputs
+        -------
+        rows : numpy.ndarray
+            Index of the box in the first set for each candidate pair
+        cols : numpy.ndarray
+            Index of the box in the second set for each candidate pair
+    '''
+    corners1 = np.asarray(corners1, dtype=float).reshape((-1, *np.shape(corners1)[-2:]))[:, :4]
+    corners2 = np.asarray(corners2, dtype=float).reshape((-1, *np.shape(corners2)[-2:]))[:, :4]
+
+    tree = shapely.STRtree(shapely.polygons(corners2))
+    rows, cols = np.asarray(tree.query(shapely.polygons(corners1)), dtype=int).reshape((2, -1))
+
+    return rows, cols
+
+
+def get_box_iou_matrix(corners1, corners2, chunk_size=65536, backend='numpy'):
+    '''
+        Intersection over union between each box in one set and
+        each box in another set. Only the pairs whose envelopes overlap
+        (see `get_overlapping_pairs`) are calculated, the rest have an IoU of 0
+
+        Inputs
+        ------
+        corners1 : numpy.ndarray
+            (N, 4, 2) array with the corners of the first set of boxes
+            (see `get_box_edges_batch`)
+        corners2 : numpy.ndarray
+            (M, 4, 2) array with the corners of the second set of boxes
+        chunk_size : int
+            Number of pairs to process at once (limits the memory use)
+        backend : str
+            Method used to calculate the intersection (see `GEOMETRY_BACKENDS`)
+
+        Outputs
+        -------
+        iou : numpy.ndarray
+            (N, M) matrix where `iou[i, j]` is the IoU of box i in the
+            first set with box j in the second set
+    '''
+    check_geometry_backend(backend)
+
+    corners1 = np.asarray(corners1, dtype=float).reshape((-1, *np.shape(corners1)[-2:]))[:, :4]
+    corners2 = np.asarray(corners2, dtype=float).reshape((-1, *np.shape(corners2)[-2:]))[:, :4]
+
+    iou = np.zeros((len(corners1), len(corners2)))
+    if iou.size == 0:
+        return iou
+
+    # most of the boxes are far apart, so only the candidate pairs
+    # from the spatial index are passed to the intersection kernel
+    rows, cols = get_overlapping_pairs(corners1, corners2)
+
+    if backend == 'shapely':
+        # build the polygons once, rather than for each pair (see `get_box_iou_shapely`)
+        boxes1 = shapely.polygons(corners1)
+        boxes2 = shapely.polygons(corners2)
+        intersection = shapely.area(shapely.intersection(boxes1[rows], boxes2[cols]))
+        iou[rows, cols] = intersection / (shapely.area(boxes1)[rows] + shapely.area(boxes2)[cols] - intersection)
+        return iou
+
+    for start in range(0, len(rows), chunk_size):
+        rowsi = rows[start:start + chunk_size]
+        colsi = cols[start:start + chunk_size]
+        iou[rowsi, colsi] = get_box_iou(corners1[rowsi], corners2[colsi], backend=backend)
+
+    return iou
+
+
+def autorotate_batch(corners, starts):
+    '''
+        Find the rotation of a set of jets wrt to solar north and the base width
+        and height of each box. The base of the box is the pair of corners closest to the
+        start point of the jet. Vectorized version of `workflow.Jet.autorotate`
+
+        Inputs
+        ------
+        corners : numpy.ndarray
+            (N, 4, 2) array with the corners of each jet box (in order)
+        starts : numpy.ndarray
+            (N, 2) array with the start (base) point of each jet
+
+        Outputs
+        -------
+        rotation : dict
+            Dictionary with the following keys:
+                - base_points : (N, 2, 2) pair of points that correspond to the base of each jet
+                - height_points : (N, 2, 2) pair of points that correspond to the height of each jet
+                - angle : (N,) angle of each jet wrt to solar north
+                - width : (N,) base width of each box
+                - height : (N,) height of each box
+    '''
+    corners = np.asarray(corners, dtype=float).reshape((-1, *np.shape(corners)[-2:]))[:, :4]
+    starts = np.asarray(starts, dtype=float).reshape((-1, 2))
+    index = np.arange(len(corners))[:, np.newaxis]
+
+    # find the distance between each point and the starting base
+    dists = np.linalg.norm(corners - starts[:, np.newaxis], axis=-1)
+    sorted_dists = np.argsort(dists, axis=1)
+
+    # the base points are the two points closest to the start
+    base_points = corners[index, sorted_dists[:, :2]]
+
+    # the height points are the next two. going around the box from
+    # the closest point, the first height point is either the next corner (if
+    # that is the second base point) or the last corner
+    closest = sorted_dists[:, 0]
+    next_is_base = np.all(corners[index[:, 0], (closest + 1) % 4] == base_points[:, 1], axis=-1)
+    first_height = np.where(next_is_base, (closest + 1) % 4, (closest + 3) % 4)
+    height_points = corners[index, np.stack([first_height, (closest + 2) % 4], axis=1)]
+
+    # the angle is the angle between the height points and the base
+    dh = height_points[:, 1] - height_points[:, 0]
+
+    return {'base_points': base_points,
+            'height_points': height_points,
+            'angle': np.arctan2(dh[:, 0], -dh[:, 1]),
+            'height': np.linalg.norm(dh, axis=-1),
+            'width': np.linalg.norm(base_points[:, 1] - base_points[:, 0], axis=-1)}
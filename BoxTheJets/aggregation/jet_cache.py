@@ -0,0 +1,141 @@
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+from .ragged import get_file_hash
+
+# increase this when the jet finding changes, so that old cache files are not used
+JET_CACHE_VERSION = 1
+
+
+def get_jet_cache_key(files, params):
+    '''
+        Create the key for the jet cache from the input files and the parameters
+        of the jet finding
+
+        Inputs
+        ------
+        files : list
+            paths to the input (reduction) files. The key depends on the file contents
+        params : dict
+            parameters used to find the jets (e.g., the geometry backend)
+
+        Outputs
+        -------
+        key : str
+            hex digest identifying the inputs
+    '''
+    sha = hashlib.sha1()
+    sha.update(f'version={JET_CACHE_VERSION}'.encode())
+
+    for filename in files:
+        sha.update(get_file_hash(filename).encode())
+
+    for name in sorted(params.keys()):
+        sha.update(f'{name}={params[name]!r}'.encode())
+
+    return sha.hexdigest()
+
+
+class JetCache:
+    '''
+        Two-level cache of the per-subject jet data: an in-memory LRU cache
+        in front of one `.npz` file per subject in the cache directory. Each subject's
+        data is stored as a dictionary of arrays (see `JetTable.to_arrays`)
+    '''
+
+    def __init__(self, cache_dir, key, maxsize=128):
+        '''
+            Inputs
+            ------
+            cache_dir : str
+                directory to save the cache files. If None, only the in-memory cache is used
+            key : str
+                key for the inputs to the jet finding (see `get_jet_cache_key`).
+                Files saved with a different key are ignored
+            maxsize : int
+                number of subjects to keep in memory (default 128)
+        '''
+        self.cache_dir = cache_dir
+        self.key = key
+        self.maxsize = maxsize
+
+        self.memory = OrderedDict()
+
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def get_cache_file(self, subject):
+        '''
+            Path to the cache file for a subject
+        '''
+        return os.path.join(self.cache_dir, f'jets_{subject}_{self.key[:16]}.npz')
+
+    def get(self, subject):
+        '''
+            Get the cached data for a subject
+
+            Inputs
+            ------
+            subject : int
+                Zooniverse subject ID
+
+            Outputs
+            -------
+            arrays : dict
+                the data saved for the subject, or None if the subject is not in the cache
+        '''
+        if subject in self.memory:
+            self.memory.move_to_end(subject)
+            return self.memory[subject]
+
+        if self.cache_dir is None:
+            return None
+
+        cache_file = self.get_cache_file(subject)
+        if not os.path.exists(cache_file):
+            return None
+
+        with np.load(cache_file) as cache:
+            if str(cache['key']) != self.key:
+                return None
+            arrays = {name: cache[name] for name in cache.files if name != 'key'}
+
+        self._add_to_memory(subject, arrays)
+
+        return arrays
+
+    def set(self, subject, arrays):
+        '''
+            Save the data for a subject
+
+            Inputs
+            ------
+            subject : int
+                Zooniverse subject ID
+            arrays : dict
+                Dictionary of `numpy.ndarray` objects
+        '''
+        self._add_to_memory(subject, arrays)
+
+        if self.cache_dir is None:
+            return
+
+        try:
+            np.savez(self.get_cache_file(subject), key=self.key, **arrays)
+        except OSError:
+            # the disk cache is optional (e.g., read-only directory)
+            pass
+
+    def clear(self):
+        '''
+            Empty the in-memory cache (the cache files are kept)
+        '''
+        self.memory.clear()
+
+    def _add_to_memory(self, subject, arrays):
+        self.memory[subject] = arrays
+        self.memory.move_to_end(subject)
+
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
@@ -0,0 +1,108 @@
+import numpy as np
+
+# cell values that correspond to no data in the extract/reduction files
+EMPTY_CELLS = ['', 'None', 'N/A', '--']
+
+
+def parse_list_column(column, dtype=None):
+    '''
+        Decode a whole column of stringified numeric lists (e.g., "[1.0, 2.5]")
+        in one pass. Masked, empty and `None` cells are returned as empty rows.
+
+        Inputs
+        ------
+        column : astropy.table.Column or array-like
+            Column of list strings (can be a masked column)
+        dtype : numpy.dtype
+            Output type of the values. If None (default), the values are
+            returned as integers if all the values are integers and as floats otherwise.
+            If `object`, each value is a python int or float depending on how it is written
+            in its cell, so that `format_list_column` gives back the same cells
+
+        Outputs
+        -------
+        values : numpy.ndarray
+            Flattened values of all the rows
+        offsets : numpy.ndarray
+            Start index of each row in `values` (length is number of rows + 1),
+            so that row `i` is `values[offsets[i]:offsets[i + 1]]`
+    '''
+    mask = np.ma.getmaskarray(column)
+    cells = np.char.strip(np.asarray(np.ma.getdata(column), dtype=str))
+
+    # remove the brackets, so that the cells only contain the comma separated values
+    inner = np.char.strip(cells, '[] ')
+    empty = mask | np.isin(cells, EMPTY_CELLS) | (inner == '')
+
+    counts = np.where(empty, 0, np.char.count(inner, ',') + 1)
+    offsets = np.zeros(len(cells) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+
+    if offsets[-1] == 0:
+        return np.zeros(0, dtype=float if dtype is None else dtype), offsets
+
+    # join all the cells together and convert in a single step
+    tokens = ','.join(inner[~empty].tolist()).split(',')
+
+    if dtype is object:
+        # keep the type of each value, as literal_eval would
+        tokens = np.char.strip(np.asarray(tokens, dtype=str))
+        integer = np.char.isdigit(np.char.lstrip(tokens, '+-'))
+
+        values = np.empty(len(tokens), dtype=object)
+        values[integer] = np.asarray(tokens[integer], dtype=np.int64).tolist()
+        values[~integer] = np.asarray(tokens[~integer], dtype=float).tolist()
+        return values, offsets
+
+    if dtype is not None:
+        return np.asarray(tokens, dtype=dtype), offsets
+
+    try:
+        values = np.asarray(tokens, dtype=np.int64)
+    except ValueError:
+        values = np.asarray(tokens, dtype=float)
+
+    return values, offsets
+
+
+def parse_list(cell, dtype=float):
+    '''
+        Decode a single list string (e.g., "[1.0, 2.5]") into an array.
+        See `parse_list_column`
+
+        Inputs
+        ------
+        cell : str
+            list string
+        dtype : numpy.dtype
+            Output type of the values (default float)
+
+        Outputs
+        -------
+        values : numpy.ndarray
+            Values in the list
+    '''
+    values, _ = parse_list_column([cell], dtype=dtype)
+    return values
+
+
+def format_list_column(values, offsets):
+    '''
+        Encode a flattened list column (see `parse_list_column`)
+        back to the list strings used in the extract files
+
+        Inputs
+        ------
+        values : numpy.ndarray
+            Flattened values of all the rows. Use `parse_list_column` with
+            `dtype=object` to keep the integers and floats as they were in each cell
+        offsets : numpy.ndarray
+            Start index of each row in `values`
+
+        Outputs
+        -------
+        cells : list
+            List of strings for each row (e.g., "[1.0, 2.5]")
+    '''
+    values = np.asarray(values).tolist()
+    return [str(values[start:end]) for start, end in zip(offsets[:-1], offsets[1:])]
@@ -0,0 +1,147 @@
+import os
+import hashlib
+import numpy as np
+from .list_parser import parse_list_column
+
+
+class RaggedArray:
+    '''
+        Column of variable length lists stored as a single flat array and
+        the row offsets into that array (CSR layout). Row `i` corresponds to
+        `values[offsets[i]:offsets[i + 1]]`
+    '''
+
+    def __init__(self, values, offsets):
+        '''
+            Inputs
+            ------
+            values : numpy.ndarray
+                Flattened values of all the rows
+            offsets : numpy.ndarray
+                Start index of each row in `values` (length is number of rows + 1)
+        '''
+        self.values = np.asarray(values)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+        # rows are returned as views into the flat array, so
+        # make sure that callers cannot modify the parsed data
+        self.values.flags.writeable = False
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.values[self.offsets[row]:self.offsets[row + 1]]
+
+    def lengths(self):
+        '''
+            Number of elements in each row
+
+            Outputs
+            -------
+            lengths : numpy.ndarray
+                Length of the list in each row
+        '''
+        return np.diff(self.offsets)
+
+    @classmethod
+    def from_strings(cls, column):
+        '''
+            Parse a column of stringified lists (e.g., "[1.0, 2.5]") into a `RaggedArray`.
+            Masked cells are treated as empty lists. See `list_parser.parse_list_column`
+
+            Inputs
+            ------
+            column : astropy.table.Column or list
+                Column of list strings
+
+            Outputs
+            -------
+            ragged : `RaggedArray`
+                Parsed column
+        '''
+        return cls(*parse_list_column(column))
+
+
+def get_file_hash(filename):
+    '''
+        Get the SHA1 hash of a file's contents
+
+        Inputs
+        ------
+        filename : str
+            path to the file
+
+        Outputs
+        -------
+        hash : str
+            hex digest of the file contents
+    '''
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(1 << 20), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+def get_cache_file(filename):
+    '''
+        Path to the binary list cache saved next to a CSV file
+    '''
+    return os.path.splitext(filename)[0] + '_lists.npz'
+
+
+def load_list_columns(filename, table, columns, use_cache=True):
+    '''
+        Parse the stringified list columns of a table into `RaggedArray` objects.
+        The parsed arrays are saved next to the CSV file, and are reused on the next load
+        as long as the hash of the CSV file is unchanged.
+
+        Inputs
+        ------
+        filename : str
+            path to the CSV file that `table` was read from
+        table : astropy.table.Table
+            Table read from `filename`
+        columns : list
+            List of column names to parse
+        use_cache : bool
+            Whether to read/write the binary cache (default True)
+
+        Outputs
+        -------
+        lists : dict
+            Dictionary with the column name as key and `RaggedArray` as value
+    '''
+    lists = {}
+
+    if use_cache:
+        cache_file = get_cache_file(filename)
+        file_hash = get_file_hash(filename)
+
+        if os.path.exists(cache_file):
+            with np.load(cache_file) as cache:
+                if str(cache['hash']) == file_hash:
+                    for col in cache['columns']:
+                        lists[str(col)] = RaggedArray(cache[f'{col}.values'],
+                                                      cache[f'{col}.offsets'])
+
+    # parse the columns that are not in the cache
+    missing = [col for col in columns if col not in lists]
+    for col in missing:
+        lists[col] = RaggedArray.from_strings(table[col])
+
+    if use_cache and len(missing) > 0:
+        arrays = {'hash': file_hash, 'columns': np.asarray(list(lists.keys()))}
+        for col, ragged in lists.items():
+            arrays[f'{col}.values'] = ragged.values
+            arrays[f'{col}.offsets'] = ragged.offsets
+
+        try:
+            np.savez(cache_file, **arrays)
+        except OSError:
+            # the cache is optional (e.g., read-only data directory)
+            pass
+
+    return {col: lists[col] for col in columns}
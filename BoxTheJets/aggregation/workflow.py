@@ -2,11 +2,71 @@ import numpy as np
 from astropy.io import ascii
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
-import ast
 from panoptes_client import Panoptes, Subject
 from skimage import io, transform
 import getpass
+import multiprocessing
+from astropy.table import Table
 from shapely.geometry import Polygon, Point
+from .ragged import load_list_columns
+from .csv_loader import read_csv_columns
+from .jet_cache import JetCache, get_jet_cache_key
+from .frame_time import (FrameData, get_frame_scores, get_frame_time_row, NFRAMES, FRAME_TIME_COLUMNS,
+                         _init_frame_time_worker, _get_frame_time_worker)
+from .geometry import (get_box_edges_batch, get_box_iou, get_box_iou_matrix,
+                       get_overlapping_pairs, check_geometry_backend, autorotate_batch)
+
+# list columns from the reducers that are used by the `Aggregator`
+POINTS_LIST_KEYS = ['points_x', 'points_y', 'clusters_x', 'clusters_y',
+                    'cluster_probabilities', 'cluster_labels']
+BOX_LIST_KEYS = ['rotateRectangle_x', 'rotateRectangle_y', 'rotateRectangle_width',
+                 'rotateRectangle_height', 'rotateRectangle_angle',
+                 'clusters_x', 'clusters_y', 'clusters_width', 'clusters_height',
+                 'clusters_angle', 'clusters_sigma', 'cluster_labels', 'cluster_probabilities']
+
+
+def get_worker_pool(processes, initializer=None, initargs=()):
+    '''
+        Create a process pool for the per-subject calculations. Uses the fork start method
+        where it is available, so that the workers share the parent's memory (e.g., the
+        reduction and extract tables in the `Aggregator`) instead of receiving a pickled copy
+
+        Inputs
+        ------
+        processes : int
+            number of worker processes
+        initializer : callable
+            function called at the start of each worker
+        initargs : tuple
+            arguments for the initializer
+
+        Outputs
+        -------
+        pool : `multiprocessing.pool.Pool`
+            the process pool
+    '''
+    if 'fork' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('fork')
+    else:
+        context = multiprocessing.get_context()
+
+    return context.Pool(processes, initializer=initializer, initargs=initargs)
+
+
+# the aggregator used by each process in the pool in `Aggregator.filter_all`
+_filter_aggregator = None
+
+
+def _init_filter_worker(aggregator):
+    global _filter_aggregator
+    _filter_aggregator = aggregator
+
+
+def _filter_worker(subject):
+    try:
+        return subject, _filter_aggregator.filter_classifications(subject, return_table=True, use_cache=False), None
+    except (ValueError, IndexError) as e:
+        return subject, None, f'{type(e).__name__}: {e}'
 
 
 def connect_panoptes():
@@ -40,23 +100,9 @@ def get_box_edges(x, y, w, h, a):
         --------
         corners : numpy.ndarray
             Length 4 array with coordinates of the box edges
+            (see `geometry.get_box_edges_batch` for many boxes at once)
     '''
-    cx = (2*x+w)/2
-    cy = (2*y+h)/2
-    centre = np.array([cx, cy])
-    original_points = np.array(
-        [
-            [cx - 0.5 * w, cy - 0.5 * h], # This would be the box if theta = 0
-            [cx + 0.5 * w, cy - 0.5 * h],
-            [cx + 0.5 * w, cy + 0.5 * h],
-            [cx - 0.5 * w, cy + 0.5 * h],
-            # repeat the first point to close the loop
-            [cx - 0.5 * w, cy - 0.5 * h]
-        ]
-    )
-    rotation = np.array([[np.cos(a), np.sin(a)], [-np.sin(a), np.cos(a)]])
-    corners = np.matmul(original_points - centre, rotation) + centre
-    return corners
+    return get_box_edges_batch(x, y, w, h, a)[0]
 
 
 def get_subject_image(subject, frame=7):
@@ -116,6 +162,94 @@ def get_point_distance(x0, y0, x1, y1):
     return np.sqrt((x0-x1)**2. + (y0-y1)**2.)
 
 
+def get_point_distance_matrix(x0, y0, x1, y1):
+    '''
+        Get Euclidiean distance between each point in one set of points (x0, y0)
+        and each point in another set (x1, y1)
+
+        Inputs
+        ------
+        x0 : numpy.ndarray
+            First set of points x-coordinates (length N)
+        y0 : numpy.ndarray
+            First set of points y-coordinates (length N)
+        x1 : numpy.ndarray
+            Second set of points x-coordinates (length M)
+        y1 : numpy.ndarray
+            Second set of points y-coordinates (length M)
+
+        Outputs
+        --------
+        dist : numpy.ndarray
+            (N, M) matrix of Euclidian distances, where `dist[i, j]` is the
+            distance between (x0[i], y0[i]) and (x1[j], y1[j])
+    '''
+    x0 = np.asarray(x0, dtype=float).reshape((-1, 1))
+    y0 = np.asarray(y0, dtype=float).reshape((-1, 1))
+    x1 = np.asarray(x1, dtype=float).reshape((1, -1))
+    y1 = np.asarray(y1, dtype=float).reshape((1, -1))
+
+    return get_point_distance(x0, y0, x1, y1)
+
+
+def merge_points(points, dists, scale=1.5):
+    '''
+        Merge a set of cluster points which fall within each others radius of
+        confidence. The points are processed in order: each point that has not
+        been merged yet is merged with all the remaining points that are closer
+        than `scale` times the larger of the two confidence radii, and the point
+        with the smallest radius in that group is kept
+
+        Inputs
+        ------
+        points : numpy.ndarray
+            (N, 2) coordinates of the cluster points
+        dists : numpy.ndarray
+            confidence radius of each point (e.g., mean distance between
+            the extracts and the cluster center)
+        scale : float
+            multiplier on the confidence radius (default: 1.5)
+
+        Outputs
+        -------
+        merged : numpy.ndarray
+            the points left after merging
+        groups : list
+            indices of the points that were merged into each point in `merged`.
+            The first index in each group is the point that the others were compared against
+    '''
+    points = np.asarray(points, dtype=float).reshape((-1, 2))
+    dists = np.asarray(dists, dtype=float).reshape(-1)
+
+    # distance between all the points and which pairs need to be merged
+    point_dists = get_point_distance_matrix(points[:, 0], points[:, 1], points[:, 0], points[:, 1])
+    merge_pairs = point_dists < scale * np.maximum.outer(dists, dists)
+
+    # points which have not been merged yet
+    remaining = np.ones(len(points), dtype=bool)
+
+    merged = []
+    groups = []
+    for i in range(len(points)):
+        if not remaining[i]:
+            continue
+
+        # this point is always removed from the queue
+        merge_mask = remaining & merge_pairs[i]
+        merge_mask[i] = True
+
+        # the earlier points have all been removed, so i is the first index
+        group = np.where(merge_mask)[0]
+
+        # keep the point with the most compact intra-cluster distance
+        merged.append(points[group[np.argmin(dists[group])]])
+        groups.append(group)
+
+        remaining[merge_mask] = False
+
+    return np.asarray(merged), groups
+
+
 def get_box_distance(box1, box2):
     '''
         Get point-wise distance betweeen 2 boxes.
@@ -134,22 +268,42 @@ def get_box_distance(box1, box2):
         dist : float
             Average point-wise distance between the two box edges
     '''
-    b1_edges = get_box_edges(*box1)[:4]
-    b2_edges = get_box_edges(*box2)[:4]
+    return get_box_distance_matrix([box1], [box2])[0, 0]
+
+
+def get_box_distance_matrix(boxes1, boxes2):
+    '''
+        Get the point-wise distance (see `get_box_distance`) between
+        each box in one set and each box in another set
+
+        Inputs
+        ------
+        boxes1 : numpy.ndarray
+            (N, 5) array of parameters for the first set of boxes (see `get_box_edges`)
+        boxes2 : numpy.ndarray
+            (M, 5) array of parameters for the second set of boxes
+
+        Outputs
+        -------
+        dist : numpy.ndarray
+            (N, M) matrix where `dist[i, j]` is the average point-wise distance
+            between box i in the first set and box j in the second set
+    '''
+    b1_edges = get_box_edges_batch(*np.asarray(boxes1, dtype=float).reshape((-1, 5)).T)[:, :4]
+    b2_edges = get_box_edges_batch(*np.asarray(boxes2, dtype=float).reshape((-1, 5)).T)[:, :4]
 
-    # build a distance matrix between the 4 edges
-    # since the order of edges may not be the same
-    # for the two boxes
-    dists = np.zeros((4, 4))
-    for c1 in range(4):
-        for c2 in range(4):
-            dists[c1, c2] = get_point_distance(*b1_edges[c1], *b2_edges[c2])
+    # build a distance matrix between the 4 edges of every pair of boxes
+    # since the order of edges may not be the same for the two boxes
+    # (shape N x M x 4 x 4)
+    dx = b1_edges[:, np.newaxis, :, np.newaxis, 0] - b2_edges[np.newaxis, :, np.newaxis, :, 0]
+    dy = b1_edges[:, np.newaxis, :, np.newaxis, 1] - b2_edges[np.newaxis, :, np.newaxis, :, 1]
+    dists = np.sqrt(dx**2. + dy**2.)
 
     # then collapse the matrix into the minimum distance for each point
-    # does not matter which axis, since we get the least distance anyway
-    mindist = dists.min(axis=0)
+    # and average over the 4 points
+    mindist = dists.min(axis=2)
 
-    return np.average(mindist)
+    return np.mean(mindist, axis=-1)
 
 
 def create_gif(jets):
@@ -251,12 +405,40 @@ def sigma_shape(params, sigma):
     return plus_sigma, minus_sigma
 
 
+def build_row_index(table, keys=('subject_id', 'task')):
+    '''
+        Build a lookup table from the (subject_id, task) pair to the
+        rows of a reduction/extract table, so that per-subject queries
+        do not need a full-length mask over the table
+
+        Inputs
+        ------
+        table : astropy.table.Table
+            Table containing the `keys` columns
+        keys : tuple
+            Column names used to build the key (default: subject_id and task)
+
+        Outputs
+        -------
+        index : dict
+            Dictionary with the (subject_id, task) tuple as key and
+            a `numpy.ndarray` of row numbers as value
+    '''
+    index = {}
+    key_columns = [table[key].tolist() for key in keys]
+    for row, key in enumerate(zip(*key_columns)):
+        index.setdefault(key, []).append(row)
+
+    return {key: np.asarray(rows, dtype=int) for key, rows in index.items()}
+
+
 class Aggregator:
     '''
         Single data class to handle different aggregation requirements
     '''
 
-    def __init__(self, points_file, box_file):
+    def __init__(self, points_file, box_file, use_cache=True, tasks=('T1', 'T5'),
+                 geometry_backend='numpy'):
         '''
             Inputs
             ------
@@ -264,12 +446,36 @@ class Aggregator:
                 path to the reduced points (start/end) data
             box_file : str
                 path to the reduced box data
+            use_cache : bool
+                whether to read/write the pre-parsed list columns to a binary
+                cache next to the reduction files (default True)
+            tasks : list or tuple
+                Workflow tasks to load from the reduction files (default T1 and T5).
+                Only the columns used for these tasks are read from the files
+            geometry_backend : str
+                Method used to calculate the box IoUs: 'numpy' (default) for the
+                vectorized clipping kernel, or 'shapely' for shapely's vectorized
+                intersection/union (see `geometry.GEOMETRY_BACKENDS`)
         '''
+        check_geometry_backend(geometry_backend)
+        self.geometry_backend = geometry_backend
+        self.use_cache = use_cache
+
+        # cache of the jets found in each subject (see `set_jet_cache`)
+        self.jet_cache = None
+
+        self.tasks = list(tasks)
+
+        points_columns = [f'data.frame0.{task}_{tool}_{key}' for task in self.tasks
+                          for tool in ['tool0', 'tool1'] for key in POINTS_LIST_KEYS]
+        box_columns = [f'data.frame0.{task}_tool2_{key}' for task in self.tasks
+                       for key in BOX_LIST_KEYS]
+
         self.points_file = points_file
-        self.points_data = ascii.read(points_file, delimiter=',')
+        self.points_data = read_csv_columns(points_file, ['subject_id', 'task', *points_columns])
 
         self.box_file = box_file
-        self.box_data = ascii.read(box_file, delimiter=',')
+        self.box_data = read_csv_columns(box_file, ['subject_id', 'task', *box_columns])
 
         for col in self.box_data.colnames:
             self.box_data[col].fill_value = '[]'
@@ -277,6 +483,52 @@ class Aggregator:
         for col in self.points_data.colnames:
             self.points_data[col].fill_value = '[]'
 
+        # map each (subject, task) to its row in the reduction tables
+        self.points_index = build_row_index(self.points_data)
+        self.box_index = build_row_index(self.box_data)
+
+        # parse the list columns once, so that the accessors
+        # only need to slice the flat arrays
+        self.points_lists = load_list_columns(
+            points_file, self.points_data,
+            [col for col in points_columns if col in self.points_data.colnames], use_cache)
+        self.box_lists = load_list_columns(
+            box_file, self.box_data,
+            [col for col in box_columns if col in self.box_data.colnames], use_cache)
+
+    def has_subject(self, subject, task=None):
+        '''
+            Check whether a subject has reduction data
+
+            Inputs
+            ------
+            subject : int
+                Zooniverse subject ID
+            task : string
+                Either 'T1' or 'T5' for the first jet or second jet. If None (default),
+                returns True if any of the loaded tasks has data for this subject
+
+            Outputs
+            -------
+            has_data : bool
+                True if the subject (and task) is in the points reduction data
+        '''
+        if task is not None:
+            return (subject, task) in self.points_index
+
+        return any((subject, taski) in self.points_index for taski in self.tasks)
+
+    def _get_reduction_row(self, index, subject, task):
+        '''
+            Get the row number for a given subject and task in one of the
+            reduction tables. Raises an `IndexError` if the subject/task pair does not exist
+        '''
+        rows = index.get((subject, task))
+        if rows is None:
+            raise IndexError(f"No reduction data for subject {subject} and task {task}")
+
+        return rows[0]
+
     def get_subjects(self):
         '''
             Return a list of known subjects in the reduction data
@@ -311,40 +563,26 @@ class Aggregator:
                 Cluster shape (x, y) for start and end and probabilities and labels of the
                 data points
         '''
-        points_data = self.points_data[:][(self.points_data['subject_id'] == subject) & (
-            self.points_data['task'] == task)]
-
-        points_data = points_data.filled()
+        row = self._get_reduction_row(self.points_index, subject, task)
+        lists = self.points_lists
 
         data = {}
 
-        data['x_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_points_x'][0]))
-        data['y_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_points_y'][0]))
-        data['x_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_points_x'][0]))
-        data['y_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_points_y'][0]))
+        data['x_start'] = lists[f'data.frame0.{task}_tool0_points_x'][row]
+        data['y_start'] = lists[f'data.frame0.{task}_tool0_points_y'][row]
+        data['x_end'] = lists[f'data.frame0.{task}_tool1_points_x'][row]
+        data['y_end'] = lists[f'data.frame0.{task}_tool1_points_y'][row]
 
         clusters = {}
-        clusters['x_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_clusters_x'][0]))
-        clusters['y_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_clusters_y'][0]))
-        clusters['x_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_clusters_x'][0]))
-        clusters['y_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_clusters_y'][0]))
-
-        clusters['prob_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_cluster_probabilities'][0]))
-        clusters['labels_start'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool0_cluster_labels'][0]))
-        clusters['prob_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_cluster_probabilities'][0]))
-        clusters['labels_end'] = np.asarray(ast.literal_eval(
-            points_data[f'data.frame0.{task}_tool1_cluster_labels'][0]))
+        clusters['x_start'] = lists[f'data.frame0.{task}_tool0_clusters_x'][row]
+        clusters['y_start'] = lists[f'data.frame0.{task}_tool0_clusters_y'][row]
+        clusters['x_end'] = lists[f'data.frame0.{task}_tool1_clusters_x'][row]
+        clusters['y_end'] = lists[f'data.frame0.{task}_tool1_clusters_y'][row]
+
+        clusters['prob_start'] = lists[f'data.frame0.{task}_tool0_cluster_probabilities'][row]
+        clusters['labels_start'] = lists[f'data.frame0.{task}_tool0_cluster_labels'][row]
+        clusters['prob_end'] = lists[f'data.frame0.{task}_tool1_cluster_probabilities'][row]
+        clusters['labels_end'] = lists[f'data.frame0.{task}_tool1_cluster_labels'][row]
 
         return data, clusters
 
@@ -368,62 +606,42 @@ class Aggregator:
                 Cluster shape (x, y, width, height and angle) and probabilities and labels of the
                 data points
         '''
-        box_data = self.box_data[:][(self.box_data['subject_id'] == subject) & (
-            self.box_data['task'] == task)]
-
-        box_data = box_data.filled()
+        row = self._get_reduction_row(self.box_index, subject, task)
+        lists = self.box_lists
 
         data = {}
 
-        data['x'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_x'][0]))
-        data['y'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_y'][0]))
-        data['w'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_width'][0]))
-        data['h'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_height'][0]))
-        data['a'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_rotateRectangle_angle'][0]))
+        data['x'] = lists[f'data.frame0.{task}_tool2_rotateRectangle_x'][row]
+        data['y'] = lists[f'data.frame0.{task}_tool2_rotateRectangle_y'][row]
+        data['w'] = lists[f'data.frame0.{task}_tool2_rotateRectangle_width'][row]
+        data['h'] = lists[f'data.frame0.{task}_tool2_rotateRectangle_height'][row]
+        data['a'] = lists[f'data.frame0.{task}_tool2_rotateRectangle_angle'][row]
 
         clusters = {}
 
-        clusters['x'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_x'][0]))
-        clusters['y'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_y'][0]))
-        clusters['w'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_width'][0]))
-        clusters['h'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_height'][0]))
-        clusters['a'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_angle'][0]))
-
-        clusters['sigma'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_clusters_sigma'][0]))
-        clusters['labels'] = np.asarray(ast.literal_eval(
-            box_data[f'data.frame0.{task}_tool2_cluster_labels'][0]))
+        clusters['x'] = lists[f'data.frame0.{task}_tool2_clusters_x'][row]
+        clusters['y'] = lists[f'data.frame0.{task}_tool2_clusters_y'][row]
+        clusters['w'] = lists[f'data.frame0.{task}_tool2_clusters_width'][row]
+        clusters['h'] = lists[f'data.frame0.{task}_tool2_clusters_height'][row]
+        clusters['a'] = lists[f'data.frame0.{task}_tool2_clusters_angle'][row]
+
+        clusters['sigma'] = lists[f'data.frame0.{task}_tool2_clusters_sigma'][row]
+        clusters['labels'] = lists[f'data.frame0.{task}_tool2_cluster_labels'][row]
 
         try:
-            clusters['prob'] = np.asarray(ast.literal_eval(
-                box_data[f'data.frame0.{task}_tool2_cluster_probabilities'][0]))
+            clusters['prob'] = lists[f'data.frame0.{task}_tool2_cluster_probabilities'][row]
         except KeyError:
             # OPTICS cluster doesn't have probabilities
+            # so use the IoU of each box with its cluster
             probs = np.zeros(len(data['x']))
-            for i in range(len(data['x'])):
-                labeli = clusters['labels'][i]
-                if labeli == -1:
-                    probs[i] = 0
-                else:
-                    boxi_data = Polygon(get_box_edges(data['x'][i], data['y'][i],
-                                                      data['w'][i], data['h'][i],
-                                                      np.radians(data['a'][i]))[:4])
-                    boxi_clust = Polygon(get_box_edges(clusters['x'][labeli], clusters['y'][labeli],
-                                                       clusters['w'][labeli], clusters['h'][labeli],
-                                                       np.radians(clusters['a'][labeli]))[:4])
-
-                    probs[i] = boxi_data.intersection(
-                        boxi_clust).area/boxi_data.union(boxi_clust).area
+            data_edges = get_box_edges_batch(data['x'], data['y'], data['w'], data['h'],
+                                             np.radians(data['a']))
+            clust_edges = get_box_edges_batch(clusters['x'], clusters['y'], clusters['w'],
+                                              clusters['h'], np.radians(clusters['a']))
+            labels = np.asarray(clusters['labels'], dtype=int)
+            clustered = labels != -1
+            probs[clustered] = get_box_iou(data_edges[clustered], clust_edges[labels[clustered]],
+                                           backend=self.geometry_backend)
             clusters['prob'] = probs
 
         return data, clusters
@@ -516,17 +734,17 @@ class Aggregator:
         ax.scatter(cx1_i, cy1_i, 10.0, marker='x', color='yellow')
 
         # plot the raw boxes with a gray line
+        box_edges = get_box_edges_batch(x_i, y_i, w_i, h_i, np.radians(a_i))
         for j in range(len(x_i)):
-            points = get_box_edges(
-                x_i[j], y_i[j], w_i[j], h_i[j], np.radians(a_i[j]))
+            points = box_edges[j]
             linewidthi = 0.2*pb_i[j]+0.1
             ax.plot(points[:, 0], points[:, 1], '-',
                     color='limegreen', linewidth=linewidthi)
 
         # plot the clustered box in blue
+        clust_edges = get_box_edges_batch(cx_i, cy_i, cw_i, ch_i, np.radians(ca_i))
         for j in range(len(cx_i)):
-            clust = get_box_edges(
-                cx_i[j], cy_i[j], cw_i[j], ch_i[j], np.radians(ca_i[j]))
+            clust = clust_edges[j]
 
             # calculate the bounding box for the cluster confidence
             plus_sigma, minus_sigma = sigma_shape(
@@ -604,16 +822,67 @@ class Aggregator:
                     break
 
     def load_extractor_data(self, point_extractor_file='point_extractor_by_frame_box_the_jets.csv',
-                            box_extractor_file='shape_extractor_rotateRectangle_box_the_jets.csv'):
+                            box_extractor_file='shape_extractor_rotateRectangle_box_the_jets.csv',
+                            tasks=None):
         '''
             Loads the file containing the raw extract data (before squashing the frame data
             together) and adds the table to the class
+
+            Inputs
+            ------
+            point_extractor_file : str
+                path to the point extractor file
+            box_extractor_file : str
+                path to the box (rotateRectangle) extractor file
+            tasks : list
+                Workflow tasks to load (default: the tasks loaded from the reduction files).
+                Only the frame columns of the start/end points (tool0/tool1) and
+                box (tool2) for these tasks are read from the files
         '''
+        if tasks is None:
+            tasks = self.tasks
+
+        point_columns = [f'data.frame{frame}.{task}_{tool}_{key}' for task in tasks
+                         for frame in range(15) for tool in ['tool0', 'tool1'] for key in ['x', 'y']]
+        box_columns = [f'data.frame{frame}.{task}_tool2_{key}' for task in tasks
+                       for frame in range(15) for key in ['x', 'y', 'width', 'height', 'angle']]
+
         self.point_extract_file = point_extractor_file
-        self.point_extracts = ascii.read(point_extractor_file, delimiter=',')
+        self.point_extracts = read_csv_columns(point_extractor_file,
+                                               ['classification_id', 'subject_id', 'task', *point_columns])
 
         self.box_extract_file = box_extractor_file
-        self.box_extracts = ascii.read(box_extractor_file, delimiter=',')
+        self.box_extracts = read_csv_columns(box_extractor_file,
+                                             ['classification_id', 'subject_id', 'task', *box_columns])
+
+        # each subject/task has one row per classification in the extracts
+        self.point_extracts_index = build_row_index(self.point_extracts)
+        self.box_extracts_index = build_row_index(self.box_extracts)
+
+        # parse all the frame columns once, and store the annotation in each frame
+        # for every classification, so that the frame info for a subject
+        # only needs to slice the rows for that subject
+        point_lists = load_list_columns(
+            point_extractor_file, self.point_extracts,
+            [col for col in point_columns if col in self.point_extracts.colnames], self.use_cache)
+        box_lists = load_list_columns(
+            box_extractor_file, self.box_extracts,
+            [col for col in box_columns if col in self.box_extracts.colnames], self.use_cache)
+
+        self.point_frames = {}
+        self.box_frames = {}
+        for task in tasks:
+            # skip tasks that do not exist in the extract files
+            if f'data.frame0.{task}_tool0_x' in point_lists:
+                for tool, name in [('tool0', 'start'), ('tool1', 'end')]:
+                    self.point_frames[(task, name)] = FrameData.from_lists(
+                        point_lists, {key: [f'data.frame{frame}.{task}_{tool}_{key}' for frame in range(NFRAMES)]
+                                      for key in ['x', 'y']})
+
+            if f'data.frame0.{task}_tool2_x' in box_lists:
+                self.box_frames[task] = FrameData.from_lists(
+                    box_lists, {key: [f'data.frame{frame}.{task}_tool2_{key}' for frame in range(NFRAMES)]
+                                for key in ['x', 'y', 'width', 'height', 'angle']})
 
     def get_frame_time_base(self, subject, task='T1'):
         '''
@@ -648,103 +917,21 @@ class Aggregator:
         # get the points data and associated cluster
         points_data, points_clusters = self.get_points_data(subject, task)
 
-        x0_i = points_data['x_start']
-        y0_i = points_data['y_start']
-        x1_i = points_data['x_end']
-        y1_i = points_data['y_end']
-
-        cx0_i = points_clusters['x_start']
-        cy0_i = points_clusters['y_start']
-        p0_i = points_clusters['prob_start']
-        cx1_i = points_clusters['x_end']
-        cy1_i = points_clusters['y_end']
-        p1_i = points_clusters['prob_end']
-
         # get the extract data so that we can obtain frame_time info
         # you need to run load_extractor data first
         assert hasattr(
-            self, 'point_extracts'), "Please load the extractor data using the load_extractor_data method"
-        point_extractsi = self.point_extracts[:][(
-            self.point_extracts['subject_id'] == subject) & (self.point_extracts['task'] == task)]
-
-        # empty lists to hold the frame info
-        start_frames = []
-        end_frames = []
-
-        # empty lists to hold the frame score
-        start_weights = []
-        end_weights = []
-
-        for frame in range(15):
-            # start of the jet is tool0
-            frame_start_ext = point_extractsi[f'data.frame{frame}.{task}_tool0_x',
-                                              f'data.frame{frame}.{task}_tool0_y'][:]
-            for col in frame_start_ext.colnames:
-                frame_start_ext[col].fill_value = 'None'
-
-            # rename the columns for easier use
-            frame_start_ext.rename_column(
-                f'data.frame{frame}.{task}_tool0_x', f'frame{frame}_x')
-            frame_start_ext.rename_column(
-                f'data.frame{frame}.{task}_tool0_y', f'frame{frame}_y')
-
-            # find the rows with data for this frame
-            start_sub = frame_start_ext[:][frame_start_ext.filled()[
-                f'frame{frame}_x'][:] != "None"]
-
-            # parse the data from the string value and add it to the list
-            points = []
-            probs = []
-            for i in range(len(start_sub)):
-                xx = ast.literal_eval(start_sub[f'frame{frame}_x'][i])[0]
-                yy = ast.literal_eval(start_sub[f'frame{frame}_y'][i])[0]
-                points.append([xx, yy])
-
-                # find the associated cluster probability based on the index of the points
-                # in the cluster info
-                ind = np.where((xx == x0_i) & (yy == y0_i))[0]
-                probs.append(p0_i[ind])
-
-            # convert to numpy array and append to the list
-            points = np.asarray(points)
-            start_frames.append(points)
-            start_weights.append(probs)
-
-            # end of the jet is tool1
-            # do the same process for tool1
-            frame_end_ext = point_extractsi[f'data.frame{frame}.{task}_tool1_x',
-                                            f'data.frame{frame}.{task}_tool1_y'][:]
-            for col in frame_end_ext.colnames:
-                frame_end_ext[col].fill_value = 'None'
-
-            frame_end_ext.rename_column(
-                f'data.frame{frame}.{task}_tool1_x', f'frame{frame}_x')
-            frame_end_ext.rename_column(
-                f'data.frame{frame}.{task}_tool1_y', f'frame{frame}_y')
-
-            end_sub = frame_end_ext[:][frame_end_ext.filled()[
-                f'frame{frame}_x'][:] != "None"]
-
-            points = []
-            probs = []
-            for i in range(len(end_sub)):
-                xx = ast.literal_eval(end_sub[f'frame{frame}_x'][i])[0]
-                yy = ast.literal_eval(end_sub[f'frame{frame}_y'][i])[0]
-
-                points.append([xx, yy])
-
-                # find the associated cluster probability based on the index of the points
-                # in the cluster info
-                ind = np.where((xx == x1_i) & (yy == y1_i))[0]
-                probs.append(p1_i[ind])
-
-            points = np.asarray(points)
-            end_frames.append(points)
-            end_weights.append(probs)
+            self, 'point_frames'), "Please load the extractor data using the load_extractor_data method"
+        rows = self.point_extracts_index.get((subject, task), np.zeros(0, dtype=int))
 
-        # the score is the sum of the probabilities at each frame
-        start_score = [np.sum(starti) for starti in start_weights]
-        end_score = [np.sum(endi) for endi in end_weights]
+        # start of the jet is tool0 and end is tool1
+        start_frames = self.point_frames[(task, 'start')].get_frames(rows)
+        end_frames = self.point_frames[(task, 'end')].get_frames(rows)
+
+        # the score is the sum of the cluster probabilities of the points at each frame
+        start_score = get_frame_scores(start_frames, [points_data['x_start'], points_data['y_start']],
+                                       points_clusters['prob_start'])
+        end_score = get_frame_scores(end_frames, [points_data['x_end'], points_data['y_end']],
+                                     points_clusters['prob_end'])
 
         return {'start': start_frames, 'start_score': start_score, 'start_best': np.argmax(start_score),
                 'end': end_frames, 'end_score': end_score, 'end_best': np.argmax(end_score)}
@@ -771,83 +958,144 @@ class Aggregator:
         '''
         # get the cluster and points information from the reduced data
         box_data, box_clusters = self.get_box_data(subject, task)
-        x_i = box_data['x']
-        y_i = box_data['y']
-        w_i = box_data['w']
-        h_i = box_data['h']
-        a_i = box_data['a']
-
-        cx_i = box_clusters['x']
-        cy_i = box_clusters['y']
-        cw_i = box_clusters['w']
-        ch_i = box_clusters['h']
-        ca_i = box_clusters['a']
-        p0_i = box_clusters['prob']
 
         # get the extract data so that we can obtain frame_time info
         # you need to run load_extractor data first
         assert hasattr(
-            self, 'box_extracts'), "Please load the extractor data using the load_extractor_data method"
-        box_extractsi = self.box_extracts[:][(
-            self.box_extracts['subject_id'] == subject) & (self.box_extracts['task'] == task)]
-
-        # empty lists to hold the frame info
-        frames = []
-        weights = []
-
-        for frame in range(15):
-            # rename the columns to make it easier to work with
-            box_extractsi.rename_column(
-                f'data.frame{frame}.{task}_tool2_x', f'frame{frame}_x')
-            box_extractsi.rename_column(
-                f'data.frame{frame}.{task}_tool2_y', f'frame{frame}_y')
-            box_extractsi.rename_column(
-                f'data.frame{frame}.{task}_tool2_width', f'frame{frame}_w')
-            box_extractsi.rename_column(
-                f'data.frame{frame}.{task}_tool2_height', f'frame{frame}_h')
-            box_extractsi.rename_column(
-                f'data.frame{frame}.{task}_tool2_angle', f'frame{frame}_a')
-
-            # start of the jet is tool0
-            frame_box = box_extractsi[f'frame{frame}_x', f'frame{frame}_y',
-                                      f'frame{frame}_w', f'frame{frame}_h', f'frame{frame}_a'][:]
-            for col in frame_box.colnames:
-                frame_box[col].fill_value = 'None'
-
-            # find the rows with data for this frame
-            box_sub = frame_box[:][frame_box.filled(
-            )[f'frame{frame}_x'][:] != "None"]
-
-            # parse the data from the string value and add it to the list
-            box = []
-            probs = []
-            for i in range(len(box_sub)):
-                xx = ast.literal_eval(box_sub[f'frame{frame}_x'][i])[0]
-                yy = ast.literal_eval(box_sub[f'frame{frame}_y'][i])[0]
-                ww = ast.literal_eval(box_sub[f'frame{frame}_w'][i])[0]
-                hh = ast.literal_eval(box_sub[f'frame{frame}_h'][i])[0]
-                aa = ast.literal_eval(box_sub[f'frame{frame}_a'][i])[0]
-                box.append([xx, yy, ww, hh, aa])
-
-                # find the associated cluster probability based on the index of the box
-                # in the cluster info
-                ind = np.where((xx == x_i) & (yy == y_i) & (
-                    ww == w_i) & (hh == h_i) & (aa == a_i))[0]
-                probs.append(p0_i[ind])
-
-            # convert to numpy array and append to the list
-            box = np.asarray(box)
-            frames.append(box)
-            weights.append(probs)
+            self, 'box_frames'), "Please load the extractor data using the load_extractor_data method"
+        rows = self.box_extracts_index.get((subject, task), np.zeros(0, dtype=int))
 
-        # the score is the sum of the probabilities at each frame
-        score = [np.sum(weight) for weight in weights]
+        frames = self.box_frames[task].get_frames(rows)
 
-        # get the number of classifications for each point in time
-        npoints = [len(starti) for starti in frames]
+        # the score is the sum of the probabilities at each frame
+        score = get_frame_scores(frames, [box_data[key] for key in ['x', 'y', 'w', 'h', 'a']],
+                                 box_clusters['prob'])
 
         return {'box_frames': frames, 'box_score': score}
 
+    def get_frame_time_table(self, subjects=None, tasks=None, workers=1, output=None):
+        '''
+            Calculate the frame scores, best frames and number of annotations per frame
+            (see `get_frame_time_base` and `get_frame_time_box`) for many subjects at once.
+            The table is stored in the aggregator, so that `get_frame_time_info` and
+            `plot_frame_info` can look up the values instead of recomputing them
+
+            Inputs
+            ------
+            subjects : list
+                Zooniverse subject IDs (default: all the subjects in the reduction data)
+            tasks : list
+                tasks for the Zooniverse workflow (default: the tasks loaded from the reduction files)
+            workers : int
+                number of processes used to calculate the frame info (default 1, i.e., no pool)
+            output : str
+                if given, the table is also written to this file (e.g., `frame_times.fits`,
+                the format is determined from the extension). It can be read back using
+                `load_frame_time_table`
+
+            Outputs
+            -------
+            table : `astropy.table.Table`
+                Table with one row per subject and task, containing the columns
+                subject_id, task and the {start,end,box}_{score,best,count} columns. The
+                score and count columns have one value per frame
+            failures : dict
+                Dictionary with the (subject ID, task) as key and the error message as value
+                for the subjects where the frame info could not be calculated (e.g., no box data)
+        '''
+        assert hasattr(
+            self, 'point_frames'), "Please load the extractor data using the load_extractor_data method"
+
+        if subjects is None:
+            subjects = self.get_subjects()
+
+        if tasks is None:
+            tasks = self.tasks
+
+        keys = [(int(subject), task) for subject in subjects for task in tasks
+                if self.has_subject(int(subject), task)]
+
+        if workers > 1:
+            with get_worker_pool(workers, _init_frame_time_worker, (self,)) as pool:
+                results = pool.map(_get_frame_time_worker, keys, chunksize=max(1, len(keys) // (4 * workers)))
+        else:
+            _init_frame_time_worker(self)
+            results = [_get_frame_time_worker(key) for key in keys]
+
+        # keep the subjects which failed (e.g., no box data) out of the table
+        rows = []
+        failures = {}
+        for key, row, error in results:
+            if error is not None:
+                failures[key] = error
+            else:
+                rows.append(row)
+
+        table = Table()
+        table['subject_id'] = np.asarray([row[0] for row in rows], dtype=int)
+        table['task'] = np.asarray([row[1] for row in rows], dtype=str)
+        for i, col in enumerate(FRAME_TIME_COLUMNS):
+            shape = (-1,) if col.endswith('_best') else (-1, NFRAMES)
+            table[col] = np.asarray([row[i + 2] for row in rows], dtype=int if col.endswith('_best') or
+                                    col.endswith('_count') else float).reshape(shape)
+
+        self.set_frame_time_table(table)
+
+        if output is not None:
+            table.write(output, overwrite=True)
+
+        return table, failures
+
+    def set_frame_time_table(self, table):
+        '''
+            Store the frame time table (see `get_frame_time_table`) in the aggregator
+        '''
+        self.frame_time_table = table
+        self.frame_time_index = build_row_index(table)
+
+    def load_frame_time_table(self, filename):
+        '''
+            Read the frame time table written by `get_frame_time_table`
+
+            Inputs
+            ------
+            filename : str
+                path to the frame time table
+
+            Outputs
+            -------
+            table : `astropy.table.Table`
+                the frame time table
+        '''
+        table = Table.read(filename)
+        self.set_frame_time_table(table)
+
+        return table
+
+    def get_frame_time_info(self, subject, task='T1'):
+        '''
+            Get the frame scores, best frames and number of annotations per frame for a subject.
+            Uses the frame time table if the subject is in it (see `get_frame_time_table`),
+            otherwise the values are calculated from the extracts
+
+            Inputs
+            ------
+            subject : int
+                Zooniverse subject ID
+            task : string
+                task for the Zooniverse workflow (T1 for first jet and T2 for second jet)
+
+            Outputs
+            -------
+            frame_info : dict
+                Dictionary with the {start,end,box}_{score,best,count} keys
+        '''
+        if hasattr(self, 'frame_time_index') and (subject, task) in self.frame_time_index:
+            row = self.frame_time_table[self.frame_time_index[(subject, task)][0]]
+            return {key: row[key] for key in FRAME_TIME_COLUMNS}
+
+        return dict(zip(FRAME_TIME_COLUMNS, get_frame_time_row(self, subject, task)[2:]))
+
     def plot_frame_info(self, subject, task='T1'):
         '''
             plot the distribution of classifications by frame time
@@ -859,21 +1107,16 @@ class Aggregator:
             task : string
                 task for the Zooniverse workflow (T1 for first jet and T2 for second jet)
         '''
-        base_points = self.get_frame_time_base(subject, task)
-        box = self.get_frame_time_box(subject, task)
-
-        if (base_points is None) or (box is None):
-            print(f"{subject} has no cluster.")
-            return
+        frame_info = self.get_frame_time_info(subject, task)
 
-        start_score = base_points['start_score']
-        end_score = base_points['end_score']
-        box_score = box['box_score']
+        start_score = frame_info['start_score']
+        end_score = frame_info['end_score']
+        box_score = frame_info['box_score']
 
         # get the number of classifications for each point in time
-        npoints_start = [len(starti) for starti in base_points['start']]
-        npoints_box = [len(boxi) for boxi in box['box_frames']]
-        npoints_end = [len(endi) for endi in base_points['end']]
+        npoints_start = frame_info['start_count']
+        npoints_box = frame_info['box_count']
+        npoints_end = frame_info['end_count']
 
         # plot this "histogram"
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(6, 8),
@@ -1001,23 +1244,15 @@ class Aggregator:
         # for the boxes
         box_iou = np.zeros(len(cx))
         ncb = len(cx)
+        clust_edges = get_box_edges_batch(cx, cy, cw, ch, np.radians(ca))
+        box_edges = get_box_edges_batch(x, y, w, h, np.radians(a))
         for i in range(ncb):
             # subset the clusters
-            mask = clb == i
-            xi = x[mask]
-            yi = y[mask]
-            wi = w[mask]
-            hi = h[mask]
-            ai = a[mask]
-
-            # calculate the IoU using Shapely's in built methods
-            cb = Polygon(get_box_edges(
-                cx[i], cy[i], cw[i], ch[i], np.radians(ca[i]))[:4])
-            ious = np.zeros(len(xi))
-            for j in range(len(xi)):
-                bj = Polygon(get_box_edges(
-                    xi[j], yi[j], wi[j], hi[j], np.radians(ai[j]))[:4])
-                ious[j] = cb.intersection(bj).area/cb.union(bj).area
+            edgesi = box_edges[clb == i]
+
+            # calculate the IoU of each box with the cluster
+            ious = get_box_iou(np.repeat(clust_edges[i:i + 1], len(edgesi), axis=0), edgesi,
+                               backend=self.geometry_backend)
 
             # average all the IoUs for a cluster
             box_iou[i] = np.mean(ious)
@@ -1082,18 +1317,20 @@ class Aggregator:
         temp_boxes['box'] = []
         temp_boxes['count'] = []
 
+        combined_edges = get_box_edges_batch(combined_boxes['x'], combined_boxes['y'],
+                                             combined_boxes['w'], combined_boxes['h'],
+                                             np.radians(combined_boxes['a']))
+
+        # corners of the boxes in the bucket (kept in the same order as temp_boxes)
+        temp_edges = combined_edges[np.asarray(combined_boxes['iou']) > 1.e-6, :4]
+
         for i in range(len(combined_boxes['x'])):
-            x = combined_boxes['x'][i]
-            y = combined_boxes['y'][i]
-            w = combined_boxes['w'][i]
-            h = combined_boxes['h'][i]
-            a = np.radians(combined_boxes['a'][i])
             if combined_boxes['iou'][i] > 1.e-6:
                 # temp_clust_boxes.append(Polygon(get_box_edges(x, y, w, h, a)[:4]))
                 # temp_box_ious.append(combined_boxes['iou'][i])
                 # temp_box_count.append(np.sum(np.asarray(combined_boxes['labels'])==i))
                 temp_boxes['box'].append(
-                    Polygon(get_box_edges(x, y, w, h, a)[:4]))
+                    Polygon(combined_edges[i, :4]))
                 temp_boxes['count'].append(
                     np.sum(np.asarray(combined_boxes['labels']) == i))
                 for key in combined_boxes.keys():
@@ -1122,63 +1359,52 @@ class Aggregator:
         sort_mask = np.argsort(temp_boxes['iou']*temp_boxes['count'])[::-1]
         for key in temp_boxes.keys():
             temp_boxes[key] = temp_boxes[key][sort_mask]
+        temp_edges = temp_edges[sort_mask]
         # temp_clust_boxes = temp_clust_boxes[sort_mask]
         # temp_box_ious    = temp_box_ious[sort_mask]
         # temp_box_count   = temp_box_count[sort_mask]
 
-        while len(temp_boxes['box']) > 0:
-            nboxes = len(temp_boxes['box'])
-
-            # compare against the first box in the bucket
-            # this will get removed at the end of this loop
-            box0 = temp_boxes['box'][0]
-
-            # to compare iou of box0 with other boxes
-            ious = np.ones(nboxes)
-
-            # to see if box0 needs to be merged with another
-            # box
-            merge_mask = [False]*nboxes
-            merge_mask[0] = True
-
-            for j in range(1, nboxes):
-                # find IoU for box0 vs boxj
-                bj = temp_boxes['box'][j]
-                ious[j] = box0.intersection(bj).area/box0.union(bj).area
-
-                # if the IoU is better than the worst IoU of the classifications
-                # for either box, then we should merge these two
-                # this metric could be changed to be more robust in the future
-                if ious[j] > np.min([temp_boxes['iou'][0], temp_boxes['iou'][j], 0.1]):
-                    merge_mask[j] = True
+        # calculate the IoU between all the boxes in the bucket once
+        # and find which pairs should be merged:
+        # if the IoU is better than the worst IoU of the classifications
+        # for either box, then we should merge these two
+        # this metric could be changed to be more robust in the future
+        box_ious = get_box_iou_matrix(temp_edges, temp_edges, backend=self.geometry_backend)
+        merge_thresholds = np.minimum(np.minimum.outer(temp_boxes['iou'], temp_boxes['iou']), 0.1)
+        merge_pairs = box_ious > merge_thresholds
+
+        # boxes that are still in the bucket
+        remaining = np.ones(len(temp_edges), dtype=bool)
+
+        # go through the boxes in order. each box that is still in the bucket
+        # is compared against the other remaining boxes, and the merged boxes are
+        # removed from the bucket
+        for i in range(len(temp_edges)):
+            if not remaining[i]:
+                continue
+
+            # to see if box i needs to be merged with another box
+            merge_mask = remaining & merge_pairs[i]
+            merge_mask[i] = True
 
             # add the box with the best iou to the cluster list
-            # sum_ious = temp_box_ious[merge_mask]*temp_box_count[merge_mask]
-            sum_ious = temp_boxes['iou'][merge_mask] * \
-                temp_boxes['count'][merge_mask]
-            # clust_boxes.append(\
-            #    temp_clust_boxes[merge_mask][np.argmax(sum_ious)])
+            merge_inds = np.where(merge_mask)[0]
+            best = merge_inds[np.argmax(temp_boxes['iou'][merge_inds])]
 
             for key in temp_boxes.keys():
-                # np.argmax(sum_ious)
-                best = np.argmax(temp_boxes['iou'][merge_mask])
-                clust_boxes[key].append(temp_boxes[key][merge_mask][best])
+                clust_boxes[key].append(temp_boxes[key][best])
 
             if plot:
                 fig, ax = plt.subplots(1, 1, dpi=150)
                 ax.imshow(get_subject_image(subject))
-                # ax.plot(*box0.exterior.xy, '-', color='k')
-                for j in range(1, nboxes):
+                remaining_inds = np.where(remaining)[0]
+                for j in remaining_inds[1:]:
                     bj = temp_boxes['box'][j]
                     if merge_mask[j]:
                         ax.plot(*bj.exterior.xy, 'k--', linewidth=0.5)
                     else:
                         ax.plot(*bj.exterior.xy, 'k-', linewidth=0.5)
-                for j in range(nboxes):
-                    #ax.text((bj.exterior.xy[0][0] + bj.exterior.xy[0][1])/2.,
-                    #        (bj.exterior.xy[1][0] + bj.exterior.xy[1][1])/2.,
-                    #        f'IoU = {temp_boxes["iou"][j]:.1f}', fontsize=10)
-
+                for j in remaining_inds:
                     # calculate the bounding box for the cluster confidence
                     plus_sigma, minus_sigma = sigma_shape(
                         [temp_boxes['x'][j],
@@ -1204,9 +1430,8 @@ class Aggregator:
                 plt.tight_layout()
                 plt.show()
 
-            # and remove all the overlapping boxes from the list
-            for key in temp_boxes.keys():
-                temp_boxes[key] = np.delete(temp_boxes[key], merge_mask)
+            # and remove all the overlapping boxes from the bucket
+            remaining[merge_mask] = False
 
         return clust_boxes
 
@@ -1255,141 +1480,120 @@ class Aggregator:
         combined_starts['dist'] = [*start_dist_T1, *start_dist_T5]
         combined_ends['dist'] = [*end_dist_T1, *end_dist_T5]
 
-        # add all the start points to a bucket
-        temp_clust_starts = []
-        temp_start_dists = []
-        for i in range(len(combined_starts['x'])):
-            x = combined_starts['x'][i]
-            y = combined_starts['y'][i]
-            temp_clust_starts.append([x, y])
-            temp_start_dists.append(combined_starts['dist'][i])
-
-        temp_clust_starts = np.asarray(temp_clust_starts)
-        temp_start_dists = np.asarray(temp_start_dists)
-
-        temp_clust_ends = []
-        temp_end_dists = []
-        for i in range(len(combined_ends['x'])):
-            x = combined_ends['x'][i]
-            y = combined_ends['y'][i]
-            temp_clust_ends.append([x, y])
-            temp_end_dists.append(combined_ends['dist'][i])
-
-        temp_clust_ends = np.asarray(temp_clust_ends)
-        temp_end_dists = np.asarray(temp_end_dists)
-
-        # now loop over this bucket of start points
-        # and see how well they match with each other
-        # we will move the "good" points to a new list
-        # so we can keep track of progress based on how
-        # many items are still in the queue
-        clust_starts = []
-        while len(temp_clust_starts) > 0:
-            npoints = len(temp_clust_starts)
-
-            # compare against the first point in the bucket
-            # this will get removed at the end of this loop
-            start0 = temp_clust_starts[0]
+        # merge the start and end points which fall within each others radius of confidence
+        clust_starts, start_groups = merge_points(np.transpose([combined_starts['x'], combined_starts['y']]),
+                                                  combined_starts['dist'])
+        clust_ends, end_groups = merge_points(np.transpose([combined_ends['x'], combined_ends['y']]),
+                                              combined_ends['dist'])
 
-            # to compare distance of this 0th point with other points
-            dists = np.zeros(npoints)
-
-            # to see if start0 needs to be merged with another point
-            merge_mask = [False]*npoints
-
-            # we will always remove this first point from the queue
-            merge_mask[0] = True
-
-            for j in range(1, npoints):
-                # find distance for the first and jth point
-                pointj = temp_clust_starts[j]
-                dists[j] = get_point_distance(*start0, *pointj)
-
-                # if the distance is better than the 1.5x the mean distance of
-                # point that make up this cluster, then we should merge these two
-                # this metric could be changed to be more robust in the future
-                if dists[j] < 1.5*np.max([temp_start_dists[0], temp_start_dists[j]]):
-                    merge_mask[j] = True
-
-            # add the point with the most compact intra-cluster distance to the cluster list
-            clust_starts.append(
-                temp_clust_starts[merge_mask][np.argmin(temp_start_dists[merge_mask])])
-
-            if plot:
-                fig, ax = plt.subplots(1, 1, dpi=150)
-                ax.imshow(get_subject_image(subject))
-
-                cir = Point(*start0).buffer(1.5*temp_start_dists[0])
-                ax.plot(*start0, 'bx')
-                ax.plot(*cir.exterior.xy, 'k-', linewidth=0.5)
-                for j in range(1, npoints):
-                    pointj = temp_clust_starts[j]
-                    ax.plot(*pointj, 'kx')
-                    cir = Point(*pointj).buffer(1.5*temp_start_dists[j])
-                    ax.plot(*cir.exterior.xy, 'k-', linewidth=0.5)
-                ax.axis('off')
-                plt.show()
-
-            # and remove all the merged points from the list
-            temp_clust_starts = np.delete(
-                temp_clust_starts, merge_mask, axis=0)
-            temp_start_dists = np.delete(temp_start_dists, merge_mask)
-
-        # repeat for the end points
-        clust_ends = []
-        while len(temp_clust_ends) > 0:
-            npoints = len(temp_clust_ends)
-
-            # compare against the first point in the bucket
-            # this will get removed at the end of this loop
-            end0 = temp_clust_ends[0]
-
-            # to compare distance of this 0th point with other points
-            dists = np.zeros(npoints)
+        if plot:
+            for points, dists, groups, color in [(combined_starts, combined_starts['dist'], start_groups, 'b'),
+                                                 (combined_ends, combined_ends['dist'], end_groups, 'y')]:
+                points = np.transpose([points['x'], points['y']]).reshape((-1, 2))
+                remaining = np.ones(len(points), dtype=bool)
+                for group in groups:
+                    fig, ax = plt.subplots(1, 1, dpi=150)
+                    ax.imshow(get_subject_image(subject))
+
+                    # the point we compared against and the other points still in the queue
+                    for j in np.where(remaining)[0]:
+                        ax.plot(*points[j], f'{color}x' if j == group[0] else 'kx')
+                        cir = Point(*points[j]).buffer(1.5*dists[j])
+                        ax.plot(*cir.exterior.xy, 'k-', linewidth=0.5)
+                    ax.axis('off')
+                    plt.show()
+
+                    remaining[group] = False
+
+        return clust_starts, clust_ends
+
+    def filter_all(self, subjects=None, workers=1, return_table=False):
+        '''
+            Run `filter_classifications` for many subjects, optionally
+            distributing the subjects over a pool of processes
 
-            # to see if end0 needs to be merged with another point
-            merge_mask = [False]*npoints
+            Inputs
+            ------
+            subjects : list
+                Zooniverse subject IDs (default: all the subjects in the reduction data)
+            workers : int
+                number of processes (default 1, i.e., no pool)
+            return_table : bool
+                If True, return a `JetTable` for each subject instead of the
+                list of `Jet` objects
 
-            # we will always remove this first point from the queue
-            merge_mask[0] = True
+            Outputs
+            -------
+            jets : dict
+                Dictionary with the subject ID as key and the list of `Jet` objects
+                (or the `JetTable`) as value, in the order of `subjects`
+            failures : dict
+                Dictionary with the subject ID as key and the error message as value
+                for the subjects where the jets could not be found (e.g., no box data)
+        '''
+        if subjects is None:
+            subjects = self.get_subjects()
+
+        subjects = [int(subject) for subject in subjects]
+
+        # get the subjects which are already in the jet cache
+        tables = {}
+        if self.jet_cache is not None:
+            for subject in subjects:
+                arrays = self.jet_cache.get(subject)
+                if arrays is not None:
+                    tables[subject] = JetTable.from_arrays(arrays)
+
+        # and find the jets for the rest
+        missing = list(dict.fromkeys([subject for subject in subjects if subject not in tables]))
+
+        if workers > 1 and len(missing) > 1:
+            with get_worker_pool(workers, _init_filter_worker, (self,)) as pool:
+                results = pool.map(_filter_worker, missing,
+                                   chunksize=max(1, len(missing) // (4 * workers)))
+        else:
+            _init_filter_worker(self)
+            results = [_filter_worker(subject) for subject in missing]
 
-            for j in range(1, npoints):
-                # find distance for the first and jth point
-                pointj = temp_clust_ends[j]
-                dists[j] = get_point_distance(*end0, *pointj)
+        failures = {}
+        for subject, table, error in results:
+            if error is not None:
+                failures[subject] = error
+            else:
+                tables[subject] = table
+                if self.jet_cache is not None:
+                    # cache a copy, so that changes to the returned jets do not change the cache
+                    self.jet_cache.set(subject, {name: value.copy() for name, value in table.to_arrays().items()})
 
-                # if the distance is better than the 1.5x the mean distance of
-                # point that make up this cluster, then we should merge these two
-                # this metric could be changed to be more robust in the future
-                if dists[j] < 1.5*np.max([temp_end_dists[0], temp_end_dists[j]]):
-                    merge_mask[j] = True
+        jets = {}
+        for subject in subjects:
+            if subject in tables:
+                jets[subject] = tables[subject] if return_table else list(tables[subject].jets)
 
-            # add the point with the most compact intra-cluster distance to the cluster list
-            clust_ends.append(
-                temp_clust_ends[merge_mask][np.argmin(temp_end_dists[merge_mask])])
+        return jets, failures
 
-            if plot:
-                fig, ax = plt.subplots(1, 1, dpi=150)
-                ax.imshow(get_subject_image(subject))
-
-                cir = Point(*end0).buffer(1.5*temp_end_dists[0])
-                ax.plot(*end0, 'yx')
-                ax.plot(*cir.exterior.xy, 'k-', linewidth=0.5)
-                for j in range(1, npoints):
-                    pointj = temp_clust_ends[j]
-                    ax.plot(*pointj, 'kx')
-                    cir = Point(*pointj).buffer(1.5*temp_end_dists[j])
-                    ax.plot(*cir.exterior.xy, 'k-', linewidth=0.5)
-                ax.axis('off')
-                plt.show()
+    def set_jet_cache(self, cache_dir=None, maxsize=128):
+        '''
+            Cache the jets found in each subject by `filter_classifications`, so that they
+            are only calculated once. The cache is kept in memory for the `maxsize` most recently
+            used subjects, and saved to one file per subject in `cache_dir`. The cache files are
+            keyed by the contents of the reduction files and the parameters of the aggregator,
+            so that they are recalculated when the inputs change
 
-            # and remove all the merged points from the list
-            temp_clust_ends = np.delete(temp_clust_ends, merge_mask, axis=0)
-            temp_end_dists = np.delete(temp_end_dists, merge_mask)
+            Inputs
+            ------
+            cache_dir : str
+                directory to save the cache files. If None (default), the jets are
+                only cached in memory
+            maxsize : int
+                number of subjects to keep in memory (default 128)
+        '''
+        key = get_jet_cache_key([self.points_file, self.box_file],
+                                {'geometry_backend': self.geometry_backend})
 
-        return np.asarray(clust_starts), np.asarray(clust_ends)
+        self.jet_cache = JetCache(cache_dir, key, maxsize)
 
-    def filter_classifications(self, subject, plot=False):
+    def filter_classifications(self, subject, plot=False, return_table=False, use_cache=True):
         '''
             Find a list of unique jets in the subject
             and segregate the classifications into each cluster
@@ -1399,6 +1603,12 @@ class Aggregator:
             ------
             subject : int
                 The subject ID in Zooniverse
+            return_table : bool
+                If True, return the `JetTable` holding the jets
+                instead of the list of `Jet` objects
+            use_cache : bool
+                whether to use the jet cache, if it is set (see `set_jet_cache`).
+                The cache is not used when plotting
 
             Outputs
             --------
@@ -1406,6 +1616,19 @@ class Aggregator:
                 List of `Jet` objects that are unique per subject (i.e.,
                 they do not share overlap with other jets in the subject)
         '''
+        if use_cache and self.jet_cache is not None and not plot:
+            arrays = self.jet_cache.get(subject)
+            if arrays is None:
+                arrays = self.filter_classifications(subject, return_table=True, use_cache=False).to_arrays()
+                self.jet_cache.set(subject, arrays)
+
+            table = JetTable.from_arrays(arrays)
+
+            if return_table:
+                return table
+
+            return list(table.jets)
+
         # get the box data and clusters for the two tasks
         data_T1, _ = self.get_box_data(subject, 'T1')
         data_T5, _ = self.get_box_data(subject, 'T5')
@@ -1436,9 +1659,14 @@ class Aggregator:
 
         jets = []
 
+        # corners of the unique jet boxes
+        jet_edges = np.asarray([np.transpose(jeti.exterior.xy)[:4]
+                                for jeti in unique_jets['box']]).reshape((-1, 4, 2))
+
         # for each jet box, find the best start/end points
-        for i, jeti in enumerate(unique_jets['box']):
-            box_points = np.transpose(jeti.exterior.xy)[:4]
+        best_starts = []
+        best_ends = []
+        for i, box_points in enumerate(jet_edges):
 
             dists = []
             # calculate the distance between each start point 
@@ -1460,83 +1688,62 @@ class Aggregator:
                 dists.append(disti)
 
             best_end = unique_ends[np.argmin(dists)]
-            
-            # create the jet parameters (edge, width, height, angle)
-            jet_params = [unique_jets['x'][i],
-                          unique_jets['y'][i],
-                          unique_jets['w'][i],
-                          unique_jets['h'][i],
-                          np.radians(unique_jets['a'][i])]
 
-            jet_obj_i = Jet(subject, best_start, best_end, jeti, jet_params)
+            best_starts.append(best_start)
+            best_ends.append(best_end)
 
-            jet_obj_i.sigma = unique_jets['sigma'][i]
+        # create the parameters (center, width, height, angle) of all the jets
+        jet_params = np.transpose([unique_jets['x'], unique_jets['y'],
+                                   unique_jets['w'], unique_jets['h'],
+                                   np.radians(unique_jets['a'])]).reshape((-1, 5))
 
-            jets.append(jet_obj_i)
+        # and store all the jets in a table (the rotation and size of
+        # each jet is calculated at once)
+        table = JetTable(np.full(len(jet_edges), subject), np.asarray(best_starts).reshape((-1, 2)),
+                         np.asarray(best_ends).reshape((-1, 2)), jet_edges, jet_params)
+        table._boxes[:] = list(unique_jets['box'])
+        table.set_column('sigma', list(unique_jets['sigma']))
 
         # add the raw classifications back to the jet object
-        # loop through the classifications
-        for i in range(len(combined_boxes['x'])):
-            x = combined_boxes['x'][i]
-            y = combined_boxes['y'][i]
-            w = combined_boxes['w'][i]
-            h = combined_boxes['h'][i]
-            a = np.radians(combined_boxes['a'][i])
-
-            # get the box
-            boxi = Polygon(get_box_edges(x, y, w, h, a)[:4])
-
-            # and the find the iou of this box wrt to the
-            # unique jet clusters
-            ious = np.zeros(len(unique_jets['box']))
-            for j, jet in enumerate(unique_jets['box']):
-                ious[j] = boxi.intersection(jet).area/boxi.union(jet).area
-
-            # we're going to find the "best" cluster i.e., the one with the
-            # highest IoU
-            index = np.argmax(ious)
-
-            # and add the raw data to that cluster
-            for key in data_T1.keys():
-                jets[index].box_extracts[key].append(combined_boxes[key][i])
+        # get the corners of all the boxes
+        combined_edges = get_box_edges_batch(combined_boxes['x'], combined_boxes['y'],
+                                             combined_boxes['w'], combined_boxes['h'],
+                                             np.radians(combined_boxes['a']))
+
+        # and the find the iou of each box wrt to the
+        # unique jet clusters
+        # only boxes whose envelopes overlap can have a non-zero IoU,
+        # so use a spatial index to find the candidate pairs
+        rows, cols = get_overlapping_pairs(combined_edges, jet_edges)
+        box_ious = np.zeros((len(combined_edges), len(jet_edges)))
+        box_ious[rows, cols] = get_box_iou(combined_edges[rows], jet_edges[cols],
+                                           backend=self.geometry_backend)
+
+        # we're going to find the "best" cluster for each classification
+        # i.e., the one with the highest IoU and add the raw data to that cluster
+        box_index = np.argmax(box_ious, axis=1) if len(box_ious) > 0 else np.zeros(0, dtype=int)
+        table.set_extracts('box_extracts', box_index, combined_boxes)
 
         # now do the same for the base/end points
-        for i in range(len(combined_starts['x_start'])):
-            x = combined_starts['x_start'][i]
-            y = combined_starts['y_start'][i]
-
-            # and the find the distance between this point and
-            # the cluster points
-            dists = np.zeros(len(jets))
-            for j, jet in enumerate(jets):
-                dists[j] = get_point_distance(x, y, *jet.start)
-
-            # we're going to find the "best" cluster i.e., the one with the
-            # lowest distance
-            index = np.argmin(dists)
+        # find the distance between each point and the cluster points
+        start_dists = get_point_distance_matrix(combined_starts['x_start'], combined_starts['y_start'],
+                                                table.start[:, 0], table.start[:, 1])
 
-            # and add the raw data to that cluster
-            for key in combined_starts.keys():
-                jets[index].start_extracts[key.replace(
-                    '_start', '')].append(combined_starts[key][i])
+        # we're going to find the "best" cluster i.e., the one with the
+        # lowest distance
+        start_index = np.argmin(start_dists, axis=1) if len(start_dists) > 0 else np.zeros(0, dtype=int)
+        table.set_extracts('start_extracts', start_index,
+                           {key.replace('_start', ''): value for key, value in combined_starts.items()})
 
         # same for the ends
-        for i in range(len(combined_ends['x_end'])):
-            x = combined_ends['x_end'][i]
-            y = combined_ends['y_end'][i]
+        end_dists = get_point_distance_matrix(combined_ends['x_end'], combined_ends['y_end'],
+                                              table.end[:, 0], table.end[:, 1])
 
-            dists = np.zeros(len(jets))
-            for j, jet in enumerate(jets):
-                dists[j] = get_point_distance(x, y, *jet.end)
+        end_index = np.argmin(end_dists, axis=1) if len(end_dists) > 0 else np.zeros(0, dtype=int)
+        table.set_extracts('end_extracts', end_index,
+                           {key.replace('_end', ''): value for key, value in combined_ends.items()})
 
-            # we're going to find the "best" cluster i.e., the one with the
-            # lowest distance
-            index = np.argmin(dists)
-
-            # and add the raw data to that cluster
-            for key in combined_ends.keys():
-                jets[index].end_extracts[key.replace(
-                    '_end', '')].append(combined_ends[key][i])
+        jets = list(table.jets)
 
         if plot:
             fig, ax = plt.subplots(1, 1, dpi=150)
@@ -1560,6 +1767,9 @@ class Aggregator:
             plt.tight_layout()
             plt.show()
 
+        if return_table:
+            return table
+
         return jets
 
 
@@ -1568,23 +1778,84 @@ class Jet:
         Oject to hold the data associated with a single jet.
         Contains the start/end positions and associated extracts,
         and the box (as a `shapely.Polygon` object) and corresponding
-        extracts
+        extracts.
+
+        The data is stored in a row of a `JetTable`, and the `Jet` is a view into
+        that row: reading or setting an attribute (including new attributes added
+        with `adding_new_attr`) reads or sets the value in the table.
     '''
 
-    def __init__(self, subject, start, end, box, cluster_values):
-        self.subject = subject
-        self.start = start
-        self.end = end
-        self.box = box
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, subject, start, end, box, cluster_values, rotation=None):
+        '''
+            Inputs
+            ------
+            subject : int
+                Zooniverse subject ID
+            start : numpy.ndarray
+                base start point of the jet
+            end : numpy.ndarray
+                base end point of the jet
+            box : `shapely.Polygon`
+                box corresponding to the jet
+            cluster_values : list
+                box parameters (x, y, w, h, a) of the jet
+            rotation : dict
+                pre-computed rotation of the jet (i.e., the values for this jet from
+                `geometry.autorotate_batch`). If None (default), it is calculated
+                from the box and start point (see `autorotate`)
+        '''
+        if rotation is not None:
+            rotation = {key: [value] for key, value in rotation.items()}
+
+        # create a table with a single row for this jet
+        table = JetTable([subject], [start], [end], [np.transpose(box.exterior.xy)[:4]],
+                         [cluster_values], rotation=rotation)
+        table._boxes[0] = box
+
+        object.__setattr__(self, '_table', table)
+        object.__setattr__(self, '_index', 0)
+
+    @classmethod
+    def from_table(cls, table, index):
+        '''
+            Create a view into a row of a `JetTable`
 
-        self.cluster_values = cluster_values
+            Inputs
+            ------
+            table : `JetTable`
+                table containing the jet data
+            index : int
+                row of the jet in the table
 
-        self.box_extracts = {'x': [], 'y': [], 'w': [], 'h': [], 'a': []}
-        self.start_extracts = {'x': [], 'y': []}
-        self.end_extracts = {'x': [], 'y': []}
+            Outputs
+            -------
+            jet : `Jet`
+                view into row `index` of the table
+        '''
+        jet = object.__new__(cls)
+        object.__setattr__(jet, '_table', table)
+        object.__setattr__(jet, '_index', index)
+        return jet
+
+    def __getattr__(self, name):
+        # private names are not stored in the table. this also
+        # avoids recursion when unpickling (before the slots are set)
+        if name.startswith('_'):
+            raise AttributeError(f"'Jet' object has no attribute '{name}'")
+
+        return self._table.get_value(name, self._index)
+
+    def __setattr__(self, name, value):
+        if name in Jet.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            self._table.set_value(name, self._index, value)
+
+    def __delattr__(self, name):
+        self._table.del_value(name, self._index)
 
-        self.autorotate()
-        
     def adding_new_attr(self, name_attr,value_attr):
         '''
             Add an additional attribute of value value_attr and name name_attr to the jet object 
@@ -1634,18 +1905,11 @@ class Jet:
                 List of `shapely.Polygon` objects corresponding
                 to individual boxes in the extracts
         '''
-        boxes = []
-        for i in range(len(self.box_extracts['x'])):
-            x = self.box_extracts['x'][i]
-            y = self.box_extracts['y'][i]
-            w = self.box_extracts['w'][i]
-            h = self.box_extracts['h'][i]
-            a = np.radians(self.box_extracts['a'][i])
-
-            # get the box
-            boxes.append(Polygon(get_box_edges(x, y, w, h, a)[:4]))
+        edges = get_box_edges_batch(self.box_extracts['x'], self.box_extracts['y'],
+                                    self.box_extracts['w'], self.box_extracts['h'],
+                                    np.radians(self.box_extracts['a']))
 
-        return boxes
+        return [Polygon(edgesi[:4]) for edgesi in edges]
 
     def plot(self, ax, plot_sigma=True):
         '''
@@ -1680,8 +1944,11 @@ class Jet:
         endextplot, = ax.plot(
             end_ext[:, 0], end_ext[:, 1], 'k.', markersize=1.)
         boxextplots = []
-        for box in self.get_extract_boxes():
-            iou = box.intersection(self.box).area/box.union(self.box).area
+        extract_boxes = self.get_extract_boxes()
+        extract_edges = np.asarray([np.transpose(box.exterior.xy)[:4]
+                                   for box in extract_boxes]).reshape((-1, 4, 2))
+        box_ious = get_box_iou_matrix(extract_edges, np.transpose(self.box.exterior.xy)[:4])[:, 0]
+        for box, iou in zip(extract_boxes, box_ious):
             boxextplots.append(
                 ax.plot(*box.exterior.xy, '-', color='limegreen', linewidth=0.5, alpha=0.65*iou+0.05)[0])
 
@@ -1731,37 +1998,19 @@ class Jet:
         '''
         box_points = np.transpose(self.box.exterior.xy)[:4, :]
 
-        # find the distance between each point and the starting base
-        dists = [np.linalg.norm((point - self.start)) for point in box_points]
-        sorted_dists = np.argsort(dists)
-
-        # the base points are the two points closest to the start
-        base_points = np.array(
-            [box_points[sorted_dists[0]], box_points[sorted_dists[1]]])
-
-        # the height points are the next two
-        rolled_points = np.delete(np.roll(box_points, -sorted_dists[0],
-                                          axis=0), 0, axis=0)
-
-        # we want to make sure that the order of the points
-        # is in such a way that the point closest to the base
-        # comes first -- this will ensure that the next point is
-        # along the height line
-        if np.linalg.norm(rolled_points[0, :]-base_points[1, :]) == 0:
-            height_points = rolled_points[:2]
-        else:
-            height_points = rolled_points[::-1][:2]
+        rotation = autorotate_batch(box_points[np.newaxis], np.asarray(self.start)[np.newaxis])
+        self.set_rotation(**{key: value[0] for key, value in rotation.items()})
 
+    def set_rotation(self, base_points, height_points, angle, width, height):
+        '''
+            Set the rotation and size of the jet (see `geometry.autorotate_batch`)
+        '''
         self.base_points = base_points
         self.height_points = height_points
 
-        # also figure out the angle and additional size metadata
-        # the angle is the angle between the height points and the base
-        dh = self.height_points[1] - self.height_points[0]
-        self.angle = np.arctan2(dh[0], -dh[1])
-
-        self.height = np.linalg.norm(dh)
-        self.width = np.linalg.norm(self.base_points[1] - self.base_points[0])
+        self.angle = angle
+        self.height = height
+        self.width = width
 
     def get_width_height_pairs(self):
         '''
@@ -1777,3 +2026,504 @@ class Jet:
         '''
 
         return self.base_points, self.height_points
+
+
+def _make_column(values):
+    '''
+        Convert a list of values to a column of a `JetTable`. Values which have the
+        same numeric (or datetime) type and shape are stored as a typed array with one
+        row per value. Otherwise, the values are stored as-is in an object array
+    '''
+    arrays = [np.asarray(value) for value in values]
+
+    if len(arrays) > 0 and all(array.dtype == arrays[0].dtype and array.shape == arrays[0].shape
+                               for array in arrays) and arrays[0].dtype.kind in 'biufcmM':
+        return np.asarray(arrays, dtype=arrays[0].dtype)
+
+    column = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        column[i] = value
+    return column
+
+
+def _take_ragged(offsets, values, indices):
+    '''
+        Select rows from a ragged (CSR) group of extracts
+
+        Inputs
+        ------
+        offsets : numpy.ndarray
+            Start index of each row in the flat arrays (length is number of rows + 1)
+        values : dict
+            Dictionary of flat arrays (one for each extract key)
+        indices : numpy.ndarray
+            rows to select
+
+        Outputs
+        -------
+        offsets : numpy.ndarray
+            offsets for the selected rows
+        values : dict
+            flat arrays for the selected rows
+    '''
+    starts = offsets[:-1][indices]
+    lengths = offsets[1:][indices] - starts
+
+    new_offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+
+    # index of each selected element in the flat arrays
+    flat = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+
+    return new_offsets, {key: value[flat] for key, value in values.items()}
+
+
+class JetTable:
+    '''
+        Columnar storage for a set of jets. Each property of the jets is stored
+        as an array with one row per jet, and the extracts are stored as flat arrays
+        with the row offsets into them (CSR layout). `Jet` objects are views
+        into a row of the table.
+
+        Core columns (always set):
+            - subject : (N,) Zooniverse subject ID
+            - start, end : (N, 2) base start/end points
+            - corners : (N, 4, 2) box corners
+            - cluster_values : (N, 5) box parameters (x, y, w, h, a)
+            - base_points, height_points, angle, width, height : rotation
+              of the box (see `geometry.autorotate_batch`)
+
+        Additional columns (e.g., sigma, time, solar_H) are stored in `fields`,
+        with `field_set` holding which rows have a value for that field
+    '''
+
+    # keys for each group of extracts
+    EXTRACT_KEYS = {'box_extracts': ['x', 'y', 'w', 'h', 'a'],
+                    'start_extracts': ['x', 'y'],
+                    'end_extracts': ['x', 'y']}
+
+    CORE_COLUMNS = ['subject', 'start', 'end', 'corners', 'cluster_values',
+                    'base_points', 'height_points', 'angle', 'width', 'height']
+
+    def __init__(self, subject, start, end, corners, cluster_values, rotation=None):
+        '''
+            Inputs
+            ------
+            subject : numpy.ndarray
+                Zooniverse subject ID for each jet
+            start : numpy.ndarray
+                (N, 2) base start points
+            end : numpy.ndarray
+                (N, 2) base end points
+            corners : numpy.ndarray
+                (N, 4, 2) corners of the jet boxes
+            cluster_values : numpy.ndarray
+                (N, 5) box parameters (x, y, w, h, a) of each jet
+            rotation : dict
+                pre-computed rotation of the jets (see `geometry.autorotate_batch`).
+                If None (default), it is calculated from the box corners and start points
+        '''
+        self.subject = np.asarray(subject).reshape(-1)
+        self.start = np.asarray(start, dtype=float).reshape((-1, 2))
+        self.end = np.asarray(end, dtype=float).reshape((-1, 2))
+        self.corners = np.asarray(corners, dtype=float).reshape((-1, *np.shape(corners)[-2:]))[:, :4]
+        self.cluster_values = np.asarray(cluster_values, dtype=float).reshape((-1, 5))
+
+        if rotation is None:
+            rotation = autorotate_batch(self.corners, self.start)
+
+        self.base_points = np.asarray(rotation['base_points'], dtype=float).reshape((-1, 2, 2))
+        self.height_points = np.asarray(rotation['height_points'], dtype=float).reshape((-1, 2, 2))
+        self.angle = np.asarray(rotation['angle'], dtype=float).reshape(-1)
+        self.width = np.asarray(rotation['width'], dtype=float).reshape(-1)
+        self.height = np.asarray(rotation['height'], dtype=float).reshape(-1)
+
+        njets = len(self.subject)
+
+        # the extracts are empty to start with
+        self.extract_offsets = {}
+        self.extracts = {}
+        for name, keys in JetTable.EXTRACT_KEYS.items():
+            self.extract_offsets[name] = np.zeros(njets + 1, dtype=np.int64)
+            self.extracts[name] = {key: np.zeros(0) for key in keys}
+
+        self.fields = {}
+        self.field_set = {}
+
+        # shapely Polygons for the boxes are only created when needed
+        self._boxes = np.full(njets, None, dtype=object)
+
+    def __len__(self):
+        return len(self.subject)
+
+    def __getitem__(self, index):
+        return Jet.from_table(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Jet.from_table(self, index)
+
+    @property
+    def jets(self):
+        '''
+            Object array of `Jet` views into each row of the table
+        '''
+        jets = np.empty(len(self), dtype=object)
+        for index in range(len(self)):
+            jets[index] = Jet.from_table(self, index)
+        return jets
+
+    def get_value(self, name, index):
+        '''
+            Get the value of a property for a single jet
+
+            Inputs
+            ------
+            name : str
+                name of the property (e.g., start, box, box_extracts, sigma)
+            index : int
+                row of the jet
+
+            Outputs
+            -------
+            value : object
+                value of the property. Raises an `AttributeError` if the property
+                has not been set for this jet
+        '''
+        if name in JetTable.CORE_COLUMNS:
+            return getattr(self, name)[index]
+
+        if name == 'box':
+            if self._boxes[index] is None:
+                self._boxes[index] = Polygon(self.corners[index])
+            return self._boxes[index]
+
+        if name in JetTable.EXTRACT_KEYS:
+            start, end = self.extract_offsets[name][index:index + 2]
+            return {key: value[start:end] for key, value in self.extracts[name].items()}
+
+        if name in self.fields and self.field_set[name][index]:
+            return self.fields[name][index]
+
+        raise AttributeError(f"'Jet' object has no attribute '{name}'")
+
+    def set_value(self, name, index, value):
+        '''
+            Set the value of a property for a single jet. See `get_value`
+        '''
+        if name == 'box':
+            self.corners[index] = np.transpose(value.exterior.xy)[:4]
+            self._boxes[index] = value
+        elif name in JetTable.CORE_COLUMNS:
+            getattr(self, name)[index] = value
+            if name == 'corners':
+                self._boxes[index] = None
+        elif name in JetTable.EXTRACT_KEYS:
+            self._set_row_extracts(name, index, value)
+        else:
+            self._set_field_value(name, index, value)
+
+    def del_value(self, name, index):
+        '''
+            Remove the value of an additional property for a single jet
+        '''
+        if name not in self.fields or not self.field_set[name][index]:
+            raise AttributeError(f"'Jet' object has no attribute '{name}'")
+
+        self.field_set[name][index] = False
+
+    def _set_field_value(self, name, index, value):
+        if name not in self.fields:
+            self.fields[name] = _make_column([value] * len(self))
+            self.field_set[name] = np.zeros(len(self), dtype=bool)
+
+        column = self.fields[name]
+        array = np.asarray(value)
+
+        if column.dtype != object and (array.dtype != column.dtype or array.shape != column.shape[1:]):
+            # the new value does not fit the column, so store the values as objects
+            column = _make_column(list(column))
+            self.fields[name] = column
+
+        column[index] = value
+        self.field_set[name][index] = True
+
+    def get_column(self, name):
+        '''
+            Get the values of a property for all the jets
+
+            Inputs
+            ------
+            name : str
+                name of the property (a core column or an additional field)
+
+            Outputs
+            -------
+            values : numpy.ndarray
+                value for each jet. For additional fields, rows which do not
+                have a value are undefined (see `has_value`)
+        '''
+        if name in JetTable.CORE_COLUMNS:
+            return getattr(self, name)
+
+        return self.fields[name]
+
+    def has_value(self, name):
+        '''
+            Boolean mask of the jets which have a value for the property `name`
+        '''
+        if name in JetTable.CORE_COLUMNS or name in JetTable.EXTRACT_KEYS or name == 'box':
+            return np.ones(len(self), dtype=bool)
+
+        if name not in self.fields:
+            return np.zeros(len(self), dtype=bool)
+
+        return self.field_set[name].copy()
+
+    def set_column(self, name, values, mask=None):
+        '''
+            Set an additional property for all the jets at once
+
+            Inputs
+            ------
+            name : str
+                name of the property
+            values : list
+                value for each jet
+            mask : numpy.ndarray
+                boolean mask of jets which have a value (default: all the jets).
+                The values for the other jets are ignored
+        '''
+        if mask is None:
+            mask = np.ones(len(self), dtype=bool)
+        mask = np.asarray(mask, dtype=bool)
+
+        # fill in the missing rows with a valid value so that
+        # the column can be typed
+        values = list(values)
+        if np.any(mask):
+            fill = values[np.argmax(mask)]
+            values = [value if maski else fill for value, maski in zip(values, mask)]
+
+        self.fields[name] = _make_column(values)
+        self.field_set[name] = mask.copy()
+
+    def set_extracts(self, name, assignment, values):
+        '''
+            Set a group of extracts for all the jets at once
+
+            Inputs
+            ------
+            name : str
+                extract group (one of `box_extracts`, `start_extracts` or `end_extracts`)
+            assignment : numpy.ndarray
+                index of the jet each extract belongs to
+            values : dict
+                Dictionary with the extract key (e.g., x, y) and the value of each extract
+        '''
+        assignment = np.asarray(assignment, dtype=int).reshape(-1)
+
+        # sort by jet (keeping the order of extracts within each jet)
+        order = np.argsort(assignment, kind='stable')
+
+        offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(self)), out=offsets[1:])
+
+        self.extract_offsets[name] = offsets
+        self.extracts[name] = {key: np.asarray(values[key]).reshape(-1)[order]
+                               for key in JetTable.EXTRACT_KEYS[name]}
+
+    def _set_row_extracts(self, name, index, values):
+        offsets = self.extract_offsets[name]
+        lengths = np.diff(offsets)
+        lengths[index] = len(values[JetTable.EXTRACT_KEYS[name][0]])
+
+        start, end = offsets[index:index + 2]
+        for key in JetTable.EXTRACT_KEYS[name]:
+            flat = self.extracts[name][key]
+            self.extracts[name][key] = np.concatenate([flat[:start], np.asarray(values[key]).reshape(-1),
+                                                       flat[end:]])
+
+        self.extract_offsets[name] = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.extract_offsets[name][1:])
+
+    def to_arrays(self):
+        '''
+            Convert the table to a dictionary of arrays (e.g., to save with `numpy.savez`).
+            Additional fields that are stored as objects (e.g., strings or arrays of
+            different shapes) are not included
+
+            Outputs
+            -------
+            arrays : dict
+                Dictionary with the name of each column and the `numpy.ndarray` for it
+        '''
+        arrays = {name: getattr(self, name) for name in JetTable.CORE_COLUMNS}
+
+        for name, keys in JetTable.EXTRACT_KEYS.items():
+            arrays[f'{name}.offsets'] = self.extract_offsets[name]
+            for key in keys:
+                arrays[f'{name}.{key}'] = self.extracts[name][key]
+
+        for name, column in self.fields.items():
+            if column.dtype != object:
+                arrays[f'fields.{name}'] = column
+                arrays[f'field_set.{name}'] = self.field_set[name]
+
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        '''
+            Create a table from the output of `to_arrays`. The arrays are copied,
+            so that changes to the table do not change the input
+
+            Inputs
+            ------
+            arrays : dict
+                Dictionary with the name of each column and the `numpy.ndarray` for it
+
+            Outputs
+            -------
+            table : `JetTable`
+                the table
+        '''
+        table = cls(np.array(arrays['subject']), np.array(arrays['start']), np.array(arrays['end']),
+                    np.array(arrays['corners']), np.array(arrays['cluster_values']),
+                    rotation={key: np.array(arrays[key]) for key in ['base_points', 'height_points',
+                                                                     'angle', 'width', 'height']})
+
+        for name, keys in JetTable.EXTRACT_KEYS.items():
+            table.extract_offsets[name] = np.array(arrays[f'{name}.offsets'])
+            table.extracts[name] = {key: np.array(arrays[f'{name}.{key}']) for key in keys}
+
+        for name in arrays.keys():
+            if name.startswith('fields.'):
+                field = name.replace('fields.', '', 1)
+                table.fields[field] = np.array(arrays[name])
+                table.field_set[field] = np.array(arrays[f'field_set.{field}'])
+
+        return table
+
+    def take(self, indices):
+        '''
+            Create a new table from a subset of the rows
+
+            Inputs
+            ------
+            indices : numpy.ndarray
+                rows to select (integer indices or a boolean mask)
+
+            Outputs
+            -------
+            table : `JetTable`
+                table containing the selected jets (in the order of `indices`)
+        '''
+        indices = np.arange(len(self))[indices]
+
+        table = JetTable(self.subject[indices], self.start[indices], self.end[indices],
+                         self.corners[indices], self.cluster_values[indices],
+                         rotation={'base_points': self.base_points[indices],
+                                   'height_points': self.height_points[indices],
+                                   'angle': self.angle[indices],
+                                   'width': self.width[indices],
+                                   'height': self.height[indices]})
+
+        for name in JetTable.EXTRACT_KEYS:
+            table.extract_offsets[name], table.extracts[name] = _take_ragged(
+                self.extract_offsets[name], self.extracts[name], indices)
+
+        for name in self.fields:
+            table.fields[name] = self.fields[name][indices]
+            table.field_set[name] = self.field_set[name][indices]
+
+        table._boxes = self._boxes[indices]
+
+        return table
+
+    @classmethod
+    def concatenate(cls, tables):
+        '''
+            Join a list of tables together
+
+            Inputs
+            ------
+            tables : list
+                list of `JetTable` objects
+
+            Outputs
+            -------
+            table : `JetTable`
+                table with the rows of all the input tables (in order)
+        '''
+        tables = list(tables)
+
+        if len(tables) == 0:
+            return cls([], np.zeros((0, 2)), np.zeros((0, 2)), np.zeros((0, 4, 2)), np.zeros((0, 5)),
+                       rotation={'base_points': np.zeros((0, 2, 2)), 'height_points': np.zeros((0, 2, 2)),
+                                 'angle': [], 'width': [], 'height': []})
+
+        def join(name):
+            return np.concatenate([getattr(tablei, name) for tablei in tables])
+
+        table = cls(join('subject'), join('start'), join('end'), join('corners'), join('cluster_values'),
+                    rotation={key: join(key) for key in ['base_points', 'height_points', 'angle', 'width', 'height']})
+
+        for name in JetTable.EXTRACT_KEYS:
+            lengths = np.concatenate([np.diff(tablei.extract_offsets[name]) for tablei in tables])
+            np.cumsum(lengths, out=table.extract_offsets[name][1:])
+            table.extracts[name] = {key: np.concatenate([tablei.extracts[name][key] for tablei in tables])
+                                    for key in JetTable.EXTRACT_KEYS[name]}
+
+        names = []
+        for tablei in tables:
+            names.extend([name for name in tablei.fields if name not in names])
+
+        for name in names:
+            columns = [tablei.fields[name] if name in tablei.fields else None for tablei in tables]
+            typed = [column for column in columns if column is not None]
+            if all(column.dtype != object and column.dtype == typed[0].dtype and
+                   column.shape[1:] == typed[0].shape[1:] for column in typed):
+                table.fields[name] = np.concatenate(
+                    [column if column is not None else np.zeros((len(tablei), *typed[0].shape[1:]), dtype=typed[0].dtype)
+                     for column, tablei in zip(columns, tables)])
+            else:
+                values = []
+                for column, tablei in zip(columns, tables):
+                    values.extend(list(column) if column is not None else [None] * len(tablei))
+                table.fields[name] = _make_column(values)
+                if table.fields[name].dtype != object:
+                    table.fields[name] = table.fields[name].astype(object)
+
+            table.field_set[name] = np.concatenate([tablei.field_set[name] if name in tablei.fields
+                                                    else np.zeros(len(tablei), dtype=bool) for tablei in tables])
+
+        table._boxes = np.concatenate([tablei._boxes for tablei in tables])
+
+        return table
+
+    @classmethod
+    def from_jets(cls, jets):
+        '''
+            Create a table from a list of `Jet` objects (views into other tables)
+
+            Inputs
+            ------
+            jets : list
+                list of `Jet` objects
+
+            Outputs
+            -------
+            table : `JetTable`
+                table with a copy of the data for each jet (in order)
+        '''
+        # group consecutive jets from the same table together
+        # so that they can be copied in one go
+        parts = []
+        for jet in jets:
+            if len(parts) > 0 and parts[-1][0] is jet._table:
+                parts[-1][1].append(jet._index)
+            else:
+                parts.append((jet._table, [jet._index]))
+
+        return cls.concatenate([table.take(np.asarray(indices, dtype=int)) for table, indices in parts])
@@ -0,0 +1,68 @@
+'''
+    Compare the methods used to calculate the IoU matrix between a set of boxes:
+    the per-pair `shapely.Polygon` loop (previous implementation) and the two
+    vectorized geometry backends in `aggregation.geometry` (numpy and shapely)
+
+    Run from the BoxTheJets/ folder:
+        python3 scripts/benchmark_geometry.py [--boxes N [N ...]]
+'''
+import argparse
+import sys
+import time
+import numpy as np
+from shapely.geometry import Polygon
+
+sys.path.append('.')
+
+from aggregation.geometry import get_box_edges_batch, get_box_iou_matrix, GEOMETRY_BACKENDS
+
+
+def get_iou_matrix_loop(corners):
+    '''
+        Calculate the IoU matrix pair by pair with shapely Polygons
+    '''
+    boxes = [Polygon(cornersi[:4]) for cornersi in corners]
+    iou = np.zeros((len(boxes), len(boxes)))
+    for j, boxj in enumerate(boxes):
+        for k, boxk in enumerate(boxes):
+            iou[j, k] = boxj.intersection(boxk).area / boxj.union(boxk).area
+    return iou
+
+
+def create_boxes(nboxes, seed=0):
+    '''
+        Create a set of random rotated boxes in a 1920x1920 image.
+        The boxes are bunched together so that a fraction of them overlap
+    '''
+    rng = np.random.default_rng(seed)
+
+    x = rng.uniform(600, 1200, nboxes)
+    y = rng.uniform(600, 1200, nboxes)
+    w = rng.uniform(20, 300, nboxes)
+    h = rng.uniform(20, 300, nboxes)
+    a = np.radians(rng.uniform(-180, 180, nboxes))
+
+    return get_box_edges_batch(x, y, w, h, a)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--boxes', type=int, nargs='+', default=[50, 200, 500])
+    args = parser.parse_args()
+
+    for nboxes in args.boxes:
+        corners = create_boxes(nboxes)
+        print(f"{nboxes} boxes ({nboxes**2} pairs)")
+
+        start = time.perf_counter()
+        iou_loop = get_iou_matrix_loop(corners)
+        time_loop = time.perf_counter() - start
+        print(f"    {'Polygon loop':15s}: {time_loop:.3f} s")
+
+        for backend in GEOMETRY_BACKENDS:
+            start = time.perf_counter()
+            iou = get_box_iou_matrix(corners, corners, backend=backend)
+            time_backend = time.perf_counter() - start
+
+            print(f"    {backend:15s}: {time_backend:.3f} s  speedup: {time_loop / time_backend:.1f}x  "
+                  f"max difference: {np.max(np.abs(iou - iou_loop)):.1e}")
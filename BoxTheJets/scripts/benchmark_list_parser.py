@@ -0,0 +1,89 @@
+'''
+    Compare the bulk list parser in `aggregation.list_parser` against
+    `ast.literal_eval` on the list columns of an extract file.
+
+    Run from the BoxTheJets/ folder:
+        python3 scripts/benchmark_list_parser.py [extract_file] [--rows N]
+
+    If no extract file is given, a synthetic point extract file with N rows
+    (default 100000) is generated in the same format as the panoptes extractor output
+'''
+import argparse
+import ast
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+from astropy.io import ascii
+
+sys.path.append('.')
+
+from aggregation.list_parser import parse_list_column
+
+
+def create_extract_file(filename, nrows, seed=0):
+    '''
+        Create a synthetic point extract file where each classification
+        has a start point in one frame and an end point in one frame
+    '''
+    rng = np.random.default_rng(seed)
+
+    cols = [f'data.frame{frame}.{task}_{tool}_{key}' for task in ['T1', 'T5']
+            for frame in range(15) for tool in ['tool0', 'tool1'] for key in ['x', 'y']]
+
+    with open(filename, 'w') as outfile:
+        outfile.write(','.join(['classification_id', 'task', 'subject_id', *cols]) + '\n')
+        for i in range(nrows):
+            task = 'T1' if rng.random() < 0.8 else 'T5'
+            row = dict.fromkeys(cols, '')
+            for tool, frame in zip(['tool0', 'tool1'], rng.integers(0, 15, 2)):
+                for key in ['x', 'y']:
+                    row[f'data.frame{frame}.{task}_{tool}_{key}'] = f'"[{rng.uniform(0, 1920)!r}]"'
+            outfile.write(','.join([str(i), task, str(i // 20), *row.values()]) + '\n')
+
+
+def parse_literal_eval(column):
+    '''
+        Parse the column cell by cell (the previous implementation)
+    '''
+    parsed = []
+    for cell in column.filled('').tolist():
+        try:
+            parsed.append(np.asarray(ast.literal_eval(cell)))
+        except (ValueError, SyntaxError):
+            parsed.append(np.asarray([]))
+    return parsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('extract_file', nargs='?', default=None)
+    parser.add_argument('--rows', type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.extract_file is None:
+        tmpdir = tempfile.mkdtemp()
+        extract_file = os.path.join(tmpdir, 'point_extractor_by_frame_benchmark.csv')
+        print(f"Creating synthetic extract file with {args.rows} rows")
+        create_extract_file(extract_file, args.rows)
+    else:
+        extract_file = args.extract_file
+
+    data = ascii.read(extract_file, delimiter=',')
+    cols = [col for col in data.colnames if col.startswith('data.') and data[col].dtype.kind == 'U']
+    print(f"Parsing {len(cols)} list columns with {len(data)} rows")
+
+    start = time.perf_counter()
+    for col in cols:
+        parse_literal_eval(data[col])
+    time_literal = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for col in cols:
+        parse_list_column(data[col])
+    time_bulk = time.perf_counter() - start
+
+    print(f"ast.literal_eval:  {time_literal:.3f} s")
+    print(f"parse_list_column: {time_bulk:.3f} s")
+    print(f"Speedup: {time_literal / time_bulk:.1f}x")
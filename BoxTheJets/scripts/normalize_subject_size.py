@@ -8,7 +8,11 @@ from multiprocessing import Pool
 import tqdm
 import signal
 import time
-import ast
+import sys
+
+sys.path.append('.')
+
+from aggregation.list_parser import parse_list_column, format_list_column
 
 FETCH_FROM_PANOPTES = False
 
@@ -133,8 +137,39 @@ def get_scales_set(save=True):
     return table
 
 
+def scale_list_column(column, scales):
+    '''
+        Divide each value in a column of list strings by the scale
+        for the corresponding row
+
+        Inputs
+        ------
+        column : astropy.table.Column
+            Column of list strings from the extract file
+        scales : numpy.ndarray
+            Scale for each row in the column
+
+        Outputs
+        -------
+        cells : list
+            Scaled list strings for each row
+        has_data : numpy.ndarray
+            Boolean mask for the rows which have data in the column
+    '''
+    values, offsets = parse_list_column(column)
+    lengths = np.diff(offsets)
+
+    # apply the scaling for each value based on the row it belongs to
+    values_scaled = values / np.repeat(scales, lengths)
+
+    return format_list_column(values_scaled, offsets), lengths > 0
+
+
 def modify_extracts(table, point_extracts='extracts/point_extractor_by_frame_box_the_jets.csv',
                     box_extracts='extracts/shape_extractor_rotateRectangle_box_the_jets.csv'):
+    # find the scale table row for each subject
+    scale_rows = {subject: i for i, subject in enumerate(table['subject_id'])}
+
     points_data = ascii.read(point_extracts, delimiter=',')
     points_data_sc = points_data.copy()
 
@@ -147,39 +182,27 @@ def modify_extracts(table, point_extracts='extracts/point_extractor_by_frame_box
                     col = f'data.frame{frame}.{task}_{tool}_{key}'
                     points_data_sc[col] = points_data_sc[col].astype('<U40')
 
-    # loop through all the subjects
-    for row in tqdm.tqdm(table, desc='Processing points'):
-        subject = row['subject_id']
-
-        # find the relevant subjects in the point extractor
-        mask = np.where(points_data['subject_id'] == subject)[0]
-
-        # for each extract
-        for row_ind in mask:
-            task = points_data['task'][row_ind]
-
-            # for each frame, tool and data value (x,y)
-            for frame in range(15):
-                scale = row[f'frame_{frame}_scale']
-                for tool in ['tool0', 'tool1']:
-                    for key in ['x', 'y']:
+    # only the extracts for subjects with a known scale are modified
+    rows = np.asarray([scale_rows.get(subject, -1) for subject in points_data['subject_id']])
+    has_scale = rows > -1
 
-                        # get the extract
-                        col = f'data.frame{frame}.{task}_{tool}_{key}'
-                        data = points_data[col][row_ind]
+    # for each task, frame, tool and data value (x,y)
+    for task in tqdm.tqdm(['T1', 'T5'], desc='Processing points'):
+        task_mask = has_scale & (np.asarray(points_data['task']) == task)
+        for frame in range(15):
+            scales = np.ones(len(points_data))
+            scales[has_scale] = np.asarray(table[f'frame_{frame}_scale'], dtype=float)[rows[has_scale]]
+            for tool in ['tool0', 'tool1']:
+                for key in ['x', 'y']:
+                    col = f'data.frame{frame}.{task}_{tool}_{key}'
 
-                        # check if the entry has data
-                        try:
-                            # convert to list
-                            data = ast.literal_eval(data)
+                    # apply the scaling to the whole column
+                    cells, has_data = scale_list_column(points_data[col], scales)
 
-                            # apply the scaling
-                            data_scaled = [val / scale for val in data]
+                    # and save the rows with data back to the scaled table
+                    update = task_mask & has_data
+                    points_data_sc[col][update] = np.asarray(cells)[update]
 
-                            # and save it back to the scaled table
-                            points_data_sc[col][row_ind] = str(data_scaled)
-                        except ValueError:
-                            continue
     points_data_sc.write(point_extracts.replace('.csv', '_scaled.csv'), delimiter=',', overwrite=True)
 
     # repeat for the box data
@@ -195,39 +218,23 @@ def modify_extracts(table, point_extracts='extracts/point_extractor_by_frame_box
                     col = f'data.frame{frame}.{task}_{tool}_{key}'
                     box_data_sc[col] = box_data_sc[col].astype('<U40')
 
-    # loop through all the subjects
-    for row in tqdm.tqdm(table, desc='Processing box'):
-        subject = row['subject_id']
-
-        # find the relevant subjects in the point extractor
-        mask = np.where(box_data['subject_id'] == subject)[0]
-
-        # for each extract
-        for row_ind in mask:
-            task = box_data['task'][row_ind]
+    rows = np.asarray([scale_rows.get(subject, -1) for subject in box_data['subject_id']])
+    has_scale = rows > -1
 
-            # for each frame, tool and data value (x,y)
-            for frame in range(15):
-                scale = row[f'frame_{frame}_scale']
-                for tool in ['tool2']:
-                    for key in ['x', 'y', 'width', 'height']:
-
-                        # get the extract
-                        col = f'data.frame{frame}.{task}_{tool}_{key}'
-                        data = box_data_sc[col][row_ind]
-
-                        # check if the entry has data
-                        try:
-                            # convert to list
-                            data = ast.literal_eval(data)
+    # for each task, frame, tool and data value (x, y, width, height)
+    for task in tqdm.tqdm(['T1', 'T5'], desc='Processing box'):
+        task_mask = has_scale & (np.asarray(box_data['task']) == task)
+        for frame in range(15):
+            scales = np.ones(len(box_data))
+            scales[has_scale] = np.asarray(table[f'frame_{frame}_scale'], dtype=float)[rows[has_scale]]
+            for tool in ['tool2']:
+                for key in ['x', 'y', 'width', 'height']:
+                    col = f'data.frame{frame}.{task}_{tool}_{key}'
 
-                            # apply the scaling
-                            data_scaled = [val / scale for val in data]
+                    cells, has_data = scale_list_column(box_data[col], scales)
 
-                            # and save it back to the original array
-                            box_data_sc[col][row_ind] = str(data_scaled)
-                        except ValueError:
-                            continue
+                    update = task_mask & has_data
+                    box_data_sc[col][update] = np.asarray(cells)[update]
 
     box_data_sc.write(box_extracts.replace('.csv', '_scaled.csv'), format='csv', overwrite=True)
 
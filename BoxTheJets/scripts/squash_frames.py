@@ -1,6 +1,19 @@
 import numpy as np
 from astropy.io import ascii
-import ast
+import sys
+
+sys.path.append('.')
+
+from aggregation.list_parser import parse_list_column
+
+
+def get_T1_rows(data):
+    '''
+        Find the row of the T1 extract for each classification
+    '''
+    return {classification_id: row for row, (classification_id, task) in
+            enumerate(zip(data['classification_id'], data['task'])) if task == 'T1'}
+
 
 ## point extractor
 file = 'extracts/point_extractor_by_frame_box_the_jets_scaled.csv'
@@ -34,6 +47,7 @@ for k, col0k in enumerate(col0):
 col0 = sorted([i for i in colnames if 'frame0.T1' in i])
 
 data_merged = data.copy()
+T1_rows = get_T1_rows(data_merged)
 
 for k, col0k in enumerate(col0):
     
@@ -46,20 +60,20 @@ for k, col0k in enumerate(col0):
     # find the rows where there is data
     mask = np.where(np.asarray(data_merged[colT5][:].filled()) != 'N/A')[0]
 
+    # parse the T1 and T5 columns in one go (keeping the type of each value in the cell)
+    valuesT1, offsetsT1 = parse_list_column(data_merged[col0k], dtype=object)
+    valuesT5, offsetsT5 = parse_list_column(data_merged[colT5], dtype=object)
+
     for row in mask:
         classification_id = data_merged['classification_id'][row]
-        row_T1 = np.where((data_merged['classification_id'][:]==classification_id)&(data_merged['task'][:]=='T1'))[0][0]
-        try:
-            dataT1 = ast.literal_eval(data_merged[col0k][row_T1])
-        except ValueError:
-            dataT1 = []
-
-        dataT5 = ast.literal_eval(data_merged[colT5][row])
+        row_T1 = T1_rows[classification_id]
+        dataT1 = valuesT1[offsetsT1[row_T1]:offsetsT1[row_T1 + 1]]
+        dataT5 = valuesT5[offsetsT5[row]:offsetsT5[row + 1]]
 
         # combine the T5 info with T1
         outdata = []
-        outdata.extend(dataT1)
-        outdata.extend(dataT5)
+        outdata.extend(dataT1.tolist())
+        outdata.extend(dataT5.tolist())
 
         # move those rows to frame0
         data_merged[col0[k]][row_T1] = str(outdata)
@@ -94,6 +108,7 @@ for k, col0k in enumerate(col0):
 
 # get the col names for each variable in frame0 in T1
 data_merged = data.copy()
+T1_rows = get_T1_rows(data_merged)
 col0 = sorted([i for i in colnames if 'frame0.T1' in i])
 for k, col0k in enumerate(col0):
     
@@ -106,20 +121,20 @@ for k, col0k in enumerate(col0):
     # find the rows where there is data
     mask = np.where(np.asarray(data_merged[colT5][:].filled()) != 'N/A')[0]
 
+    # parse the T1 and T5 columns in one go (keeping the type of each value in the cell)
+    valuesT1, offsetsT1 = parse_list_column(data_merged[col0k], dtype=object)
+    valuesT5, offsetsT5 = parse_list_column(data_merged[colT5], dtype=object)
+
     for row in mask:
         classification_id = data_merged['classification_id'][row]
-        row_T1 = np.where((data_merged['classification_id'][:]==classification_id)&(data_merged['task'][:]=='T1'))[0][0]
-        try:
-            dataT1 = ast.literal_eval(data_merged[col0k][row_T1])
-        except ValueError:
-            dataT1 = []
-
-        dataT5 = ast.literal_eval(data_merged[colT5][row])
+        row_T1 = T1_rows[classification_id]
+        dataT1 = valuesT1[offsetsT1[row_T1]:offsetsT1[row_T1 + 1]]
+        dataT5 = valuesT5[offsetsT5[row]:offsetsT5[row + 1]]
 
         # combine the T5 info with T1
         outdata = []
-        outdata.extend(dataT1)
-        outdata.extend(dataT5)
+        outdata.extend(dataT1.tolist())
+        outdata.extend(dataT5.tolist())
 
         # move those rows to the T1 array
         data_merged[col0[k]][row_T1] = str(outdata)
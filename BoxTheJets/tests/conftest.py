@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the tests are run from the repository, so add the BoxTheJets folder to the path
+# to import the aggregation package (in the same way as the scripts)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
@@ -0,0 +1,115 @@
+'''
+    Check the box IoUs from `aggregation.geometry` against the
+    `shapely.Polygon` intersection and union of each pair of boxes
+'''
+import numpy as np
+import pytest
+from shapely.geometry import Polygon
+
+from aggregation.geometry import get_box_edges_batch, get_box_iou, get_box_iou_matrix, GEOMETRY_BACKENDS
+
+TOLERANCE = 1.e-9
+
+
+def get_shapely_iou(corners1, corners2):
+    '''
+        IoU of one pair of boxes using shapely Polygons (as in the original code)
+    '''
+    box1 = Polygon(corners1[:4])
+    box2 = Polygon(corners2[:4])
+    return box1.intersection(box2).area / box1.union(box2).area
+
+
+def get_shapely_iou_matrix(corners1, corners2):
+    return np.asarray([[get_shapely_iou(c1, c2) for c2 in corners2] for c1 in corners1]).reshape(
+        (len(corners1), len(corners2)))
+
+
+def make_box(x, y, w, h, a=0.):
+    '''
+        Corners of a single box (see `get_box_edges_batch`), with the angle in degrees
+    '''
+    return get_box_edges_batch(x, y, w, h, np.radians(a))[0]
+
+
+# pairs of boxes where the intersection has shared or overlapping edges and corners
+DEGENERATE_PAIRS = {
+    'identical': (make_box(100, 100, 50, 80, 30), make_box(100, 100, 50, 80, 30)),
+    'identical_unrotated': (make_box(100, 100, 50, 80), make_box(100, 100, 50, 80)),
+    'shared_edge': (make_box(100, 100, 50, 80), make_box(150, 100, 50, 80)),
+    'shared_partial_edge': (make_box(100, 100, 50, 80), make_box(150, 140, 50, 80)),
+    'shared_corner': (make_box(100, 100, 50, 80), make_box(150, 180, 50, 80)),
+    'overlapping_edges': (make_box(100, 100, 50, 80), make_box(120, 100, 50, 80)),
+    'contained': (make_box(100, 100, 100, 100), make_box(120, 130, 20, 30)),
+    'contained_rotated': (make_box(100, 100, 100, 100), make_box(130, 130, 20, 30, 45)),
+    'contained_touching': (make_box(100, 100, 100, 100), make_box(100, 100, 20, 30)),
+    'rotated_90': (make_box(100, 100, 50, 80), make_box(100, 100, 50, 80, 90)),
+    'rotated_180': (make_box(100, 100, 50, 80, 20), make_box(100, 100, 50, 80, 200)),
+    'rotated_270_offset': (make_box(100, 100, 50, 80), make_box(110, 90, 50, 80, -90)),
+    'negative_width': (make_box(100, 100, -50, 80), make_box(80, 120, 50, 80)),
+    'negative_height': (make_box(100, 100, 50, -80, 15), make_box(80, 60, 50, 80)),
+    'negative_both': (make_box(100, 100, -50, -80), make_box(60, 40, 50, 80, 10)),
+    'disjoint': (make_box(100, 100, 50, 80), make_box(300, 300, 50, 80)),
+    'disjoint_envelopes_overlap': (make_box(100, 100, 100, 10, 45), make_box(160, 100, 100, 10, 45)),
+}
+
+
+def make_random_boxes(nboxes, seed):
+    '''
+        Random rotated boxes (with negative sizes), bunched together so that some of them overlap
+    '''
+    rng = np.random.default_rng(seed)
+    return get_box_edges_batch(rng.uniform(0, 400, nboxes), rng.uniform(0, 400, nboxes),
+                               rng.uniform(-200, 200, nboxes), rng.uniform(-200, 200, nboxes),
+                               rng.uniform(-np.pi, np.pi, nboxes))
+
+
+@pytest.mark.parametrize('backend', GEOMETRY_BACKENDS)
+@pytest.mark.parametrize('name', DEGENERATE_PAIRS.keys())
+def test_box_iou_degenerate(name, backend):
+    corners1, corners2 = DEGENERATE_PAIRS[name]
+
+    iou = get_box_iou(corners1[np.newaxis], corners2[np.newaxis], backend=backend)
+
+    np.testing.assert_allclose(iou, [get_shapely_iou(corners1, corners2)], rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('backend', GEOMETRY_BACKENDS)
+def test_box_iou_matrix_degenerate(backend):
+    corners = np.asarray([corners for pair in DEGENERATE_PAIRS.values() for corners in pair])
+
+    iou = get_box_iou_matrix(corners, corners, backend=backend)
+
+    np.testing.assert_allclose(iou, get_shapely_iou_matrix(corners, corners), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('backend', GEOMETRY_BACKENDS)
+@pytest.mark.parametrize('seed', range(5))
+def test_box_iou_random(seed, backend):
+    corners1 = make_random_boxes(200, seed)
+    corners2 = make_random_boxes(200, seed + 100)
+
+    iou = get_box_iou(corners1, corners2, backend=backend)
+    expected = [get_shapely_iou(c1, c2) for c1, c2 in zip(corners1, corners2)]
+
+    np.testing.assert_allclose(iou, expected, rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('backend', GEOMETRY_BACKENDS)
+@pytest.mark.parametrize('seed', range(3))
+def test_box_iou_matrix_random(seed, backend):
+    corners1 = make_random_boxes(40, seed)
+    corners2 = make_random_boxes(30, seed + 100)
+
+    # use a small chunk size so that the pairs are split into several chunks
+    iou = get_box_iou_matrix(corners1, corners2, chunk_size=50, backend=backend)
+
+    np.testing.assert_allclose(iou, get_shapely_iou_matrix(corners1, corners2), rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize('backend', GEOMETRY_BACKENDS)
+def test_box_iou_matrix_empty(backend):
+    corners = make_random_boxes(5, 0)
+
+    assert get_box_iou_matrix(corners[:0], corners, backend=backend).shape == (0, 5)
+    assert get_box_iou_matrix(corners, corners[:0], backend=backend).shape == (5, 0)
@@ -0,0 +1,173 @@
+'''
+    Check that the jet clustering (`assign_jet_labels` and `assign_jet_labels_sparse`)
+    gives the same labels as the original loop in `SOL.filter_jet_clusters`
+'''
+import os
+import numpy as np
+import pytest
+
+from aggregation.SOL_class import (assign_jet_labels, assign_jet_labels_sparse, get_jet_metrics,
+                                   get_jet_metrics_sparse, get_point_scale)
+from aggregation.geometry import get_box_edges_batch
+
+# metrics of the jets in a recorded SOL event (from `SOL.get_event_metrics`)
+EVENT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jet_labels_event.npz')
+
+EPS_VALUES = [0.5, 1., 2., 4.]
+TIME_EPS_VALUES = [0.5, 1., 2., 4.]
+
+
+def legacy_assign_jet_labels(distance_metric, time_metric, subjects, eps, time_eps):
+    '''
+        The `while len(indices) > 0` loop used by `SOL.filter_jet_clusters` before
+        `assign_jet_labels` was added
+    '''
+    indices = np.arange(len(distance_metric))
+    labels = -1. * np.ones(len(distance_metric))
+    subjects = np.asarray(subjects)
+
+    while len(indices) > 0:
+        ind = indices[0]
+
+        # find all the jets that fall within a distance
+        # eps for this jet and those that are not
+        # already clustered into a jet
+        mask = (distance_metric[ind, :] < eps) & (labels == -1)
+
+        unique_subs = np.unique(subjects[mask])
+
+        # make sure that all the jets belong to different subjects
+        if len(unique_subs) != sum(mask):
+            for sub in unique_subs:
+                inds_sub = np.where((subjects == sub) & mask)[0]
+                dists = distance_metric[ind, inds_sub]
+
+                # keep the closest jet from this subject
+                mask[inds_sub] = False
+                mask[inds_sub[np.argmin(dists)]] = True
+
+        # next make sure that there is a reachability in time
+        if sum(mask) > 1:
+            rem_inds = np.where(mask)[0]
+            for j, indi in enumerate(rem_inds):
+                if j == 0:
+                    continue
+
+                # get the reachability in time up to the current jet
+                time_disti = time_metric[indi, mask]
+                t0 = np.argmin(time_disti)
+                time_disti = time_disti[:t0]
+
+                if len(time_disti) == 0:
+                    mask[indi] = False
+                    continue
+
+                if time_disti[time_disti > 0.].min() > time_eps:
+                    mask[indi] = False
+
+        labels[mask] = labels.max() + 1
+
+        rem_inds = [np.where(indices == maski)[0][0]
+                    for maski in np.where(mask)[0]]
+
+        indices = np.delete(indices, rem_inds)
+
+    return labels
+
+
+def get_sparse_distance(starts, corners, times, subjects, start_confidences, point_scale, time_window):
+    '''
+        Distance metric of the pairs within `time_window` (see `SOL.get_event_metrics`)
+    '''
+    point_metric, box_metric, _ = get_jet_metrics_sparse(starts, corners, times, subjects,
+                                                         start_confidences, time_window)
+
+    distance_metric = point_metric.copy()
+    distance_metric.data = point_metric.data / point_scale + 2. * box_metric.data
+    distance_metric.data[~np.isfinite(distance_metric.data)] = np.nan
+
+    return distance_metric
+
+
+def make_jets(seed):
+    '''
+        Random jets in a few subjects, sorted by time. Some subjects are
+        observed at the same time and most subjects have more than one jet
+    '''
+    rng = np.random.default_rng(seed)
+    njets = int(rng.integers(2, 80))
+    nsubjects = int(rng.integers(1, njets + 1))
+
+    subject_times = np.sort(np.datetime64('2012-01-01T00:00') +
+                            rng.integers(0, max(nsubjects // 2, 1), nsubjects) * np.timedelta64(312, 's'))
+    subjects = np.sort(rng.integers(0, nsubjects, njets))
+
+    starts = rng.uniform(0, 300, (njets, 2))
+    corners = get_box_edges_batch(*rng.uniform(100, 300, (2, njets)), *rng.uniform(20, 200, (2, njets)),
+                                  rng.uniform(-3, 3, njets))[:, :4]
+
+    return starts, corners, subject_times[subjects], subjects, rng.uniform(5, 30, njets)
+
+
+@pytest.fixture(scope='module')
+def event():
+    with np.load(EVENT_FILE) as data:
+        return {key: data[key] for key in data.files}
+
+
+@pytest.mark.parametrize('eps', EPS_VALUES)
+@pytest.mark.parametrize('time_eps', TIME_EPS_VALUES)
+def test_assign_jet_labels_recorded(event, eps, time_eps):
+    labels = assign_jet_labels(event['distance_metric'], event['time_metric'], event['subjects'], eps, time_eps)
+    legacy = legacy_assign_jet_labels(event['distance_metric'], event['time_metric'], event['subjects'],
+                                      eps, time_eps)
+
+    np.testing.assert_array_equal(labels, legacy)
+
+
+def test_point_scale_recorded(event):
+    point_scale = get_point_scale(event['starts'], event['subjects'], event['start_confidences'])
+
+    assert point_scale == event['point_scale']
+
+
+@pytest.mark.parametrize('eps', EPS_VALUES)
+@pytest.mark.parametrize('time_eps', TIME_EPS_VALUES)
+@pytest.mark.parametrize('time_window', [0.5, 2.])
+def test_assign_jet_labels_sparse_recorded(event, eps, time_eps, time_window):
+    distance_metric = get_sparse_distance(event['starts'], event['corners'], event['times'], event['subjects'],
+                                          event['start_confidences'], event['point_scale'], time_window)
+
+    labels = assign_jet_labels_sparse(distance_metric, event['times'], event['subjects'], eps, time_eps,
+                                      event['starts'], event['corners'], event['start_confidences'],
+                                      event['point_scale'])
+    legacy = legacy_assign_jet_labels(event['distance_metric'], event['time_metric'], event['subjects'],
+                                      eps, time_eps)
+
+    np.testing.assert_array_equal(labels, legacy)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_sparse_matches_dense_random(seed):
+    starts, corners, times, subjects, start_confidences = make_jets(seed)
+
+    point_metric, box_metric, time_metric = get_jet_metrics(starts, corners, times, subjects, start_confidences)
+    point_dists = point_metric[np.isfinite(point_metric) & (point_metric > 0)]
+    point_scale = np.percentile(point_dists, 90) if len(point_dists) > 0 else 1.
+
+    distance_metric = point_metric / point_scale + 2. * box_metric
+    distance_metric[~np.isfinite(distance_metric)] = np.nan
+
+    assert get_point_scale(starts, subjects, start_confidences) == point_scale
+
+    sparse_distance = get_sparse_distance(starts, corners, times, subjects, start_confidences, point_scale, 0.5)
+
+    for eps in [0.3, 1., 2.]:
+        for time_eps in [0.5, 1., 2.]:
+            labels = assign_jet_labels(distance_metric, time_metric, subjects, eps, time_eps)
+            labels_sparse = assign_jet_labels_sparse(sparse_distance, times, subjects, eps, time_eps, starts,
+                                                     corners, start_confidences, point_scale)
+
+            np.testing.assert_array_equal(labels, legacy_assign_jet_labels(distance_metric, time_metric,
+                                                                           subjects, eps, time_eps))
+            np.testing.assert_array_equal(labels_sparse, labels)